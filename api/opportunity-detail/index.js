@@ -20,6 +20,24 @@ module.exports = async function (context, req) {
     const stage = req.query.stage || req.body?.stage;
     const leadType = req.query.leadType || req.body?.leadType;
     const excludeStages = req.query.excludeStages || req.body?.excludeStages;
+    const changedSinceParam = req.query.changedSince || req.body?.changedSince;
+
+    // Validate before connecting: a bad date is a client error (400), not a query failure
+    const changedSince = changedSinceParam ? new Date(changedSinceParam) : null;
+    if (changedSince && Number.isNaN(changedSince.getTime())) {
+        context.res = {
+            status: 400,
+            headers: {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            body: {
+                success: false,
+                error: `Invalid changedSince date: ${changedSinceParam}`
+            }
+        };
+        return;
+    }
 
     try {
         await sql.connect(config);
@@ -95,6 +113,12 @@ module.exports = async function (context, req) {
             });
         }
 
+        // Incremental filter: only rows created or moved to another stage since the given date
+        if (changedSince) {
+            query += ` AND (LastStageChangeDate >= @changedSince OR Created_Date >= @changedSince)`;
+            params.push({ name: 'changedSince', type: sql.DateTime2, value: changedSince });
+        }
+
         query += ` ORDER BY Created_Date DESC`;
 
         const request = new sql.Request();
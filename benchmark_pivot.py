@@ -0,0 +1,370 @@
+"""Benchmarks del pipeline de reportes con test-response.json escalado
+
+Uso:
+    python benchmark_pivot.py [--stage year|dates|raw-export|memory|pipeline|all] [--rows 1000000 ...]
+                              [--source test-response.json] [--save FILE] [--compare FILE]
+
+- year: asignación de Year con df.apply vs. motor vectorizado
+- dates: pd.to_datetime(utc=True) vs. reporting.dates (datetime y epoch)
+  sobre fechas sintéticas, distintas por fila y repetidas (actualizaciones
+  masivas), como texto Arrow y como object
+- raw-export: hoja de datos crudos celda a celda vs. writer constant_memory
+  (cada variante corre en un proceso aparte para medir su pico de RSS)
+- memory: memory_usage(deep=True) del frame preparado antes/después del
+  esquema compacto (reporting.schema)
+- pipeline: cada etapa (preparación, cubo, rollups, índice de drill-through,
+  formato de resúmenes, writers de Excel) sobre detalle sintético
+  (reporting.synthetic) con tiempo y pico de memoria por etapa. Con --save
+  se guardan los resultados y con --compare se marcan regresiones
+
+Ejemplo (10k a 5M filas, writers de Excel hasta 1M):
+    python benchmark_pivot.py --stage pipeline --rows 10000 100000 1000000 5000000 --save bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from reporting.dates import parse_api_dates
+from reporting.years import resolve_year, DEFAULT_FALLBACK_YEAR
+
+
+def load_scaled_json(source, rows):
+    """Carga el detalle de ejemplo tal como llega del API y lo replica hasta `rows` filas"""
+    with open(source, encoding='utf-8') as f:
+        base = pd.DataFrame(json.load(f)['data'])
+
+    repeats = -(-rows // len(base))
+    return pd.concat([base] * repeats, ignore_index=True).iloc[:rows].copy()
+
+
+def load_scaled_detail(source, rows):
+    """Como load_scaled_json, con las fechas ya convertidas"""
+    df = load_scaled_json(source, rows)
+    df['Created_Date'] = parse_api_dates(df['Created_Date'])
+    df['LastStageChangeDate'] = parse_api_dates(df['LastStageChangeDate'])
+    return df
+
+
+def legacy_dates(values):
+    """Conversión original de fechas (referencia para comparar)"""
+    return pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def legacy_year(df, fallback):
+    """Implementación original con df.apply (referencia para comparar)"""
+    return df.apply(lambda row:
+        row['LastStageChangeDate'].year
+        if row['StageName'] in ['Approved', 'Lost'] and pd.notna(row['LastStageChangeDate'])
+        else row['Created_Date'].year
+        if pd.notna(row['Created_Date'])
+        else fallback, axis=1)
+
+
+def bench_dates(rows, seed=0):
+    from reporting.dates import to_epoch
+    from reporting.synthetic import generate_detail
+
+    unique = generate_detail(rows, seed=seed)['LastStageChangeDate']
+    # Actualizaciones masivas: pocas fechas distintas compartidas por muchas filas
+    distinct = unique.dropna().unique()[:1000]
+    repeated = pd.Series(distinct[np.arange(rows) % len(distinct)]).where(unique.notna())
+
+    for label, values in (('distintas', unique), ('repetidas', repeated)):
+        for kind, series in (('str', values), ('object', values.astype(object))):
+            legacy, legacy_time = timed(legacy_dates, series)
+            fast, fast_time = timed(parse_api_dates, series)
+            epoch, epoch_time = timed(to_epoch, series, 'ms')
+
+            pd.testing.assert_series_equal(fast, legacy, check_names=False)
+            expected = legacy.dropna().to_numpy().astype('datetime64[ms]').view('int64')
+            assert (epoch.dropna().to_numpy() == expected).all()
+
+            print(f"Fechas {label} ({kind}, {series.nunique():,} valores)")
+            print(f"  - pd.to_datetime:  {legacy_time:8.3f} s")
+            print(f"  - parse_api_dates: {fast_time:8.3f} s ({legacy_time / fast_time:.1f}x)")
+            print(f"  - to_epoch:        {epoch_time:8.3f} s ({legacy_time / epoch_time:.1f}x)")
+
+
+def bench_year(df):
+    for fallback in (DEFAULT_FALLBACK_YEAR, None):
+        legacy, legacy_time = timed(legacy_year, df, fallback)
+        vectorized, vector_time = timed(resolve_year, df, fallback=fallback)
+
+        pd.testing.assert_series_equal(vectorized, legacy, check_names=False)
+
+        print(f"Year (fallback={fallback})")
+        print(f"  - df.apply:      {legacy_time:8.3f} s")
+        print(f"  - resolve_year:  {vector_time:8.3f} s")
+        print(f"  - Speedup:       {legacy_time / vector_time:8.1f}x")
+
+
+def legacy_raw_export(filename, df):
+    """Escritura original: celda a celda con pd.notna/isinstance y todo en memoria"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(filename)
+    data_sheet = workbook.add_worksheet('Data')
+    for col_num, header in enumerate(df.columns.tolist()):
+        data_sheet.write(0, col_num, header)
+    for row_num, row_data in enumerate(df.values, 1):
+        for col_num, value in enumerate(row_data):
+            if pd.notna(value):
+                if isinstance(value, (pd.Timestamp, datetime)):
+                    data_sheet.write_datetime(row_num, col_num, value.replace(tzinfo=None))
+                else:
+                    data_sheet.write(row_num, col_num, value)
+    workbook.close()
+
+
+def constant_memory_raw_export(filename, df):
+    from reporting.raw_export import create_raw_workbook
+    create_raw_workbook(filename, df)
+
+
+RAW_EXPORTERS = {
+    'celda a celda': legacy_raw_export,
+    'constant_memory': constant_memory_raw_export,
+}
+
+
+def _raw_export_worker(name, source, rows, queue):
+    df = load_scaled_detail(source, rows)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'raw.xlsx')
+        _, elapsed = timed(RAW_EXPORTERS[name], filename, df)
+        size = os.path.getsize(filename)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, baseline_rss, peak_rss, size))
+
+
+def bench_raw_export(source, rows):
+    ctx = multiprocessing.get_context('spawn')
+    for name in RAW_EXPORTERS:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_raw_export_worker, args=(name, source, rows, queue))
+        process.start()
+        elapsed, baseline_rss, peak_rss, size = queue.get()
+        process.join()
+
+        print(f"Raw data ({name})")
+        print(f"  - Tiempo:        {elapsed:8.3f} s ({rows / elapsed:,.0f} filas/s)")
+        print(f"  - Pico RSS:      {peak_rss / 1024:8.1f} MB (+{(peak_rss - baseline_rss) / 1024:.1f} MB sobre el DataFrame)")
+        print(f"  - Archivo:       {size / 1024 / 1024:8.1f} MB")
+
+
+def legacy_prepare(df):
+    """prepare_data_for_pivot original: tipos del JSON y seis columnas auxiliares int64/float64"""
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').fillna(0)
+    df['Created_Date'] = legacy_dates(df['Created_Date'])
+    df['LastStageChangeDate'] = legacy_dates(df['LastStageChangeDate'])
+    df['Year'] = resolve_year(df, fallback=DEFAULT_FALLBACK_YEAR)
+    df['IsApproved'] = (df['StageName'] == 'Approved').astype(int)
+    df['IsLost'] = (df['StageName'] == 'Lost').astype(int)
+    df['IsOpen'] = (~df['StageName'].isin(['Approved', 'Lost'])).astype(int)
+    df['ApprovedAmount'] = df['Amount'] * df['IsApproved']
+    df['LostAmount'] = df['Amount'] * df['IsLost']
+    df['OpenAmount'] = df['Amount'] * df['IsOpen']
+    return df
+
+
+def bench_memory(source, rows):
+    from generate_real_pivot import prepare_data_for_pivot
+    from reporting.schema import memory_report
+
+    raw = load_scaled_json(source, rows)
+    # Columnas de texto como object: así las construye pandas < 3 desde dicts JSON
+    text_columns = raw.select_dtypes(include=['object', 'string']).columns
+    frames = {
+        'legacy_object': legacy_prepare(raw.astype({col: object for col in text_columns})),
+        'legacy': legacy_prepare(raw.copy()),
+        'compact': prepare_data_for_pivot(raw.copy()),
+    }
+    report = memory_report(frames)
+
+    print("Memoria del frame preparado (MB, memory_usage(deep=True))")
+    print(report.fillna('-').to_string())
+    total = report.loc['TOTAL']
+    for label in ('legacy_object', 'legacy'):
+        print(f"  - Reducción vs {label}: {total[label] / total['compact']:6.1f}x")
+
+
+class RssSampler:
+    """Pico de RSS del proceso durante un bloque, muestreando /proc/self/statm en un hilo
+
+    A diferencia de tracemalloc no frena el código medido e incluye la
+    memoria de Arrow/numpy. Fuera de Linux se usa ru_maxrss (solo crece).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.available = os.path.exists('/proc/self/statm')
+
+    def rss(self):
+        if self.available:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self.page_size
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def __enter__(self):
+        self.start = self.peak = self.rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+        self.extra = self.peak - self.start
+
+
+def _summary_sheet(pivot):
+    from openpyxl import Workbook
+    from reporting.formatting import format_summary_sheet, prepare_summary_for_excel
+
+    summary = prepare_summary_for_excel(pivot)
+    sheet = Workbook().active
+    sheet.append(summary.columns.tolist())
+    for row in summary.itertuples(index=False):
+        sheet.append(list(row))
+    format_summary_sheet(sheet, summary)
+
+
+def pipeline_stages(tmp, excel_rows_limit, openpyxl_rows_limit):
+    """[(etapa, función(ctx), límite de filas)] en orden; cada etapa deja su resultado en ctx"""
+    from generate_real_pivot import prepare_data_for_pivot, write_native_pivot_workbook, write_real_pivots_workbook
+    from reporting.drill import DrillIndex
+    from reporting.raw_export import create_raw_workbook
+    from reporting.rollup import build_base_cube, rollup
+    from reporting.schema import with_stage_buckets
+    from reporting.synthetic import generate_detail
+
+    return [
+        ('generate', lambda ctx: ctx.update(df=generate_detail(ctx['rows'], seed=ctx['seed'])), None),
+        ('prepare', lambda ctx: ctx.update(df=prepare_data_for_pivot(ctx['df'])), None),
+        ('cube', lambda ctx: ctx.update(cube=build_base_cube(ctx['df'])), None),
+        ('rollup', lambda ctx: ctx.update(pivots=[rollup(ctx['cube'], dim) for dim in ('Division', 'LeadType')]),
+         None),
+        ('drill_index', lambda ctx: DrillIndex(ctx['df']), None),
+        ('format_summary', lambda ctx: [_summary_sheet(pivot) for pivot in ctx['pivots']], None),
+        ('raw_export', lambda ctx: create_raw_workbook(os.path.join(tmp, 'raw.xlsx'), with_stage_buckets(ctx['df'])),
+         excel_rows_limit),
+        ('native_workbook', lambda ctx: write_native_pivot_workbook(ctx['df'], os.path.join(tmp, 'native.xlsx')),
+         excel_rows_limit),
+        ('real_workbook', lambda ctx: write_real_pivots_workbook(ctx['df'], os.path.join(tmp, 'real.xlsx'),
+                                                                 cube=ctx['cube']),
+         openpyxl_rows_limit),
+    ]
+
+
+def bench_pipeline(rows, seed=0, excel_rows_limit=1_000_000, openpyxl_rows_limit=200_000):
+    """Corre las etapas del pipeline y devuelve [{rows, stage, seconds, peak_mb}]"""
+    results = []
+    ctx = {'rows': rows, 'seed': seed}
+    with tempfile.TemporaryDirectory() as tmp:
+        for stage, func, limit in pipeline_stages(tmp, excel_rows_limit, openpyxl_rows_limit):
+            if limit is not None and rows > limit:
+                results.append({'rows': rows, 'stage': stage, 'seconds': None, 'peak_mb': None})
+                continue
+            with RssSampler() as rss:
+                _, elapsed = timed(func, ctx)
+            results.append({'rows': rows, 'stage': stage, 'seconds': elapsed, 'peak_mb': rss.extra / 1024 / 1024})
+
+    print(f"Pipeline ({rows:,} filas sintéticas)")
+    print(f"  {'Etapa':<18}{'Tiempo (s)':>12}{'Filas/s':>14}{'Pico (MB)':>12}")
+    for result in results:
+        if result['seconds'] is None:
+            print(f"  {result['stage']:<18}{'omitida (límite de filas)':>38}")
+            continue
+        print(f"  {result['stage']:<18}{result['seconds']:>12.3f}{rows / result['seconds']:>14,.0f}"
+              f"{result['peak_mb']:>12.1f}")
+    return results
+
+
+def compare_results(results, baseline, tolerance, min_seconds=0.05):
+    """Etapas más lentas que la línea base en más de `tolerance` (las muy cortas se ignoran)"""
+    previous = {(r['rows'], r['stage']): r for r in baseline if r['seconds'] is not None}
+    regressions = []
+    for result in results:
+        base = previous.get((result['rows'], result['stage']))
+        if result['seconds'] is None or base is None or base['seconds'] < min_seconds:
+            continue
+        ratio = result['seconds'] / base['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append((result, base, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stage', choices=['year', 'dates', 'raw-export', 'memory', 'pipeline', 'all'],
+                        default='all')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--source', default='test-response.json')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla del generador sintético (dates, pipeline)')
+    parser.add_argument('--excel-rows-limit', type=int, default=1_000_000,
+                        help='Máximo de filas para las etapas raw_export / native_workbook')
+    parser.add_argument('--openpyxl-rows-limit', type=int, default=200_000,
+                        help='Máximo de filas para real_workbook (openpyxl)')
+    parser.add_argument('--save', metavar='FILE', help='Guarda los resultados del pipeline en JSON')
+    parser.add_argument('--compare', metavar='FILE', help='Compara el pipeline con resultados guardados')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Aumento de tiempo tolerado por etapa antes de marcar regresión')
+    args = parser.parse_args()
+
+    pipeline_results = []
+    for rows in args.rows:
+        print(f"Benchmark con {rows:,} registros")
+        print("=" * 50)
+
+        if args.stage in ('year', 'all'):
+            bench_year(load_scaled_detail(args.source, rows))
+        if args.stage in ('dates', 'all'):
+            bench_dates(rows, args.seed)
+        if args.stage in ('raw-export', 'all'):
+            bench_raw_export(args.source, rows)
+        if args.stage in ('memory', 'all'):
+            bench_memory(args.source, rows)
+        if args.stage in ('pipeline', 'all'):
+            pipeline_results += bench_pipeline(rows, args.seed, args.excel_rows_limit, args.openpyxl_rows_limit)
+
+    if args.save and pipeline_results:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(pipeline_results, f, indent=2)
+        print(f"[OK] Resultados guardados en {args.save}")
+    if args.compare and pipeline_results:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_results(pipeline_results, json.load(f), args.tolerance)
+        for result, base, ratio in regressions:
+            print(f"[REGRESION] {result['stage']} ({result['rows']:,} filas): "
+                  f"{base['seconds']:.3f} s -> {result['seconds']:.3f} s ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"[OK] Sin regresiones respecto a {args.compare} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
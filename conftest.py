@@ -0,0 +1,90 @@
+"""Fixtures compartidas: servidor local que simula el API de Node con test-response.json"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+RESPONSE_FILE = Path(__file__).with_name('test-response.json')
+
+# Parámetro de /api/opportunity-detail -> columna que filtra
+FILTER_COLUMNS = {'year': 'YearValue', 'division': 'Division', 'stage': 'StageName', 'leadType': 'LeadType'}
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    """Simula los endpoints del API de Node"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        server = self.server
+        server.requests.append((url.path, query))
+
+        if server.failures.get(url.path, 0) > 0:
+            server.failures[url.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if url.path == '/api/opportunity-detail':
+            body = self._detail_body(query)
+        elif url.path in ('/api/division-summary', '/api/lead-summary'):
+            body = json.dumps({'success': True, 'count': 1,
+                               'data': [{'Year': 2023, 'TotalOpp': 3695}]}).encode()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _detail_body(self, query):
+        if self.server.detail is None and not set(query) & ({'changedSince'} | set(FILTER_COLUMNS)):
+            return RESPONSE_FILE.read_bytes()
+
+        rows = self.server.detail
+        if rows is None:
+            rows = json.loads(RESPONSE_FILE.read_bytes())['data']
+        # Mismos filtros que services/queries.js (year contra YearValue)
+        for param, column in FILTER_COLUMNS.items():
+            if param in query:
+                value = query[param][0]
+                rows = [row for row in rows if str(row.get(column)) == value]
+        if 'changedSince' in query:
+            # Mismo criterio que services/queries.js (fechas ISO comparables como texto)
+            since = query['changedSince'][0]
+            rows = [row for row in rows
+                    if (row['LastStageChangeDate'] or '') >= since or (row['Created_Date'] or '') >= since]
+        return json.dumps({'success': True, 'count': len(rows), 'data': rows}).encode()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    """Servidor HTTP local; `server.detail` permite reemplazar los registros servidos"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApiHandler)
+    server.requests = []
+    server.failures = {}
+    server.detail = None
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/api"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def prepared_cache_dir(tmp_path, monkeypatch):
+    """Caché del frame preparado de las pruebas que corren main() en su directorio temporal (no en .cache/)"""
+    path = str(tmp_path / 'prepared')
+    monkeypatch.setattr('generate_real_pivot.PREPARED_CACHE_DIR', path)
+    return path
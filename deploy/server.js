@@ -72,7 +72,8 @@ app.get('/api/opportunity-detail', async (req, res) => {
             division: req.query.division,
             stage: req.query.stage,
             leadType: req.query.leadType,
-            excludeStages: req.query.excludeStages
+            excludeStages: req.query.excludeStages,
+            changedSince: req.query.changedSince
         };
 
         const data = await getOpportunityDetail(filters);
@@ -84,7 +85,7 @@ app.get('/api/opportunity-detail', async (req, res) => {
         });
     } catch (error) {
         console.error('Error in /api/opportunity-detail:', error);
-        res.status(500).json({
+        res.status(error.statusCode || 500).json({
             success: false,
             error: error.message
         });
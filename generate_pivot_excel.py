@@ -1,220 +1,148 @@
-import pandas as pd
-import xlsxwriter
-import requests
+import argparse
 from datetime import datetime
 
+from reporting import instrumentation
+from reporting.instrumentation import recording, stage
+
+from reporting.client import create_session, fetch_detail
+from reporting.schema import apply_detail_schema, compact_year
+from reporting.years import resolve_year
+
+# xlsxwriter (y reporting.pivot_cache / reporting.raw_export, que lo usan) se
+# importa en las funciones que escriben el workbook: --help no lo carga
+
 def fetch_opportunity_data():
     """Obtiene todos los datos de oportunidades del API"""
     try:
-        response = requests.get('http://localhost:3001/api/opportunity-detail')
-        data = response.json()
-        if data['success']:
-            return pd.DataFrame(data['data'])
-        else:
-            raise Exception("Error fetching data from API")
+        # Parseo incremental: no se guarda el JSON completo en memoria
+        with create_session() as session:
+            return fetch_detail(session)
     except Exception as e:
         print(f"Error: {e}")
         return None
 
+def prepare_data(df):
+    """Limpia tipos y calcula Year según las reglas de negocio"""
+    with stage('prepare.schema', rows=len(df)):
+        apply_detail_schema(df)
+
+    # Calcular Year basado en la lógica de negocio
+    # Si StageName es Approved o Lost, usar LastStageChangeDate, sino usar Created_Date
+    # (sin fechas válidas el año queda vacío en lugar de usar 2024)
+    with stage('prepare.year', rows=len(df)):
+        df['Year'] = compact_year(resolve_year(df, fallback=None))
+    return df
+
 def create_pivot_excel(df):
     """Crea Excel con pivot tables nativas y drill-through habilitado"""
+    import xlsxwriter
 
-    # Preparar los datos
-    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
-    df['Created_Date'] = pd.to_datetime(df['Created_Date'], errors='coerce', utc=True).dt.tz_localize(None)
-    df['LastStageChangeDate'] = pd.to_datetime(df['LastStageChangeDate'], errors='coerce', utc=True).dt.tz_localize(None)
+    from reporting.pivot_cache import inject_pivot_parts, write_report_pivots
+    from reporting.raw_export import write_raw_data
 
-    # Calcular Year basado en la lógica de negocio
-    # Si StageName es Approved o Lost, usar LastStageChangeDate, sino usar Created_Date
-    df['Year'] = df.apply(lambda row:
-        row['LastStageChangeDate'].year
-        if row['StageName'] in ['Approved', 'Lost'] and pd.notna(row['LastStageChangeDate'])
-        else row['Created_Date'].year
-        if pd.notna(row['Created_Date'])
-        else None, axis=1)
+    # Preparar los datos
+    with stage('prepare', rows=len(df)):
+        df = prepare_data(df)
 
     # Crear archivo Excel
     filename = f"Opportunity_Pivot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
-        # Escribir datos crudos (para las pivot tables)
-        df.to_excel(writer, sheet_name='Data', index=False)
-        workbook = writer.book
-
-        # Formatear la hoja de datos
-        data_worksheet = writer.sheets['Data']
-        data_worksheet.set_column('A:Z', 15)  # Ancho de columnas
-
-        # Formato de moneda
-        currency_format = workbook.add_format({'num_format': '$#,##0'})
-
-        # Aplicar formato a columna Amount
-        amount_col = df.columns.get_loc('Amount')
-        data_worksheet.set_column(amount_col, amount_col, 15, currency_format)
-
-        # Crear Pivot Table 1: División Summary
-        division_pivot_sheet = workbook.add_worksheet('Division Pivot')
-
-        # Configurar pivot table de División
-        division_pivot_sheet.add_table(0, 0, 20, 10, {
-            'name': 'DivisionPivot',
-            'columns': [
-                {'header': 'Year'},
-                {'header': 'Division'},
-                {'header': 'Total Opportunities'},
-                {'header': 'Approved'},
-                {'header': 'Lost'},
-                {'header': 'Open'},
-                {'header': 'Total Revenue'},
-                {'header': 'Close Rate %'},
-                {'header': 'Average Ticket'},
-                {'header': 'Lost Revenue'},
-                {'header': 'Open Revenue'}
-            ]
-        })
-
-        # Agregar nota sobre drill-through
-        division_pivot_sheet.write('A23', 'NOTA: Para ver el detalle de cualquier valor, haz doble clic en la celda correspondiente en la pivot table de Excel')
-        division_pivot_sheet.write('A24', 'Esta funcionalidad requiere abrir el archivo en Microsoft Excel y crear las pivot tables manualmente')
-
-        # Crear Pivot Table 2: Lead Type Summary
-        lead_pivot_sheet = workbook.add_worksheet('Lead Pivot')
-
-        lead_pivot_sheet.add_table(0, 0, 20, 10, {
-            'name': 'LeadPivot',
-            'columns': [
-                {'header': 'Year'},
-                {'header': 'Lead Type'},
-                {'header': 'Total Opportunities'},
-                {'header': 'Approved'},
-                {'header': 'Lost'},
-                {'header': 'Open'},
-                {'header': 'Total Revenue'},
-                {'header': 'Close Rate %'},
-                {'header': 'Average Ticket'},
-                {'header': 'Lost Revenue'},
-                {'header': 'Open Revenue'}
-            ]
-        })
-
-        # Instrucciones para crear pivot tables
-        instructions_sheet = workbook.add_worksheet('Instructions')
-
-        instructions = [
-            'CÓMO CREAR LAS PIVOT TABLES CON DRILL-THROUGH:',
-            '',
-            '1. Abre este archivo en Microsoft Excel',
-            '2. Ve a la pestaña "Data" que contiene todos los datos',
-            '3. Selecciona todos los datos (Ctrl+A)',
-            '4. Ve a Insert > PivotTable',
-            '5. Configura los campos así:',
-            '',
-            'PARA DIVISION PIVOT:',
-            '   - Rows: Year, Division',
-            '   - Values: Count of Id, Sum of Amount (por stage)',
-            '   - Filters: StageName',
-            '',
-            'PARA LEAD PIVOT:',
-            '   - Rows: Year, LeadType',
-            '   - Values: Count of Id, Sum of Amount (por stage)',
-            '   - Filters: StageName',
-            '',
-            'DRILL-THROUGH:',
-            '   - Haz doble clic en cualquier valor de la pivot table',
-            '   - Excel mostrará automáticamente el detalle de esos registros',
-            '',
-            'VENTAJAS:',
-            '   - Actualizable con "Refresh All"',
-            '   - Drill-through nativo de Excel',
-            '   - Filtros dinámicos',
-            '   - Agrupación flexible'
-        ]
-
-        for i, instruction in enumerate(instructions):
-            instructions_sheet.write(i, 0, instruction)
-
-        # Ocultar la hoja de datos si se desea
-        # data_worksheet.hide()
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+
+    # Escribir datos crudos (origen del caché de las pivot tables). En constant_memory
+    # ancho y formato de moneda de Amount se fijan antes de volcar las filas
+    with stage('write', rows=len(df)):
+        data_worksheet = write_raw_data(workbook, df, sheet_name='Data', defined_name='OpportunityData',
+                                        column_width=15, column_formats={'Amount': '$#,##0'})[0]
+
+    # Pivot Tables nativas: Division y Lead Type, con StageName en columnas
+    with stage('pivots', rows=len(df)):
+        for sheet_name in ('Division Pivot', 'Lead Pivot'):
+            pivot_sheet = workbook.add_worksheet(sheet_name)
+            pivot_sheet.write('A1', 'NOTA: Haz doble clic en cualquier valor para ver el detalle de esos registros (drill-through)')
+        pivots = write_report_pivots(workbook, df, {'Division': 'Division Pivot', 'LeadType': 'Lead Pivot'})
+
+    # Ocultar la hoja de datos si se desea
+    # data_worksheet.hide()
+
+    with stage('save'):
+        workbook.close()
+    if pivots:
+        with stage('inject'):
+            inject_pivot_parts(filename, *pivots)
 
     print(f"[OK] Archivo creado: {filename}")
-    print("[INFO] Abre el archivo en Excel y sigue las instrucciones para crear las pivot tables")
+    print("[INFO] Excel actualiza el caché de las pivot tables al abrir el archivo")
     return filename
 
 def create_advanced_pivot_with_xlsxwriter():
     """Versión avanzada que crea pivot tables programáticamente"""
+    import xlsxwriter
+
+    from reporting.pivot_cache import inject_pivot_parts, write_report_pivots
+    from reporting.raw_export import write_raw_data
 
     df = fetch_opportunity_data()
     if df is None:
         return None
+    df = prepare_data(df)
 
     filename = f"Opportunity_Advanced_Pivot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
-    # Crear workbook
-    workbook = xlsxwriter.Workbook(filename)
-
-    # Agregar hoja de datos
-    data_sheet = workbook.add_worksheet('Data')
-
-    # Escribir headers
-    headers = df.columns.tolist()
-    for col_num, header in enumerate(headers):
-        data_sheet.write(0, col_num, header)
-
-    # Escribir datos
-    for row_num, row_data in enumerate(df.values, 1):
-        for col_num, value in enumerate(row_data):
-            if pd.notna(value):
-                data_sheet.write(row_num, col_num, value)
-
-    # Definir rango de datos
-    last_row = len(df)
-    last_col = len(df.columns) - 1
-
-    # Crear pivot table para División
-    division_sheet = workbook.add_worksheet('Division Analysis')
-
-    # Agregar pivot table
-    division_sheet.add_table(0, 0, 0, 0, {
-        'data': f"Data!$A$1:${chr(65+last_col)}${last_row+1}",
-        'pivot_table': {
-            'location': 'A3',
-            'source_data': f"Data!$A$1:${chr(65+last_col)}${last_row+1}",
-            'rows': ['Year', 'Division'],
-            'columns': ['StageName'],
-            'values': [
-                {'field': 'Amount', 'subtotal': 'sum', 'name': 'Total Amount'},
-                {'field': 'Id', 'subtotal': 'count', 'name': 'Count'}
-            ],
-            'filter': [],
-            'style': 'Table Style Medium 9'
-        }
-    })
+    # Crear workbook (constant_memory: las filas se vuelcan a disco al escribirse)
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+
+    # Agregar hoja de datos (Data_2, Data_3... si supera el límite de filas de Excel)
+    write_raw_data(workbook, df, sheet_name='Data', defined_name='OpportunityData')
+
+    # Pivot tables: Rows Year + Division / LeadType, Columns StageName,
+    # Values Count of Id y Sum of Amount
+    pivots = write_report_pivots(workbook, df, {'Division': 'Division Analysis', 'LeadType': 'Lead Analysis'})
 
     workbook.close()
+    if pivots:
+        inject_pivot_parts(filename, *pivots)
     print(f"[OK] Archivo avanzado creado: {filename}")
     return filename
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Genera un Excel con pivot tables nativas de oportunidades')
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
+
 # Función principal
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    recorder = instrumentation.recorder_from_args(args)
+    if recorder is None:
+        return run()
+    with recording(recorder):
+        filename = run()
+    instrumentation.report(recorder, args, script='generate_pivot_excel')
+    return filename
+
+def run():
     print("Generando Excel con Pivot Tables...")
     print("=" * 50)
 
-    # Obtener datos
-    df = fetch_opportunity_data()
+    # Obtener datos (el parseo es incremental: ocurre durante la descarga)
+    with stage('fetch') as record:
+        df = fetch_opportunity_data()
+        record['rows'] = 0 if df is None else len(df)
     if df is None:
         print("[ERROR] No se pudieron obtener los datos")
         return
 
     print(f"[OK] Datos obtenidos: {len(df)} registros")
 
-    # Crear Excel con estructura para pivot tables
+    # Crear Excel con pivot tables nativas
     filename = create_pivot_excel(df)
 
     print("\n" + "=" * 50)
     print("PROXIMOS PASOS:")
     print("1. Abre el archivo en Microsoft Excel")
-    print("2. Sigue las instrucciones en la hoja 'Instructions'")
-    print("3. Las pivot tables tendran drill-through automatico")
+    print("2. Revisa las hojas 'Division Pivot' y 'Lead Pivot'")
+    print("3. Doble clic en cualquier valor para ver el drill-through")
+    return filename
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,31 +1,50 @@
-import pandas as pd
-import numpy as np
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-import requests
 from datetime import datetime
 import json
-
-def fetch_all_data():
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from reporting.aggregate_state import refresh_state
+from reporting.batch import (BATCH_KEYS, partition_cube, partition_label, partition_positions,
+                             partition_values, shared_cube, write_manifest)
+from reporting.chunked import DEFAULT_CHUNK_ROWS, chunked_summaries, file_chunks
+from reporting.client import API_BASE_URL, create_session, detail_partitions, fetch_all, iter_detail_pages
+from reporting.columnar import FORMATS as COLUMNAR_FORMATS, read_columnar, write_columnar
+from reporting.drill import DRILL_COLUMNS, DrillIndex, add_drill_links
+from reporting import instrumentation
+from reporting.instrumentation import recording, stage
+from reporting.lazy import lazy_import
+from reporting.local_sql import ENGINES as SQL_ENGINES, read_detail_source, rollup_sql
+from reporting.prepared_cache import (DEFAULT_CACHE_DIR as PREPARED_CACHE_DIR, cache_path, load_prepared,
+                                      save_prepared, snapshot_key, source_key)
+from reporting.rollup import build_base_cube, rollup
+from reporting.schema import add_stage_flags, apply_detail_schema, compact_year, with_stage_buckets
+from reporting.snapshot import DEFAULT_SNAPSHOT_PATH, DEFAULT_TTL_HOURS, fetch_detail_cached, load_snapshot_meta
+from reporting.template import DEFAULT_TEMPLATE_PATH, ensure_template, write_from_template
+from reporting.trends import trend_tables, write_trend_sheet
+from reporting.years import resolve_year, DEFAULT_FALLBACK_YEAR
+
+# pandas se importa en el primer uso; openpyxl / xlsxwriter (reporting.formatting,
+# reporting.pivot_cache, reporting.raw_export) solo dentro de las funciones que
+# escriben workbooks: --help y --fetch-only no cargan las librerías de Excel
+pd = lazy_import('pandas')
+
+def fetch_all_data(base_url=API_BASE_URL, partitions=None, use_cache=False, force_refresh=False,
+                   ttl_hours=DEFAULT_TTL_HOURS, on_change=None):
     """Obtiene todos los datos necesarios del API"""
     try:
-        # Obtener datos detallados
-        detail_response = requests.get('http://localhost:3001/api/opportunity-detail')
-        detail_data = detail_response.json()
-
-        # Obtener resúmenes para validación
-        division_response = requests.get('http://localhost:3001/api/division-summary')
-        division_data = division_response.json()
-
-        lead_response = requests.get('http://localhost:3001/api/lead-summary')
-        lead_data = lead_response.json()
-
-        if detail_data['success']:
-            return {
-                'detail': pd.DataFrame(detail_data['data']),
-                'division_summary': pd.DataFrame(division_data['data']),
-                'lead_summary': pd.DataFrame(lead_data['data'])
-            }
+        # Con use_cache el detalle sale del snapshot local y solo se piden los cambios
+        detail_fetcher = None
+        if use_cache:
+            detail_fetcher = partial(fetch_detail_cached, force_refresh=force_refresh, ttl_hours=ttl_hours,
+                                     on_change=on_change)
+
+        # Detalle y resúmenes en paralelo sobre una sesión con pool de conexiones.
+        # `partitions` (ver detail_partitions) reparte el detalle por año/división
+        return fetch_all(base_url, partitions=partitions, detail_fetcher=detail_fetcher)
     except Exception as e:
         print(f"Error: {e}")
         return None
@@ -33,394 +52,758 @@ def fetch_all_data():
 def prepare_data_for_pivot(df):
     """Prepara los datos para las pivot tables con todos los cálculos necesarios"""
 
-    # Limpiar y preparar datos
-    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').fillna(0)
-    df['Created_Date'] = pd.to_datetime(df['Created_Date'], errors='coerce', utc=True).dt.tz_localize(None)
-    df['LastStageChangeDate'] = pd.to_datetime(df['LastStageChangeDate'], errors='coerce', utc=True).dt.tz_localize(None)
+    # Tipos compactos (categorías, fechas sin zona horaria) y limpieza de Amount
+    with stage('prepare.schema', rows=len(df)):
+        apply_detail_schema(df)
+        df['Amount'] = df['Amount'].fillna(0)
 
     # Calcular Year según reglas de negocio
-    df['Year'] = df.apply(lambda row:
-        row['LastStageChangeDate'].year
-        if row['StageName'] in ['Approved', 'Lost'] and pd.notna(row['LastStageChangeDate'])
-        else row['Created_Date'].year
-        if pd.notna(row['Created_Date'])
-        else 2024, axis=1)
-
-    # Crear columnas auxiliares para los cálculos
-    df['IsApproved'] = (df['StageName'] == 'Approved').astype(int)
-    df['IsLost'] = (df['StageName'] == 'Lost').astype(int)
-    df['IsOpen'] = (~df['StageName'].isin(['Approved', 'Lost'])).astype(int)
-
-    df['ApprovedAmount'] = df['Amount'] * df['IsApproved']
-    df['LostAmount'] = df['Amount'] * df['IsLost']
-    df['OpenAmount'] = df['Amount'] * df['IsOpen']
+    with stage('prepare.year', rows=len(df)):
+        df['Year'] = compact_year(resolve_year(df, fallback=DEFAULT_FALLBACK_YEAR))
+
+    # Banderas por stage (int8); ApprovedAmount/LostAmount/OpenAmount se
+    # calculan al exportar con with_stage_buckets
+    with stage('prepare.flags', rows=len(df)):
+        add_stage_flags(df)
 
     return df
 
-def create_division_pivot_with_calculations(df):
+def create_division_pivot_with_calculations(df, cube=None):
     """Crea pivot table por División con todos los cálculos"""
 
-    # Agrupar por Year y Division
-    pivot = df.groupby(['Year', 'Division']).agg({
-        'Id': 'count',  # Total Opportunities
-        'IsApproved': 'sum',  # Count Approved
-        'IsLost': 'sum',  # Count Lost
-        'IsOpen': 'sum',  # Count Open
-        'ApprovedAmount': 'sum',  # Sum Approved Amount
-        'LostAmount': 'sum',  # Sum Lost Amount
-        'OpenAmount': 'sum',  # Sum Open Amount
-        'Amount': 'sum'  # Total Amount
-    }).reset_index()
-
-    # Renombrar columnas
-    pivot.columns = ['Year', 'Division', 'Total_Opp', 'Approved', 'Lost', 'Open',
-                     'Approved_Revenue', 'Lost_Revenue', 'Open_Revenue', 'Total_Amount']
-
-    # Calcular métricas derivadas
-    pivot['CloseRate_Std'] = (pivot['Approved'] / pivot['Total_Opp'] * 100).round(2)
-    pivot['CloseRate_NoLost'] = (pivot['Approved'] / (pivot['Total_Opp'] - pivot['Lost']) * 100).round(2)
-    pivot['Average_Ticket'] = (pivot['Approved_Revenue'] / pivot['Approved']).fillna(0).round(2)
-
-    # Agregar totales por año
-    year_totals = df.groupby('Year').agg({
-        'Id': 'count',
-        'IsApproved': 'sum',
-        'IsLost': 'sum',
-        'IsOpen': 'sum',
-        'ApprovedAmount': 'sum',
-        'LostAmount': 'sum',
-        'OpenAmount': 'sum',
-        'Amount': 'sum'
-    }).reset_index()
-
-    year_totals['Division'] = 'TOTAL'
-    year_totals.columns = ['Year', 'Total_Opp', 'Approved', 'Lost', 'Open',
-                           'Approved_Revenue', 'Lost_Revenue', 'Open_Revenue',
-                           'Total_Amount', 'Division']
-
-    year_totals['CloseRate_Std'] = (year_totals['Approved'] / year_totals['Total_Opp'] * 100).round(2)
-    year_totals['CloseRate_NoLost'] = (year_totals['Approved'] / (year_totals['Total_Opp'] - year_totals['Lost']) * 100).round(2)
-    year_totals['Average_Ticket'] = (year_totals['Approved_Revenue'] / year_totals['Approved']).fillna(0).round(2)
-
-    # Reorganizar columnas
-    year_totals = year_totals[pivot.columns]
-
-    # Combinar con totales
-    final_pivot = pd.concat([pivot, year_totals], ignore_index=True).sort_values(['Year', 'Division'])
-
-    return final_pivot
-
-def create_lead_pivot_with_calculations(df):
+    # GROUP BY Year, ROLLUP(Division) sobre el cubo base (se construye si no se recibe)
+    if cube is None:
+        cube = build_base_cube(df)
+    return rollup(cube, 'Division')
+
+def create_lead_pivot_with_calculations(df, cube=None):
     """Crea pivot table por Lead Type con todos los cálculos"""
 
-    # Agrupar por Year y LeadType
-    pivot = df.groupby(['Year', 'LeadType']).agg({
-        'Id': 'count',
-        'IsApproved': 'sum',
-        'IsLost': 'sum',
-        'IsOpen': 'sum',
-        'ApprovedAmount': 'sum',
-        'LostAmount': 'sum',
-        'OpenAmount': 'sum',
-        'Amount': 'sum'
-    }).reset_index()
-
-    # Renombrar columnas
-    pivot.columns = ['Year', 'LeadType', 'Total_Opp', 'Approved', 'Lost', 'Open',
-                     'Approved_Revenue', 'Lost_Revenue', 'Open_Revenue', 'Total_Amount']
-
-    # Calcular métricas derivadas
-    pivot['CloseRate_Std'] = (pivot['Approved'] / pivot['Total_Opp'] * 100).round(2)
-    pivot['CloseRate_NoLost'] = (pivot['Approved'] / (pivot['Total_Opp'] - pivot['Lost']) * 100).round(2)
-    pivot['Average_Ticket'] = (pivot['Approved_Revenue'] / pivot['Approved']).fillna(0).round(2)
-
-    # Agregar totales por año
-    year_totals = df.groupby('Year').agg({
-        'Id': 'count',
-        'IsApproved': 'sum',
-        'IsLost': 'sum',
-        'IsOpen': 'sum',
-        'ApprovedAmount': 'sum',
-        'LostAmount': 'sum',
-        'OpenAmount': 'sum',
-        'Amount': 'sum'
-    }).reset_index()
-
-    year_totals['LeadType'] = 'TOTAL'
-    year_totals.columns = ['Year', 'Total_Opp', 'Approved', 'Lost', 'Open',
-                           'Approved_Revenue', 'Lost_Revenue', 'Open_Revenue',
-                           'Total_Amount', 'LeadType']
-
-    year_totals['CloseRate_Std'] = (year_totals['Approved'] / year_totals['Total_Opp'] * 100).round(2)
-    year_totals['CloseRate_NoLost'] = (year_totals['Approved'] / (year_totals['Total_Opp'] - year_totals['Lost']) * 100).round(2)
-    year_totals['Average_Ticket'] = (year_totals['Approved_Revenue'] / year_totals['Approved']).fillna(0).round(2)
-
-    # Reorganizar columnas
-    year_totals = year_totals[pivot.columns]
-
-    # Combinar con totales
-    final_pivot = pd.concat([pivot, year_totals], ignore_index=True).sort_values(['Year', 'LeadType'])
-
-    return final_pivot
-
-def create_excel_with_real_pivots(data_dict):
-    """Crea Excel con pivot tables reales usando openpyxl"""
+    # GROUP BY Year, ROLLUP(LeadType) sobre el cubo base (se construye si no se recibe)
+    if cube is None:
+        cube = build_base_cube(df)
+    return rollup(cube, 'LeadType')
 
-    filename = f"Opportunity_Real_Pivots_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+def create_excel_with_real_pivots(data_dict, filename=None):
+    """Crea Excel con pivot tables reales usando openpyxl"""
 
     # Preparar datos
     df = data_dict['detail']
     df_prepared = prepare_data_for_pivot(df)
+    return write_real_pivots_workbook(df_prepared, filename)
+
+def write_real_pivots_workbook(df_prepared, filename=None, engine='pandas', cube=None, summaries=None,
+                               template=None, sheet_jobs=None, compresslevel=None):
+    """Escribe el workbook de resúmenes calculados a partir del frame ya preparado
+
+    `engine` elige dónde se calculan los resúmenes: 'pandas' (cubo base) o
+    un motor SQL local ('sqlite', 'duckdb'; ver reporting.local_sql).
+    `cube` permite pasar el cubo ya calculado (ej. el estado incremental de
+    reporting.aggregate_state) y `summaries` ({'Division': ..., 'LeadType': ...})
+    los resúmenes ya calculados (ej. leídos de reporting.columnar).
+    Con `template` (ruta .xlsx) solo se escriben Raw_Data y los resúmenes
+    dentro de la plantilla (ver reporting.template); si no existe, o es la
+    por defecto de otra versión o con otras columnas, se crea de nuevo.
+    `sheet_jobs` (procesos que serializan las hojas) y `compresslevel`
+    (deflate del zip, 0 = sin comprimir) solo se aplican con `template`.
+    """
+    from reporting.formatting import format_summary_sheet, prepare_summary_for_excel
+
+    filename = filename or f"Opportunity_Real_Pivots_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+    # Crear pivot tables con cálculos (una sola pasada sobre el detalle)
+    with stage('aggregate', rows=len(df_prepared)):
+        if summaries is not None:
+            division_pivot, lead_pivot = summaries['Division'], summaries['LeadType']
+        elif engine == 'pandas':
+            if cube is None:
+                cube = build_base_cube(df_prepared)
+            division_pivot = create_division_pivot_with_calculations(df_prepared, cube)
+            lead_pivot = create_lead_pivot_with_calculations(df_prepared, cube)
+        else:
+            summaries = rollup_sql(df_prepared, ['Division', 'LeadType'], engine=engine)
+            division_pivot, lead_pivot = summaries['Division'], summaries['LeadType']
+
+    # Índice de drill-through: Raw_Data se escribe ordenada por (Year, Division, stage)
+    # y Lead Type usa su propia hoja ordenada, así cada celda apunta a un bloque contiguo
+    with stage('drill_index', rows=len(df_prepared)):
+        drill = DrillIndex(df_prepared, ['Division', 'LeadType'])
+        raw_data = with_stage_buckets(df_prepared).iloc[drill.order('Division')]
+        if template is None:
+            lead_drill = df_prepared[DRILL_COLUMNS].iloc[drill.order('LeadType')]
+
+    if template is not None:
+        # Estilos, anchos y Key_Metrics vienen de la plantilla: solo se serializan los datos
+        frames = {'Raw_Data': raw_data, 'Division_Summary': prepare_summary_for_excel(division_pivot),
+                  'Lead_Summary': prepare_summary_for_excel(lead_pivot)}
+        with stage('template'):
+            status = ensure_template(template, frames)
+        if status:
+            print(f"[OK] Plantilla {'creada' if status == 'created' else 'reconstruida (otra versión o columnas)'}: "
+                  f"{template}")
+        with stage('write', rows=len(raw_data)):
+            write_from_template(template, filename, frames, compresslevel=compresslevel, jobs=sheet_jobs,
+                                mp_context=_pool_context())
+        print(f"[OK] Excel desde plantilla creado: {filename}")
+        return filename
+
+    # Crear Excel (el cierre del writer es el que serializa y comprime: etapa 'save')
+    writer = pd.ExcelWriter(filename, engine='openpyxl')
+    try:
+        with stage('write', rows=len(raw_data) + len(lead_drill)):
+            # 1. Hoja de datos crudos (para drill-through)
+            raw_data.to_excel(writer, sheet_name='Raw_Data', index=False)
+            lead_drill.to_excel(writer, sheet_name='Drill_LeadType', index=False)
+
+            # Close rates como fracción para el formato % de Excel
+            division_excel = prepare_summary_for_excel(division_pivot)
+            lead_excel = prepare_summary_for_excel(lead_pivot)
+
+            # 2. Division Summary Pivot
+            division_excel.to_excel(writer, sheet_name='Division_Summary', index=False)
+
+            # 3. Lead Summary Pivot
+            lead_excel.to_excel(writer, sheet_name='Lead_Summary', index=False)
+
+        with stage('style', rows=len(division_excel) + len(lead_excel)):
+            # Obtener workbook para formato
+            workbook = writer.book
+
+            # Formatear Division Summary
+            div_sheet = workbook['Division_Summary']
+            format_summary_sheet(div_sheet, division_excel)
+
+            # Formatear Lead Summary
+            lead_sheet = workbook['Lead_Summary']
+            format_summary_sheet(lead_sheet, lead_excel)
+
+            # Hipervínculos de cada métrica a su bloque de detalle
+            add_drill_links(div_sheet, division_excel, drill, 'Division', 'Raw_Data', len(raw_data.columns))
+            add_drill_links(lead_sheet, lead_excel, drill, 'LeadType', 'Drill_LeadType', len(lead_drill.columns))
+
+        # Series mensual / trimestral / anual con YoY, deltas y gráficos
+        with stage('trends', rows=len(df_prepared)):
+            trends = trend_tables(df_prepared)
+            for freq, series in trends.items():
+                write_trend_sheet(workbook, series, freq)
+
+            # Agregar hoja de métricas clave
+            metrics_sheet = workbook.create_sheet('Key_Metrics')
+            add_key_metrics(metrics_sheet, trends['Y'])
+    finally:
+        with stage('save'):
+            writer.close()
 
-    # Crear pivot tables con cálculos
-    division_pivot = create_division_pivot_with_calculations(df_prepared)
-    lead_pivot = create_lead_pivot_with_calculations(df_prepared)
-
-    # Crear Excel
-    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-
-        # 1. Hoja de datos crudos (para drill-through)
-        df_prepared.to_excel(writer, sheet_name='Raw_Data', index=False)
-
-        # 2. Division Summary Pivot
-        division_pivot.to_excel(writer, sheet_name='Division_Summary', index=False)
-
-        # 3. Lead Summary Pivot
-        lead_pivot.to_excel(writer, sheet_name='Lead_Summary', index=False)
-
-        # Obtener workbook para formato
-        workbook = writer.book
-
-        # Formatear Division Summary
-        div_sheet = workbook['Division_Summary']
-        format_summary_sheet(div_sheet)
+    print(f"[OK] Excel con pivot tables creado: {filename}")
+    return filename
 
-        # Formatear Lead Summary
-        lead_sheet = workbook['Lead_Summary']
-        format_summary_sheet(lead_sheet)
+def write_summary_workbook(summaries, filename=None):
+    """Workbook solo con Division_Summary y Lead_Summary (sin detalle ni drill-through)
 
-        # Agregar hoja de métricas clave
-        metrics_sheet = workbook.create_sheet('Key_Metrics')
-        add_key_metrics(metrics_sheet, division_pivot, lead_pivot)
+    `summaries` es {'Division': ..., 'LeadType': ...}, por ejemplo el
+    resultado de la agregación por bloques (reporting.chunked).
+    """
+    from reporting.formatting import format_summary_sheet, prepare_summary_for_excel
 
-    print(f"[OK] Excel con pivot tables creado: {filename}")
+    filename = filename or f"Opportunity_Summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        for dim, sheet_name in (('Division', 'Division_Summary'), ('LeadType', 'Lead_Summary')):
+            excel = prepare_summary_for_excel(summaries[dim])
+            excel.to_excel(writer, sheet_name=sheet_name, index=False)
+            format_summary_sheet(writer.book[sheet_name], excel)
+    print(f"[OK] Excel de resúmenes creado: {filename}")
     return filename
 
-def format_summary_sheet(sheet):
-    """Aplica formato profesional a las hojas de summary"""
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.formatting.rule import CellIsRule
-
-    # Formato de encabezado
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    # Aplicar formato a encabezados
-    for cell in sheet[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-
-    # Formato de moneda para columnas de revenue
-    for row in sheet.iter_rows(min_row=2):
-        # Columnas de moneda (índices aproximados)
-        for col_idx in [6, 7, 8, 9, 12]:  # Ajustar según posición real
-            if col_idx < len(row):
-                cell = row[col_idx]
-                if cell.value and isinstance(cell.value, (int, float)):
-                    cell.number_format = '$#,##0'
-
-    # Formato de porcentaje para close rates
-    for row in sheet.iter_rows(min_row=2):
-        for col_idx in [10, 11]:  # Columnas de CloseRate
-            if col_idx < len(row):
-                cell = row[col_idx]
-                if cell.value and isinstance(cell.value, (int, float)):
-                    cell.number_format = '0.00%'
-                    cell.value = cell.value / 100  # Convertir a decimal para formato %
-
-    # Resaltar filas de TOTAL
-    total_fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-    total_font = Font(bold=True)
-
-    for row in sheet.iter_rows(min_row=2):
-        if row[1].value == 'TOTAL' or (len(row) > 2 and row[2].value == 'TOTAL'):
-            for cell in row:
-                cell.fill = total_fill
-                cell.font = total_font
-
-    # Ajustar ancho de columnas
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 30)
-        sheet.column_dimensions[column_letter].width = adjusted_width
-
-def add_key_metrics(sheet, division_pivot, lead_pivot):
-    """Agrega una hoja con métricas clave y KPIs"""
-    from openpyxl.styles import Font, PatternFill, Alignment
+def add_key_metrics(sheet, yearly):
+    """Agrega una hoja con métricas clave y KPIs del último año (celdas numéricas y gráficos)
+
+    `yearly` es la serie anual de reporting.trends (TOTAL, Division y LeadType por año, con YoY).
+    """
+    from openpyxl.styles import Font
     from openpyxl.chart import BarChart, PieChart, Reference
 
     # Título
     sheet['A1'] = 'KEY PERFORMANCE INDICATORS'
     sheet['A1'].font = Font(size=16, bold=True)
 
+    totals = yearly[yearly['Dimension'] == 'TOTAL']
+    if totals.empty:
+        return
     # Métricas del año actual (último año en los datos)
-    current_year = division_pivot['Year'].max()
-    current_data = division_pivot[division_pivot['Year'] == current_year]
-    total_row = current_data[current_data['Division'] == 'TOTAL'].iloc[0] if len(current_data[current_data['Division'] == 'TOTAL']) > 0 else None
-
-    if total_row is not None:
-        # KPIs principales
-        sheet['A3'] = f'Year {int(current_year)} Performance'
-        sheet['A3'].font = Font(size=14, bold=True)
-
-        kpis = [
-            ('Total Opportunities', total_row['Total_Opp']),
-            ('Approved Deals', total_row['Approved']),
-            ('Close Rate Standard', f"{total_row['CloseRate_Std']:.2f}%"),
-            ('Average Ticket', f"${total_row['Average_Ticket']:,.2f}"),
-            ('Total Revenue', f"${total_row['Approved_Revenue']:,.2f}"),
-            ('Lost Revenue', f"${total_row['Lost_Revenue']:,.2f}"),
-            ('Open Pipeline', f"${total_row['Open_Revenue']:,.2f}")
+    current = totals.iloc[-1]
+
+    # KPIs principales
+    sheet['A3'] = f"Year {int(current['Year'])} Performance"
+    sheet['A3'].font = Font(size=14, bold=True)
+    kpis = [
+        ('Total Opportunities', current['Total_Opp'], '#,##0'),
+        ('Approved Deals', current['Approved'], '#,##0'),
+        ('Close Rate Standard', current['CloseRate_Std'] / 100, '0.00%'),
+        ('Average Ticket', current['Average_Ticket'], '$#,##0.00'),
+        ('Total Revenue', current['Approved_Revenue'], '$#,##0.00'),
+        ('Lost Revenue', current['Lost_Revenue'], '$#,##0.00'),
+        ('Open Pipeline', current['Open_Revenue'], '$#,##0.00'),
+    ]
+    for row_num, (label, value, number_format) in enumerate(kpis, 5):
+        sheet[f'A{row_num}'] = label
+        sheet[f'A{row_num}'].font = Font(bold=True)
+        sheet[f'B{row_num}'] = value.item() if hasattr(value, 'item') else value
+        sheet[f'B{row_num}'].number_format = number_format
+
+    # Comparación YoY (ya calculada por el motor de tendencias; vacía sin año anterior)
+    if len(totals) > 1:
+        sheet['D3'] = 'Year-over-Year Comparison'
+        sheet['D3'].font = Font(size=14, bold=True)
+        changes = [
+            ('Opportunity Growth', 'Total_Opp_YoY', 100, '+0.00%;-0.00%;0.00%'),
+            ('Approved Growth', 'Approved_YoY', 100, '+0.00%;-0.00%;0.00%'),
+            ('Revenue Growth', 'Approved_Revenue_YoY', 100, '+0.00%;-0.00%;0.00%'),
+            ('Close Rate Change (pp)', 'CloseRate_Std_YoY', 1, '+0.00;-0.00;0.00'),
         ]
-
-        row_num = 5
-        for label, value in kpis:
-            sheet[f'A{row_num}'] = label
-            sheet[f'B{row_num}'] = str(value)
-            sheet[f'A{row_num}'].font = Font(bold=True)
-            row_num += 1
-
-        # Comparación YoY si hay datos anteriores
-        if len(division_pivot['Year'].unique()) > 1:
-            sheet['D3'] = 'Year-over-Year Comparison'
-            sheet['D3'].font = Font(size=14, bold=True)
-
-            prev_year = current_year - 1
-            prev_data = division_pivot[division_pivot['Year'] == prev_year]
-            if len(prev_data[prev_data['Division'] == 'TOTAL']) > 0:
-                prev_total = prev_data[prev_data['Division'] == 'TOTAL'].iloc[0]
-
-                # Calcular cambios
-                opp_change = ((total_row['Total_Opp'] - prev_total['Total_Opp']) / prev_total['Total_Opp'] * 100)
-                rev_change = ((total_row['Approved_Revenue'] - prev_total['Approved_Revenue']) / prev_total['Approved_Revenue'] * 100)
-
-                sheet['D5'] = 'Opportunity Growth'
-                sheet['E5'] = f"{opp_change:+.2f}%"
-                sheet['D6'] = 'Revenue Growth'
-                sheet['E6'] = f"{rev_change:+.2f}%"
+        for row_num, (label, column, scale, number_format) in enumerate(changes, 5):
+            sheet[f'D{row_num}'] = label
+            if pd.notna(current[column]):
+                sheet[f'E{row_num}'] = float(current[column]) / scale
+                sheet[f'E{row_num}'].number_format = number_format
+
+    # Tablas de apoyo de los gráficos: stages del año actual y revenue por año y división
+    sheet['A14'], sheet['B14'] = 'Stage', 'Opportunities'
+    for row_num, name in enumerate(('Approved', 'Lost', 'Open'), 15):
+        sheet[f'A{row_num}'], sheet[f'B{row_num}'] = name, int(current[name])
+
+    divisions = yearly[yearly['Dimension'] == 'Division']
+    revenue = divisions.pivot_table(index='Year', columns='Value', values='Approved_Revenue',
+                                    aggfunc='sum', fill_value=0, observed=True)
+    sheet['A20'] = 'Year'
+    for col_num, division in enumerate(revenue.columns, 2):
+        sheet.cell(row=20, column=col_num, value=division)
+    for row_num, (year, values) in enumerate(zip(revenue.index, revenue.to_numpy()), 21):
+        sheet.cell(row=row_num, column=1, value=str(int(year)))
+        for col_num, value in enumerate(values, 2):
+            sheet.cell(row=row_num, column=col_num, value=float(value)).number_format = '$#,##0'
+
+    pie = PieChart()
+    pie.title = f"Stages {int(current['Year'])}"
+    pie.add_data(Reference(sheet, min_col=2, min_row=14, max_row=17), titles_from_data=True)
+    pie.set_categories(Reference(sheet, min_col=1, min_row=15, max_row=17))
+    sheet.add_chart(pie, 'G3')
+
+    if len(revenue.columns):
+        bar = BarChart()
+        bar.title = 'Approved Revenue por división'
+        bar.add_data(Reference(sheet, min_col=2, max_col=len(revenue.columns) + 1, min_row=20,
+                               max_row=len(revenue) + 20), titles_from_data=True)
+        bar.set_categories(Reference(sheet, min_col=1, min_row=21, max_row=len(revenue) + 20))
+        bar.width = 18
+        sheet.add_chart(bar, 'G20')
 
     # Ajustar anchos
     sheet.column_dimensions['A'].width = 20
     sheet.column_dimensions['B'].width = 15
-    sheet.column_dimensions['D'].width = 20
+    sheet.column_dimensions['D'].width = 24
     sheet.column_dimensions['E'].width = 15
 
-def create_excel_with_native_pivot():
+def create_excel_with_native_pivot(data_dict=None, filename=None):
     """Versión alternativa usando xlsxwriter para crear pivot tables nativas de Excel"""
-    import xlsxwriter
 
-    # Obtener datos
-    data_dict = fetch_all_data()
+    # Obtener datos (solo si no se recibieron ya descargados)
+    if data_dict is None:
+        data_dict = fetch_all_data(use_cache=True)
     if not data_dict:
         return None
 
     df = data_dict['detail']
     df_prepared = prepare_data_for_pivot(df)
+    return write_native_pivot_workbook(df_prepared, filename)
+
+def write_native_pivot_workbook(df_prepared, filename=None):
+    """Escribe el workbook con pivot tables nativas a partir del frame ya preparado"""
+    import xlsxwriter
+
+    from reporting.pivot_cache import inject_pivot_parts, write_report_pivots
+    from reporting.raw_export import write_raw_data
+
+    filename = filename or f"Opportunity_Native_Pivot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+    # Crear workbook con xlsxwriter (constant_memory: las filas se vuelcan a disco al escribirse)
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+
+    # Hoja de datos (se reparte en Data_2, Data_3... si supera el límite de Excel).
+    # En constant_memory no hay tablas: el rango queda como nombre definido OpportunityData
+    raw_data = with_stage_buckets(df_prepared)
+    with stage('write', rows=len(raw_data)):
+        write_raw_data(workbook, raw_data, sheet_name='Data', defined_name='OpportunityData')
+
+    # Pivot tables nativas (caché con registros; Excel lo actualiza al abrir)
+    with stage('pivots', rows=len(raw_data)):
+        for sheet_name in ('PivotTable_Division', 'PivotTable_Lead'):
+            pivot_sheet = workbook.add_worksheet(sheet_name)
+            pivot_sheet.write('A1', 'Doble clic en cualquier valor para ver el detalle (drill-through)')
+        pivots = write_report_pivots(workbook, raw_data,
+                                     {'Division': 'PivotTable_Division', 'LeadType': 'PivotTable_Lead'})
+
+    with stage('save'):
+        workbook.close()
+    if pivots:
+        with stage('inject'):
+            inject_pivot_parts(filename, *pivots)
 
-    filename = f"Opportunity_Native_Pivot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    # Crear workbook con xlsxwriter
-    workbook = xlsxwriter.Workbook(filename)
-
-    # Hoja de datos
-    data_sheet = workbook.add_worksheet('Data')
-
-    # Escribir headers
-    headers = df_prepared.columns.tolist()
-    for col_num, header in enumerate(headers):
-        data_sheet.write(0, col_num, header)
-
-    # Escribir datos
-    for row_num, row_data in enumerate(df_prepared.values, 1):
-        for col_num, value in enumerate(row_data):
-            if pd.notna(value):
-                if isinstance(value, (pd.Timestamp, datetime)):
-                    data_sheet.write_datetime(row_num, col_num, value.replace(tzinfo=None) if hasattr(value, 'tzinfo') else value)
-                else:
-                    data_sheet.write(row_num, col_num, value)
-
-    # Crear tabla de Excel
-    last_row = len(df_prepared)
-    last_col = len(df_prepared.columns) - 1
-
-    data_sheet.add_table(0, 0, last_row, last_col, {
-        'name': 'OpportunityData',
-        'columns': [{'header': col} for col in headers]
-    })
-
-    # Crear hoja de pivot para División
-    pivot_sheet = workbook.add_worksheet('PivotTable_Division')
-
-    # Nota sobre la creación manual de pivot
-    pivot_sheet.write('A1', 'INSTRUCCIONES PARA CREAR PIVOT TABLE:')
-    pivot_sheet.write('A3', '1. Selecciona la tabla en la hoja "Data"')
-    pivot_sheet.write('A4', '2. Insert > PivotTable')
-    pivot_sheet.write('A5', '3. Configurar campos:')
-    pivot_sheet.write('B6', '   Rows: Year, Division')
-    pivot_sheet.write('B7', '   Values:')
-    pivot_sheet.write('B8', '      - Count of Id (rename to "Total Opportunities")')
-    pivot_sheet.write('B9', '      - Sum of IsApproved (rename to "Approved")')
-    pivot_sheet.write('B10', '     - Sum of ApprovedAmount (rename to "Revenue")')
-    pivot_sheet.write('A12', '4. Para drill-through: doble clic en cualquier valor')
-
-    # Formatos
-    currency_format = workbook.add_format({'num_format': '$#,##0'})
-    percent_format = workbook.add_format({'num_format': '0.00%'})
-
-    workbook.close()
-
-    print(f"[OK] Excel con estructura para pivot nativo creado: {filename}")
+    print(f"[OK] Excel con pivot tables nativas creado: {filename}")
     return filename
 
-def main():
-    print("Generando Excel con Pivot Tables Reales...")
-    print("=" * 50)
+def write_detail_csv(df_prepared, filename):
+    """Exporta el detalle preparado (con montos por stage) a CSV"""
+    with stage('write', rows=len(df_prepared)):
+        with_stage_buckets(df_prepared).to_csv(filename, index=False)
+    print(f"[OK] CSV creado: {filename}")
+    return filename
 
-    # Obtener todos los datos
-    data_dict = fetch_all_data()
-    if not data_dict:
-        print("[ERROR] No se pudieron obtener los datos")
-        return
+def write_detail_parquet(df_prepared, filename):
+    """Exporta el detalle preparado (con montos por stage) a Parquet"""
+    with stage('write', rows=len(df_prepared)):
+        with_stage_buckets(df_prepared).to_parquet(filename, index=False)
+    print(f"[OK] Parquet creado: {filename}")
+    return filename
 
-    print(f"[OK] Datos obtenidos:")
-    print(f"  - Detail: {len(data_dict['detail'])} registros")
-    print(f"  - Division Summary: {len(data_dict['division_summary'])} registros")
-    print(f"  - Lead Summary: {len(data_dict['lead_summary'])} registros")
+def write_columnar_outputs(df_prepared, directory, cube=None, summaries=None, formats=None):
+    """Detalle preparado y resúmenes en Parquet / Arrow IPC dentro de `directory` (ver reporting.columnar)"""
+    if summaries is None:
+        with stage('aggregate', rows=len(df_prepared)):
+            if cube is None:
+                cube = build_base_cube(df_prepared)
+            summaries = {'Division': create_division_pivot_with_calculations(df_prepared, cube),
+                         'LeadType': create_lead_pivot_with_calculations(df_prepared, cube)}
+    with stage('write', rows=len(df_prepared)):
+        written = write_columnar(df_prepared, directory, summaries, formats)
+    print(f"[OK] Salidas columnares creadas: {directory} ({len(written)} archivos)")
+    return directory
+
+# Artefactos disponibles: opción de línea de comandos -> (nombre de archivo, función)
+ARTIFACTS = {
+    'real_pivots': ('Opportunity_Real_Pivots_{stamp}.xlsx', write_real_pivots_workbook),
+    'native': ('Opportunity_Native_Pivot_{stamp}.xlsx', write_native_pivot_workbook),
+    'csv': ('Opportunity_Detail_{stamp}.csv', write_detail_csv),
+    'parquet': ('Opportunity_Detail_{stamp}.parquet', write_detail_parquet),
+    'columnar': ('Opportunity_Columnar_{stamp}', write_columnar_outputs),
+}
+
+# Frame preparado (y cubo del lote) compartidos por los procesos del pool (ver _init_worker)
+_worker_frame = None
+_worker_cube = None
+
+def _init_worker(df_prepared, cube=None):
+    global _worker_frame, _worker_cube
+    _worker_frame, _worker_cube = df_prepared, cube
+
+def _pool_context():
+    start_methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+
+def _build_artifact(name, filename, options, instrument=None):
+    """Construye un artefacto; con `instrument` (trace_memory) devuelve también sus etapas"""
+    start = time.perf_counter()
+    if instrument is None:
+        ARTIFACTS[name][1](_worker_frame, filename, **options)
+        return name, filename, time.perf_counter() - start, []
+    with recording(instrumentation.StageRecorder(trace_memory=instrument)) as recorder:
+        ARTIFACTS[name][1](_worker_frame, filename, **options)
+    return name, filename, time.perf_counter() - start, recorder.records
+
+def build_artifacts(df_prepared, names, output_dir='.', jobs=None, options=None):
+    """Genera los artefactos `names` desde un único frame preparado
+
+    Con más de un artefacto cada uno se construye en su propio proceso. En
+    Linux el pool usa fork: los workers heredan el frame sin serializarlo.
+    `options` da argumentos extra por artefacto ({'real_pivots': {'engine': 'sqlite'}}).
+    Devuelve [(nombre, archivo, segundos)] en el orden de `names`. Con un
+    registrador activo (reporting.instrumentation) las etapas de cada
+    artefacto se agregan como '<artefacto>/<etapa>'.
+    """
+    options = options or {}
+    recorder = instrumentation.current()
+    instrument = recorder.trace_memory if recorder.enabled else None
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    targets = [(name, os.path.join(output_dir, ARTIFACTS[name][0].format(stamp=stamp))) for name in names]
+    jobs = min(jobs or len(targets), len(targets))
+
+    if jobs <= 1:
+        _init_worker(df_prepared)
+        try:
+            results = [_build_artifact(name, filename, options.get(name, {}), instrument)
+                       for name, filename in targets]
+        finally:
+            _init_worker(None)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(),
+                                 initializer=_init_worker, initargs=(df_prepared,)) as pool:
+            futures = [pool.submit(_build_artifact, name, filename, options.get(name, {}), instrument)
+                       for name, filename in targets]
+            results = [future.result() for future in futures]
+
+    if recorder.enabled:
+        for name, _, _, records in results:
+            recorder.extend(records, prefix=f'{name}/')
+    return [result[:3] for result in results]
+
+def _build_partition(key, value, positions, filename, instrument=None):
+    """Workbook de resúmenes de una partición con su parte del cubo compartido"""
+    start = time.perf_counter()
+    subset = _worker_frame.iloc[positions]
+    cube = partition_cube(_worker_cube, key, value)
+    if instrument is None:
+        write_real_pivots_workbook(subset, filename, cube=cube)
+        return value, filename, len(subset), time.perf_counter() - start, []
+    with recording(instrumentation.StageRecorder(trace_memory=instrument)) as recorder:
+        write_real_pivots_workbook(subset, filename, cube=cube)
+    return value, filename, len(subset), time.perf_counter() - start, recorder.records
+
+def build_batch(df_prepared, batch, output_dir='.', jobs=None):
+    """Un workbook de resúmenes por partición del frame preparado (ver reporting.batch)
+
+    `batch` es una opción de BATCH_KEYS ('division', 'lead-type', 'year',
+    'state'). El cubo base se agrega una vez y los workbooks se generan en un
+    pool de procesos (fork: el frame y el cubo se heredan sin serializar).
+    Escribe un manifiesto JSON junto a los archivos y devuelve
+    (ruta del manifiesto, [(valor, archivo, filas, segundos)]).
+    """
+    key = BATCH_KEYS[batch]
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    start = time.perf_counter()
+    with stage('batch.partition', rows=len(df_prepared)):
+        partitions = partition_positions(partition_values(df_prepared, key))
+    with stage('batch.cube', rows=len(df_prepared)):
+        cube = shared_cube(df_prepared, key)
+
+    recorder = instrumentation.current()
+    instrument = recorder.trace_memory if recorder.enabled else None
+    targets = [(value, positions,
+                os.path.join(output_dir, f"Opportunity_Real_Pivots_{key}_{partition_label(value)}_{stamp}.xlsx"))
+               for value, positions in partitions.items()]
+    # Las particiones grandes primero para repartir mejor la carga del pool
+    targets.sort(key=lambda target: len(target[1]), reverse=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(targets)))
+
+    if jobs <= 1:
+        _init_worker(df_prepared, cube)
+        try:
+            results = [_build_partition(key, value, positions, filename, instrument)
+                       for value, positions, filename in targets]
+        finally:
+            _init_worker(None)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(),
+                                 initializer=_init_worker, initargs=(df_prepared, cube)) as pool:
+            futures = [pool.submit(_build_partition, key, value, positions, filename, instrument)
+                       for value, positions, filename in targets]
+            results = [future.result() for future in futures]
+
+    if recorder.enabled:
+        for value, _, _, _, records in results:
+            recorder.extend(records, prefix=f'{partition_label(value)}/')
+    results = [result[:4] for result in results]
+    manifest = os.path.join(output_dir, f"Opportunity_Batch_{key}_{stamp}.json")
+    write_manifest(manifest, key, results, jobs=jobs, seconds=round(time.perf_counter() - start, 3))
+    print(f"[OK] Lote por {key}: {len(results)} workbooks, manifiesto {manifest}")
+    return manifest, results
+
+def filter_detail(df, years=None, divisions=None, lead_types=None):
+    """Aplica localmente los mismos filtros que /api/opportunity-detail (year sobre YearValue)"""
+    mask = pd.Series(True, index=df.index)
+    for col, values in (('YearValue', years), ('Division', divisions), ('LeadType', lead_types)):
+        if values:
+            mask &= df[col].isin(values)
+    return df[mask].reset_index(drop=True) if not mask.all() else df
+
+def prepare_chunk(df, years=None, divisions=None, lead_types=None):
+    """Filtra y prepara un bloque del detalle (se ejecuta en los workers de --chunked)"""
+    return prepare_data_for_pivot(filter_detail(df, years, divisions, lead_types))
+
+def run_chunked(args):
+    """Resúmenes por división / lead type agregando el detalle por bloques en un pool de procesos
+
+    El detalle nunca se carga completo: se lee por bloques de `--chunk-rows`
+    registros desde --source o desde el API (las particiones de los filtros
+    se piden una tras otra) y solo se escribe el workbook de resúmenes.
+    """
+    start = time.perf_counter()
+    session = None
+    if args.source:
+        chunks = file_chunks(args.source, args.chunk_rows)
+        prepare = partial(prepare_chunk, years=args.years, divisions=args.divisions, lead_types=args.lead_types)
+    else:
+        session = create_session()
+        chunks = iter_detail_pages(session, args.base_url,
+                                   detail_partitions(args.years, args.divisions, args.lead_types),
+                                   page_size=args.chunk_rows)
+        prepare = prepare_chunk
+    try:
+        with stage('chunked.aggregate') as record:
+            summaries, rows, count = chunked_summaries(chunks, prepare, jobs=args.jobs, mp_context=_pool_context())
+            record['rows'] = rows
+    finally:
+        if session is not None:
+            session.close()
+    print(f"[OK] Detalle agregado por bloques: {rows} registros en {count} bloques "
+          f"de hasta {args.chunk_rows}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    with stage('write'):
+        filename = write_summary_workbook(summaries, os.path.join(args.output_dir, f"Opportunity_Summary_{stamp}.xlsx"))
+    results = [('summary', filename, time.perf_counter() - start)]
+    print("\n" + "=" * 50)
+    print("ARCHIVOS GENERADOS:")
+    print(f"1. {filename} (summary, {results[0][2]:.1f} s)")
+    return results
+
+def load_prepared_cached(key, cache_dir):
+    """Frame preparado de `key` desde --prepared-cache o None si no está"""
+    with stage('prepared_cache') as record:
+        df_prepared = load_prepared(key, cache_dir)
+        record['rows'] = 0 if df_prepared is None else len(df_prepared)
+    if df_prepared is not None:
+        print(f"[CACHE] HIT: frame preparado ({len(df_prepared)} registros) en {cache_path(key, cache_dir)}")
+    return df_prepared
+
+def run_fetch_only(args):
+    """Solo actualiza las cachés del detalle, sin generar artefactos
+
+    Con --source deja el frame preparado en --prepared-cache (si no estaba);
+    contra el API actualiza el snapshot local pidiendo solo los cambios, deja
+    el frame preparado de esa versión del snapshot y, con el mismo delta,
+    actualiza el estado de agregación (reporting.aggregate_state), así la
+    corrida siguiente sigue aplicando deltas sobre agregados al día.
+    No importa openpyxl ni xlsxwriter: sirve para precalentar las cachés en
+    cron antes de que otra corrida (o report_service) genere los workbooks.
+    """
+    start = time.perf_counter()
+    if args.source:
+        prepared_key = source_key(args.source, years=args.years, divisions=args.divisions,
+                                  lead_types=args.lead_types)
+        target = cache_path(prepared_key, args.prepared_cache)
+        if os.path.exists(target):
+            print(f"[CACHE] HIT: frame preparado en {target}")
+        else:
+            with stage('parse') as record:
+                detail = filter_detail(read_detail_source(args.source), args.years, args.divisions,
+                                       args.lead_types)
+                record['rows'] = len(detail)
+            with stage('prepare', rows=len(detail)):
+                df_prepared = prepare_data_for_pivot(detail)
+            with stage('prepared_cache.save', rows=len(df_prepared)):
+                save_prepared(df_prepared, prepared_key, args.prepared_cache)
+            print(f"[OK] Frame preparado ({len(df_prepared)} registros) en {target}")
+        results = [('prepared', target, time.perf_counter() - start)]
+    else:
+        changes = {}
+        session = create_session()
+        try:
+            with stage('fetch') as record:
+                detail = fetch_detail_cached(session, args.base_url,
+                                             detail_partitions(args.years, args.divisions, args.lead_types),
+                                             force_refresh=args.refresh,
+                                             on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                              delta=delta))
+                record['rows'] = len(detail)
+        finally:
+            session.close()
+        print(f"[OK] Snapshot actualizado ({len(detail)} registros) en {DEFAULT_SNAPSHOT_PATH}")
+        prepared_key = snapshot_key(load_snapshot_meta())
+        df_prepared = load_prepared_cached(prepared_key, args.prepared_cache)
+        if df_prepared is None:
+            with stage('prepare', rows=len(detail)):
+                df_prepared = prepare_data_for_pivot(detail)
+            with stage('prepared_cache.save', rows=len(df_prepared)):
+                save_prepared(df_prepared, prepared_key, args.prepared_cache)
+        with stage('aggregate_state', rows=len(changes['delta'])):
+            refresh_state(df_prepared, prepare_data_for_pivot, **changes)
+        results = [('snapshot', DEFAULT_SNAPSHOT_PATH, time.perf_counter() - start)]
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Genera reportes Excel de oportunidades (descarga el detalle una sola vez)')
+    outputs = parser.add_argument_group('artefactos (por defecto --real-pivots y --native)')
+    outputs.add_argument('--real-pivots', action='store_true', help='Workbook con resúmenes calculados')
+    outputs.add_argument('--native', action='store_true', help='Workbook con pivot tables nativas')
+    outputs.add_argument('--csv', action='store_true', help='Detalle preparado en CSV')
+    outputs.add_argument('--parquet', action='store_true', help='Detalle preparado en Parquet')
+    outputs.add_argument('--columnar', action='store_true',
+                         help='Directorio con detalle preparado y resúmenes en Parquet / Arrow IPC')
+    outputs.add_argument('--batch', choices=list(BATCH_KEYS),
+                         help='En lugar de los artefactos, un workbook de resúmenes por partición '
+                              '(state = código de estado en Name) y un manifiesto JSON')
+    outputs.add_argument('--chunked', action='store_true',
+                         help='En lugar de los artefactos, solo el workbook de resúmenes agregando el '
+                              'detalle por bloques en un pool de procesos (sin cargarlo completo)')
+    outputs.add_argument('--fetch-only', action='store_true',
+                         help='Sin artefactos: solo actualiza el snapshot del API o, con --source, la '
+                              'caché del frame preparado (no carga openpyxl ni xlsxwriter)')
+
+    filters = parser.add_argument_group('filtros (se envían al API; se pueden repetir)')
+    filters.add_argument('--year', type=int, action='append', dest='years', metavar='YEAR')
+    filters.add_argument('--division', action='append', dest='divisions', metavar='DIVISION')
+    filters.add_argument('--lead-type', action='append', dest='lead_types', metavar='LEAD_TYPE')
+
+    parser.add_argument('--source', metavar='PATH',
+                        help='Detalle local (JSON con formato del API o snapshot .parquet); no usa el API')
+    parser.add_argument('--from-columnar', metavar='DIR',
+                        help='Genera los workbooks desde un directorio de --columnar (sin API ni preparación)')
+    parser.add_argument('--columnar-format', choices=list(COLUMNAR_FORMATS), action='append',
+                        dest='columnar_formats', metavar='FORMAT',
+                        help='Formatos de --columnar (parquet, arrow, csv; por defecto parquet y arrow)')
+    parser.add_argument('--template', nargs='?', const=DEFAULT_TEMPLATE_PATH, metavar='XLSX',
+                        help='--real-pivots desde una plantilla .xlsx: solo se reescriben Raw_Data y los '
+                             'resúmenes, sin vínculos de drill-through ni hojas de tendencia (sin ruta: '
+                             f'{DEFAULT_TEMPLATE_PATH}, se crea si no existe o si cambiaron sus columnas). '
+                             'No se combina con --batch, --chunked ni --fetch-only')
+    parser.add_argument('--sheet-jobs', type=int, default=None, metavar='N',
+                        help='Solo con --template: procesos que serializan las hojas a partes XML en '
+                             'paralelo. El workbook sin plantilla y --native se guardan en un solo proceso')
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help='Solo con --template: nivel de deflate del .xlsx (0 = sin comprimir, para '
+                             'copias locales rápidas; por defecto el de zipfile)')
+    parser.add_argument('--summary-engine', choices=['pandas'] + SQL_ENGINES, default='pandas',
+                        help='Dónde se calculan los resúmenes de --real-pivots')
+    parser.add_argument('--base-url', default=API_BASE_URL)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Procesos para generar los artefactos (por defecto uno por artefacto; '
+                             'con --batch o --chunked, uno por CPU)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'Registros por bloque de --chunked (por defecto {DEFAULT_CHUNK_ROWS})')
+    parser.add_argument('--no-cache', action='store_true', help='No usar el snapshot local del detalle')
+    parser.add_argument('--refresh', action='store_true', help='Forzar descarga completa del snapshot')
+    parser.add_argument('--prepared-cache', metavar='DIR', default=PREPARED_CACHE_DIR,
+                        help='Caché del frame preparado, por hash del contenido de --source o por '
+                             f'versión del snapshot del API (por defecto {PREPARED_CACHE_DIR})')
+    parser.add_argument('--no-prepared-cache', action='store_true',
+                        help='Preparar siempre el detalle (de --source o del API) sin leer ni escribir '
+                             'la caché')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if (args.sheet_jobs is not None or args.compress_level is not None) and not args.template:
+        parser.error('--sheet-jobs y --compress-level se aplican a --template')
+    if args.template and (args.batch or args.chunked or args.fetch_only):
+        parser.error('--template (y --sheet-jobs / --compress-level) se aplica al workbook de --real-pivots: '
+                     'no se combina con --batch, --chunked ni --fetch-only')
+    if args.fetch_only and (args.no_cache or args.no_prepared_cache or args.from_columnar):
+        parser.error('--fetch-only solo actualiza las cachés: no se combina con --no-cache, '
+                     '--no-prepared-cache ni --from-columnar')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    recorder = instrumentation.recorder_from_args(args)
+    if recorder is None:
+        return run(args)
+    with recording(recorder):
+        results = run(args)
+    instrumentation.report(recorder, args, script='generate_real_pivot')
+    return results
+
+def run(args):
+    """Descarga (o lee) el detalle, lo prepara y genera los artefactos pedidos en `args`"""
+    if args.chunked:
+        return run_chunked(args)
+    if args.fetch_only:
+        return run_fetch_only(args)
+    names = [name for name, selected in (('real_pivots', args.real_pivots), ('native', args.native),
+                                         ('csv', args.csv), ('parquet', args.parquet),
+                                         ('columnar', args.columnar)) if selected]
+    names = names or ['real_pivots', 'native']
 
-    # Crear Excel con pivots calculados
-    filename = create_excel_with_real_pivots(data_dict)
+    print("Generando Excel con Pivot Tables Reales...")
+    print("=" * 50)
 
-    # También crear versión para pivot nativo
-    native_filename = create_excel_with_native_pivot()
+    changes = {}
+    summaries = None
+    df_prepared = prepared_key = None
+    if args.from_columnar:
+        # Frame ya preparado y resúmenes ya calculados: sin descargar, preparar ni agregar
+        with stage('load') as record:
+            df_prepared, summaries = read_columnar(args.from_columnar)
+            filtered = filter_detail(df_prepared, args.years, args.divisions, args.lead_types)
+            if filtered is not df_prepared:
+                # Los resúmenes guardados son del detalle completo: se recalculan
+                df_prepared, summaries = filtered, None
+            record['rows'] = len(df_prepared)
+        print(f"[OK] Salidas columnares ({args.from_columnar}): {len(df_prepared)} registros")
+    elif args.source:
+        if not args.no_prepared_cache:
+            # Mismo contenido y filtros que una corrida anterior: frame preparado con memory map
+            prepared_key = source_key(args.source, years=args.years, divisions=args.divisions,
+                                      lead_types=args.lead_types)
+            df_prepared = load_prepared_cached(prepared_key, args.prepared_cache)
+        if df_prepared is None:
+            # Sin API: detalle desde archivo local, filtros aplicados aquí
+            with stage('parse') as record:
+                detail = filter_detail(read_detail_source(args.source), args.years, args.divisions, args.lead_types)
+                record['rows'] = len(detail)
+            print(f"[OK] Detalle local ({args.source}): {len(detail)} registros")
+    else:
+        # Obtener todos los datos una sola vez (detalle desde el snapshot local + cambios recientes)
+        partitions = detail_partitions(args.years, args.divisions, args.lead_types)
+        with stage('fetch') as record:
+            data_dict = fetch_all_data(args.base_url, partitions=partitions, use_cache=not args.no_cache,
+                                       force_refresh=args.refresh,
+                                       on_change=lambda previous, delta: changes.update(previous=previous, delta=delta))
+            record['rows'] = len(data_dict['detail']) if data_dict else 0
+        if not data_dict:
+            print("[ERROR] No se pudieron obtener los datos")
+            return
+
+        print(f"[OK] Datos obtenidos:")
+        print(f"  - Detail: {len(data_dict['detail'])} registros")
+        print(f"  - Division Summary: {len(data_dict['division_summary'])} registros")
+        print(f"  - Lead Summary: {len(data_dict['lead_summary'])} registros")
+        detail = data_dict['detail']
+        if not args.no_cache and not args.no_prepared_cache:
+            # Misma versión del snapshot que una corrida anterior: frame preparado con memory map
+            prepared_key = snapshot_key(load_snapshot_meta())
+            df_prepared = load_prepared_cached(prepared_key, args.prepared_cache)
+
+    # Preparar una vez y generar los artefactos en paralelo
+    if df_prepared is None:
+        with stage('prepare', rows=len(detail)):
+            df_prepared = prepare_data_for_pivot(detail)
+        if prepared_key:
+            with stage('prepared_cache.save', rows=len(df_prepared)):
+                save_prepared(df_prepared, prepared_key, args.prepared_cache)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.batch:
+        # Un workbook de resúmenes por partición, todos desde el mismo frame preparado
+        manifest, results = build_batch(df_prepared, args.batch, args.output_dir, args.jobs)
+        print("\n" + "=" * 50)
+        print(f"ARCHIVOS GENERADOS ({manifest}):")
+        for i, (value, filename, rows, elapsed) in enumerate(results, 1):
+            print(f"{i}. {filename} ({rows} registros, {elapsed:.1f} s)")
+        return results
+
+    options = {'real_pivots': {'engine': args.summary_engine, 'template': args.template,
+                               'sheet_jobs': args.sheet_jobs, 'compresslevel': args.compress_level},
+               'columnar': {'formats': args.columnar_formats}}
+    if summaries and set(summaries) == {'Division', 'LeadType'}:
+        options['real_pivots']['summaries'] = options['columnar']['summaries'] = summaries
+    elif changes and args.summary_engine == 'pandas':
+        # Con snapshot, los agregados se actualizan con el delta en lugar de recalcularse
+        with stage('aggregate_state', rows=len(changes['delta'])):
+            cube = refresh_state(df_prepared, prepare_data_for_pivot, **changes)
+        options['real_pivots']['cube'] = options['columnar']['cube'] = cube
+    results = build_artifacts(df_prepared, names, args.output_dir, args.jobs, options=options)
 
     print("\n" + "=" * 50)
     print("ARCHIVOS GENERADOS:")
-    print(f"1. {filename} - Con calculos completos")
-    print(f"2. {native_filename} - Para crear pivot nativo en Excel")
-    print("\nLas pivot tables incluyen:")
-    print("  - Close Rate Standard y No Lost")
-    print("  - Average Ticket")
-    print("  - Totales por Year")
-    print("  - Drill-through habilitado en datos crudos")
+    for i, (name, filename, elapsed) in enumerate(results, 1):
+        print(f"{i}. {filename} ({name}, {elapsed:.1f} s)")
+    if 'real_pivots' in names or 'native' in names:
+        print("\nLas pivot tables incluyen:")
+        print("  - Close Rate Standard y No Lost")
+        print("  - Average Ticket")
+        print("  - Totales por Year")
+        print("  - Drill-through habilitado en datos crudos")
+    return results
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
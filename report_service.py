@@ -0,0 +1,278 @@
+"""Servicio HTTP (asyncio) que genera el workbook de resúmenes bajo demanda
+
+  GET /report.xlsx?year=2024&division=...&leadType=...   (filtros repetibles)
+  GET /health                                            (versión de datos y caché)
+
+El detalle se prepara una vez por versión de los datos y se guarda con
+reporting.prepared_cache (Arrow IPC): los procesos que construyen los
+workbooks lo abren con memory map y comparten las páginas. La versión es
+el hash del archivo de --source o, contra el API, la versión del snapshot
+local (prepared_cache.snapshot_key, refrescado cada --version-ttl segundos). Cada refresco
+actualiza también el estado de agregación con el mismo delta, así las
+corridas de generate_real_pivot.py sobre el mismo .cache siguen al día.
+
+Los workbooks quedan en una caché LRU por (filtros, versión) con límite de
+tamaño; pedidos iguales simultáneos esperan una sola construcción.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from generate_real_pivot import filter_detail, prepare_data_for_pivot, write_real_pivots_workbook
+from reporting.aggregate_state import refresh_state
+from reporting.client import API_BASE_URL, create_session
+from reporting.local_sql import read_detail_source
+from reporting.prepared_cache import (DEFAULT_CACHE_DIR as PREPARED_CACHE_DIR, load_prepared, save_prepared,
+                                      snapshot_key, source_key)
+from reporting.report_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ReportCache, report_key
+from reporting.snapshot import fetch_detail_cached, load_snapshot_meta
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Segundos entre consultas de cambios al API
+DEFAULT_VERSION_TTL = 60
+
+# Parámetro de la URL -> argumento de filter_detail (mismos nombres que /api/opportunity-detail)
+FILTER_PARAMS = {
+    'year': 'years',
+    'division': 'divisions',
+    'leadType': 'lead_types',
+}
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+_SEND_CHUNK = 256 * 1024
+
+
+def parse_filters(query):
+    """{years, divisions, lead_types} desde el query string; ValueError si year no es entero"""
+    params = parse_qs(query)
+    unknown = set(params) - set(FILTER_PARAMS)
+    if unknown:
+        raise ValueError(f"Parámetro no soportado: {', '.join(sorted(unknown))}")
+    filters = {name: params.get(param, []) for param, name in FILTER_PARAMS.items()}
+    try:
+        filters['years'] = [int(year) for year in filters['years']]
+    except ValueError:
+        raise ValueError('year debe ser un entero') from None
+    return filters
+
+
+# Trabajo pesado: se ejecuta en los procesos del pool
+
+def prepare_source(path, key, cache_dir):
+    """Deja en la caché el frame preparado de `path` (si no estaba) y devuelve sus filas"""
+    df = load_prepared(key, cache_dir)
+    if df is None:
+        df = prepare_data_for_pivot(read_detail_source(path))
+        save_prepared(df, key, cache_dir)
+    return len(df)
+
+
+def refresh_api(base_url, cache_dir):
+    """Actualiza el snapshot del API (y el estado de agregación) y deja en la caché el frame
+    preparado; devuelve (versión, filas)"""
+    changes = {}
+    session = create_session()
+    try:
+        detail = fetch_detail_cached(session, base_url,
+                                     on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                      delta=delta))
+    finally:
+        session.close()
+    version = snapshot_key(load_snapshot_meta())
+    df_prepared = load_prepared(version, cache_dir)
+    if df_prepared is None:
+        df_prepared = prepare_data_for_pivot(detail)
+        save_prepared(df_prepared, version, cache_dir)
+    if changes:
+        refresh_state(df_prepared, prepare_data_for_pivot, **changes)
+    return version, len(detail)
+
+
+def build_report(version, cache_dir, filters, filename):
+    """Workbook de resúmenes del frame preparado `version` con los filtros aplicados"""
+    df = filter_detail(load_prepared(version, cache_dir), **filters)
+    if not len(df):
+        raise LookupError('Sin oportunidades para los filtros')
+    write_real_pivots_workbook(df, filename)
+    return len(df)
+
+
+def _pool_context():
+    # forkserver: un worker creado con fork heredaría los sockets de los clientes
+    # conectados y esas conexiones no se cerrarían hasta que el worker termine
+    start_methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else None)
+
+
+class ReportService:
+    """Estado del servicio: versión de los datos, caché de workbooks y pool de construcción"""
+
+    def __init__(self, source=None, base_url=API_BASE_URL, cache=None, prepared_dir=PREPARED_CACHE_DIR,
+                 jobs=1, version_ttl=DEFAULT_VERSION_TTL):
+        self.source = source
+        self.base_url = base_url
+        self.cache = ReportCache() if cache is None else cache
+        self.prepared_dir = prepared_dir
+        self.version_ttl = version_ttl
+        self.version = None
+        self.rows = None
+        self.builds = 0
+        self._pool = ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context())
+        self._lock = asyncio.Lock()
+        self._signature = None
+        self._checked = 0.0
+
+    def close(self):
+        self._pool.shutdown()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def data_version(self):
+        """Versión actual de los datos (prepara el frame si cambió)"""
+        async with self._lock:
+            if self.source:
+                # Solo se vuelve a calcular el hash si cambian tamaño o fecha del archivo
+                stat = os.stat(self.source)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if signature != self._signature:
+                    version = await asyncio.to_thread(source_key, self.source)
+                    if version != self.version:
+                        self.rows = await self._run(prepare_source, self.source, version, self.prepared_dir)
+                        self.version = version
+                    self._signature = signature
+            elif self.version is None or time.monotonic() - self._checked > self.version_ttl:
+                self.version, self.rows = await self._run(refresh_api, self.base_url, self.prepared_dir)
+                self._checked = time.monotonic()
+            return self.version
+
+    async def report(self, filters):
+        """(ruta del workbook, estado de la caché) para `filters`"""
+        version = await self.data_version()
+
+        async def build(filename):
+            self.builds += 1
+            await self._run(build_report, version, self.prepared_dir, filters, filename)
+
+        return await self.cache.get(report_key(filters, version), build)
+
+    def health(self):
+        return {'version': self.version, 'rows': self.rows, 'builds': self.builds,
+                'cache': dict(self.cache.stats, entries=len(self.cache), bytes=self.cache.size)}
+
+    async def handle(self, reader, writer):
+        """Atiende un pedido HTTP/1.1 (sin keep-alive)"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request_line) != 3:
+                return await _respond(writer, 400, 'Pedido inválido')
+            method, target, _ = request_line
+            url = urlparse(target)
+            if method != 'GET':
+                return await _respond(writer, 405, f'Método no soportado: {method}')
+            if url.path == '/health':
+                return await _respond(writer, 200, json.dumps(self.health()), 'application/json')
+            if url.path != '/report.xlsx':
+                return await _respond(writer, 404, f'Ruta desconocida: {url.path}')
+
+            try:
+                filters = parse_filters(url.query)
+            except ValueError as exc:
+                return await _respond(writer, 400, str(exc))
+            try:
+                path, status = await self.report(filters)
+            except LookupError as exc:
+                return await _respond(writer, 404, str(exc))
+            except Exception as exc:
+                print(f"[ERROR] {target}: {exc}")
+                return await _respond(writer, 500, 'Error generando el reporte')
+            # El archivo se abre antes de ceder el control: un desalojo posterior no lo corta
+            with open(path, 'rb') as f:
+                headers = {'Content-Disposition': 'attachment; filename="Opportunity_Real_Pivots.xlsx"',
+                           'ETag': f'"{os.path.basename(path)}"', 'X-Cache': status}
+                await _send_file(writer, f, os.fstat(f.fileno()).st_size, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _head(status, length, content_type, headers=None):
+    lines = [f'HTTP/1.1 {status} {_STATUS[status]}', f'Content-Type: {content_type}',
+             f'Content-Length: {length}', 'Connection: close']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _respond(writer, status, body, content_type='text/plain; charset=utf-8'):
+    body = body.encode('utf-8')
+    writer.write(_head(status, len(body), content_type) + body)
+    await writer.drain()
+
+
+async def _send_file(writer, f, length, headers):
+    writer.write(_head(200, length, XLSX_TYPE, headers))
+    while chunk := f.read(_SEND_CHUNK):
+        writer.write(chunk)
+        await writer.drain()
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Servidor asyncio con `service`; devuelve el asyncio.Server ya escuchando"""
+    return await asyncio.start_server(service.handle, host, port)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servicio HTTP que genera reportes Excel de oportunidades')
+    parser.add_argument('--source', metavar='PATH',
+                        help='Detalle local (JSON con formato del API o snapshot .parquet); no usa el API')
+    parser.add_argument('--base-url', default=API_BASE_URL)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directorio de los workbooks generados')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help='Tamaño máximo de la caché de workbooks (LRU)')
+    parser.add_argument('--prepared-cache', metavar='DIR', default=PREPARED_CACHE_DIR,
+                        help='Caché del frame preparado por versión de datos')
+    parser.add_argument('--jobs', type=int, default=1, help='Procesos que construyen workbooks')
+    parser.add_argument('--version-ttl', type=float, default=DEFAULT_VERSION_TTL,
+                        help='Segundos entre consultas de cambios al API')
+    return parser.parse_args(argv)
+
+
+async def main_async(args):
+    cache = ReportCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    service = ReportService(args.source, args.base_url, cache, args.prepared_cache, args.jobs, args.version_ttl)
+    try:
+        await service.data_version()
+        server = await serve(service, args.host, args.port)
+        print(f"[OK] Servicio de reportes en http://{args.host}:{args.port}/report.xlsx "
+              f"({service.rows} registros, versión {service.version[:12]})")
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(main_async(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Utilidades compartidas por los scripts de reportes Excel (generate_*.py)"""
@@ -0,0 +1,108 @@
+"""Estado de agregación persistente que se actualiza con deltas
+
+El estado es el cubo base de reporting.rollup (Year x dims x StageClass con
+Count y Amount). Es sumable: cuando una oportunidad cambia de stage, de
+monto o de año se resta su aporte anterior y se suma el nuevo, sin volver
+a recorrer todo el detalle. Los resúmenes (CloseRate_Std,
+CloseRate_NoLost, Average_Ticket) se derivan del estado con rollup().
+
+El estado guarda la versión del snapshot con la que quedó al día: un delta
+solo se aplica si partió de esa misma versión. Si el snapshot avanzó sin
+actualizar el estado (otra corrida, otro motor de resúmenes), se
+reconstruye completo.
+"""
+import os
+
+from reporting.lazy import lazy_import
+from reporting.rollup import DEFAULT_DIMENSIONS, build_base_cube, rollup
+from reporting.snapshot import (DEFAULT_SNAPSHOT_PATH, load_snapshot, load_snapshot_meta, save_snapshot,
+                                snapshot_version)
+
+pd = lazy_import('pandas')
+
+DEFAULT_STATE_PATH = os.path.join('.cache', 'opportunity_aggregates.parquet')
+
+VALUE_COLUMNS = ['Count', 'Amount']
+
+# Restos de punto flotante que deja un grupo vaciado al restar sus montos
+AMOUNT_EPSILON = 1e-6
+
+
+def combine(state, cube, sign=1):
+    """Suma (sign=1) o resta (sign=-1) `cube` al estado; descarta los grupos que quedan vacíos"""
+    keys = [col for col in state.columns if col not in VALUE_COLUMNS]
+    signed = cube[keys + VALUE_COLUMNS].copy()
+    signed['Count'] *= sign
+    signed['Amount'] *= sign
+
+    merged = (pd.concat([state, signed], ignore_index=True)
+              .groupby(keys, dropna=False, observed=True, sort=False)[VALUE_COLUMNS]
+              .sum()
+              .reset_index())
+    empty = (merged['Count'] == 0) & (merged['Amount'].abs() < AMOUNT_EPSILON)
+    return merged[~empty].reset_index(drop=True)
+
+
+def apply_delta(state, previous, current, dims=None):
+    """Retira el aporte de `previous` y agrega el de `current` (ambos ya preparados)
+
+    `previous` son las versiones anteriores de las filas que cambiaron (vacío
+    o None si todas son nuevas) y `current` sus versiones nuevas.
+    """
+    if previous is not None and len(previous):
+        state = combine(state, build_base_cube(previous, dims), -1)
+    if current is not None and len(current):
+        state = combine(state, build_base_cube(current, dims))
+    return state
+
+
+def summaries(state, dims=None):
+    """{dim: resumen con totales por año} derivado del estado"""
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    return {dim: rollup(state, dim) for dim in dims}
+
+
+def load_state(path=DEFAULT_STATE_PATH):
+    """Devuelve (estado, metadatos) o (None, None) si no hay estado guardado"""
+    return load_snapshot(path)
+
+
+def save_state(state, meta, path=DEFAULT_STATE_PATH):
+    save_snapshot(state, meta, path)
+
+
+def refresh_state(df_prepared, prepare, previous=None, delta=None, path=DEFAULT_STATE_PATH, dims=None,
+                  snapshot_path=DEFAULT_SNAPSHOT_PATH):
+    """Actualiza el estado guardado con el último delta del snapshot y lo devuelve
+
+    `previous`/`delta` son los que entrega snapshot.fetch_detail_cached
+    (on_change) sin preparar; `prepare` es la función que prepara el detalle
+    (prepare_data_for_pivot). El delta solo se aplica si el estado está al
+    día con la versión del snapshot de la que partió ese delta (ver
+    snapshot_path). Si no hay estado, no hay delta, el estado quedó atrás o
+    el resultado no cuadra con `df_prepared` (total de oportunidades), se
+    reconstruye desde `df_prepared`.
+    """
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    state, meta = load_state(path)
+    snapshot_meta = load_snapshot_meta(snapshot_path) or {}
+
+    mode = 'full'
+    if state is not None and previous is not None and meta.get('dims') == dims:
+        if meta.get('snapshot') is None or meta.get('snapshot') != snapshot_meta.get('base'):
+            print("[STATE] El estado no corresponde a la versión del snapshot del delta: "
+                  "reconstrucción completa")
+        else:
+            # Un Id repetido en el delta cuenta una sola vez (como en snapshot.upsert)
+            current = delta.drop_duplicates(subset='Id', keep='last')
+            state = apply_delta(state, prepare(previous.copy()), prepare(current.copy()), dims)
+            mode = 'delta'
+            if state['Count'].sum() != df_prepared['Id'].notna().sum():
+                mode = 'full'
+    if mode == 'full':
+        state = build_base_cube(df_prepared, dims)
+
+    save_state(state, {'dims': dims, 'rows': int(df_prepared['Id'].notna().sum()), 'mode': mode,
+                       'snapshot': snapshot_version(snapshot_meta)}, path)
+    print(f"[STATE] Agregados actualizados ({mode}): {len(state)} grupos")
+    return state
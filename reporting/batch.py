@@ -0,0 +1,85 @@
+"""Particiones del detalle preparado para generar un workbook por grupo
+
+El detalle se prepara una sola vez y se reparte por una clave (Division,
+LeadType, Year o el estado del nombre "OPP - TX - ..."). El cubo base se
+construye una vez con esa clave como dimensión extra: el cubo de cada
+partición es un filtro del compartido y no se vuelve a agregar el detalle.
+El resultado de un lote se describe en un manifiesto JSON con archivo,
+filas y tiempo por partición.
+"""
+import json
+import os
+import re
+from datetime import datetime
+
+from reporting.lazy import lazy_import
+from reporting.rollup import DEFAULT_DIMENSIONS, build_base_cube
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Opción de línea de comandos -> columna del frame preparado
+BATCH_KEYS = {
+    'division': 'Division',
+    'lead-type': 'LeadType',
+    'year': 'Year',
+    'state': 'State',
+}
+
+# Estado en Name: "OPP - TX - Customer ..."
+STATE_PATTERN = r'^OPP - ([A-Z]{2}) - '
+
+# Etiqueta de la partición con la clave vacía
+MISSING_LABEL = 'Sin_valor'
+
+
+def partition_values(df, key):
+    """Serie con el valor de partición de cada fila (NaN si no tiene)"""
+    if key == 'State':
+        return df['Name'].str.extract(STATE_PATTERN, expand=False)
+    return df[key]
+
+
+def partition_positions(values):
+    """{valor: posiciones int32 ordenadas} de cada partición; la clave vacía queda como None"""
+    codes, uniques = pd.factorize(values, sort=True)
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(-1, len(uniques) + 1))
+    labels = [None] + [value.item() if hasattr(value, 'item') else value for value in uniques]
+    return {label: order[start:stop] for label, start, stop in zip(labels, bounds[:-1], bounds[1:])
+            if stop > start}
+
+
+def shared_cube(df, key):
+    """Cubo base con `key` como dimensión adicional (si no lo es ya)"""
+    dims = list(DEFAULT_DIMENSIONS)
+    if key == 'State':
+        df = df.assign(State=partition_values(df, key))
+    if key not in dims and key != 'Year':
+        dims.append(key)
+    return build_base_cube(df, dims)
+
+
+def partition_cube(cube, key, value):
+    """Parte del cubo compartido que corresponde a la partición `value`"""
+    mask = cube[key].isna() if value is None else cube[key] == value
+    return cube[mask.to_numpy()].reset_index(drop=True)
+
+
+def partition_label(value):
+    """Texto apto para nombre de archivo"""
+    if value is None:
+        return MISSING_LABEL
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(value)).strip('_') or MISSING_LABEL
+
+
+def write_manifest(path, key, results, **fields):
+    """Manifiesto JSON del lote: una entrada por partición con archivo, filas, bytes y segundos"""
+    partitions = [{'value': value, 'file': os.path.basename(filename), 'rows': rows,
+                   'bytes': os.path.getsize(filename), 'seconds': round(seconds, 3)}
+                  for value, filename, rows, seconds in results]
+    manifest = {'key': key, 'created': datetime.now().isoformat(timespec='seconds'), **fields,
+                'rows': sum(entry['rows'] for entry in partitions), 'partitions': partitions}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return manifest
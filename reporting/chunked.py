@@ -0,0 +1,109 @@
+"""Agregación por bloques (map-reduce) del detalle sin cargarlo completo
+
+El detalle se lee en bloques de tamaño fijo (páginas de registros del JSON
+/ API o lotes de un Parquet). Cada bloque se prepara y se reduce a un cubo
+base parcial (Year x dims x StageClass con Count y Amount, ver
+reporting.rollup) en un pool de procesos; el proceso principal suma los
+cubos parciales a medida que llegan. Year y las banderas solo dependen de
+cada fila, así que el cubo final es el mismo que el del detalle completo y
+los resúmenes salen de rollup().
+
+La memoria queda acotada por el tamaño del bloque: el lector no se
+adelanta más de MAX_PENDING_PER_WORKER bloques por worker.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from reporting.ingest import items_to_frame, iter_file_items, iter_item_pages
+from reporting.lazy import lazy_import
+from reporting.rollup import DEFAULT_DIMENSIONS, build_base_cube, rollup
+
+pd = lazy_import('pandas')
+
+# Registros por bloque
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Bloques enviados al pool y todavía sin resultado, por worker
+MAX_PENDING_PER_WORKER = 2
+
+
+def file_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Bloques de un JSON con formato del API (listas de registros) o de un Parquet (DataFrames)"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        with pq.ParquetFile(path) as parquet:
+            for batch in parquet.iter_batches(batch_size=chunk_rows):
+                yield batch.to_pandas()
+        return
+
+    meta = {}
+    yield from iter_item_pages(iter_file_items(path, meta), chunk_rows)
+    if meta.get('success') is False:
+        raise Exception(meta.get('error') or 'Error fetching data from API')
+
+
+def chunk_cube(chunk, prepare, dims=None):
+    """(cubo parcial, filas) de un bloque; `prepare` recibe el DataFrame crudo y lo prepara"""
+    df = items_to_frame(chunk) if isinstance(chunk, list) else chunk
+    df = prepare(df)
+    if not len(df):
+        return None, 0
+    return build_base_cube(df, dims), len(df)
+
+
+def merge_cubes(cubes):
+    """Suma cubos parciales con las mismas claves"""
+    cubes = [cube for cube in cubes if cube is not None]
+    if len(cubes) <= 1:
+        return cubes[0] if cubes else None
+    merged = pd.concat(cubes, ignore_index=True)
+    keys = [col for col in merged.columns if col not in ('Count', 'Amount')]
+    return (merged.groupby(keys, dropna=False, observed=True, sort=False)[['Count', 'Amount']]
+            .sum()
+            .reset_index())
+
+
+def aggregate_chunks(chunks, prepare, dims=None, jobs=None, mp_context=None):
+    """Cubo base del detalle completo a partir de `chunks`
+
+    `prepare` debe poder enviarse a otro proceso (función de módulo o
+    functools.partial). Con `jobs` > 1 los bloques se procesan en un
+    ProcessPoolExecutor. Devuelve (cubo, filas, bloques).
+    """
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    cube, rows, count = None, 0, 0
+
+    def reduce(result):
+        nonlocal cube, rows, count
+        partial_cube, partial_rows = result
+        cube = merge_cubes([cube, partial_cube])
+        rows += partial_rows
+        count += 1
+
+    if jobs == 1:
+        for chunk in chunks:
+            reduce(chunk_cube(chunk, prepare, dims))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context) as pool:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(chunk_cube, chunk, prepare, dims))
+                if len(pending) >= jobs * MAX_PENDING_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        reduce(future.result())
+            for future in wait(pending).done:
+                reduce(future.result())
+
+    if cube is None:
+        raise ValueError('El detalle no tiene registros')
+    return cube, rows, count
+
+
+def chunked_summaries(chunks, prepare, dims=None, jobs=None, mp_context=None):
+    """({dim: resumen con totales por año}, filas, bloques) agregando `chunks` por partes"""
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    cube, rows, count = aggregate_chunks(chunks, prepare, dims, jobs, mp_context)
+    return {dim: rollup(cube, dim) for dim in dims}, rows, count
@@ -0,0 +1,112 @@
+"""Cliente HTTP del API del dashboard: sesión con pool, timeouts, reintentos y descargas concurrentes"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+from reporting.ingest import DEFAULT_PAGE_SIZE, fetch_detail_frame, iter_item_pages, iter_url_items
+from reporting.lazy import lazy_import
+
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
+
+API_BASE_URL = 'http://localhost:3001/api'
+
+# (conexión, lectura) en segundos; las consultas a Azure SQL pueden tardar
+DEFAULT_TIMEOUT = (5, 300)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_WORKERS = 4
+
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS * 2, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Crea una sesión con pool de conexiones y reintentos con backoff exponencial"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_summary(session, endpoint, base_url=API_BASE_URL, timeout=DEFAULT_TIMEOUT):
+    """Obtiene un endpoint de resumen (division-summary / lead-summary) como DataFrame"""
+    response = session.get(f"{base_url}/{endpoint}", timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if not data['success']:
+        raise Exception(data.get('error') or f"Error fetching {endpoint} from API")
+    return pd.DataFrame(data['data'])
+
+
+def detail_partitions(years=None, divisions=None, lead_types=None):
+    """Genera los filtros (year/division/leadType) para repartir el detalle en varias peticiones"""
+    axes = [('year', years), ('division', divisions), ('leadType', lead_types)]
+    axes = [(name, values) for name, values in axes if values]
+    if not axes:
+        return [{}]
+    names = [name for name, _ in axes]
+    return [dict(zip(names, combo)) for combo in product(*(values for _, values in axes))]
+
+
+def fetch_detail(session, base_url=API_BASE_URL, partitions=None, timeout=DEFAULT_TIMEOUT,
+                 max_workers=DEFAULT_MAX_WORKERS):
+    """Descarga el detalle, en paralelo por partición si se indican filtros"""
+    url = f"{base_url}/opportunity-detail"
+    partitions = partitions or [{}]
+    if len(partitions) == 1:
+        return fetch_detail_frame(url, params=partitions[0], session=session, timeout=timeout)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = list(pool.map(
+            lambda params: fetch_detail_frame(url, params=params, session=session, timeout=timeout),
+            partitions))
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_detail_pages(session, base_url=API_BASE_URL, partitions=None, timeout=DEFAULT_TIMEOUT,
+                      page_size=DEFAULT_PAGE_SIZE):
+    """Itera el detalle en páginas de registros (listas de dicts) a medida que se descarga
+
+    Las particiones se piden una tras otra; nunca hay más de una página en memoria.
+    """
+    url = f"{base_url}/opportunity-detail"
+    for params in partitions or [{}]:
+        meta = {}
+        yield from iter_item_pages(iter_url_items(url, params=params, session=session, timeout=timeout,
+                                                  meta=meta), page_size)
+        if meta.get('success') is False:
+            raise Exception(meta.get('error') or 'Error fetching detail from API')
+
+
+def fetch_all(base_url=API_BASE_URL, session=None, partitions=None, timeout=DEFAULT_TIMEOUT,
+              max_workers=DEFAULT_MAX_WORKERS, detail_fetcher=None):
+    """Descarga detalle y resúmenes de forma concurrente
+
+    `detail_fetcher` reemplaza a fetch_detail (misma firma), por ejemplo
+    para leer el detalle desde el snapshot local.
+    Devuelve {'detail', 'division_summary', 'lead_summary'} como DataFrames.
+    """
+    detail_fetcher = detail_fetcher or fetch_detail
+    own_session = session is None
+    session = session or create_session()
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            detail = pool.submit(detail_fetcher, session, base_url, partitions, timeout, max_workers)
+            division = pool.submit(fetch_summary, session, 'division-summary', base_url, timeout)
+            lead = pool.submit(fetch_summary, session, 'lead-summary', base_url, timeout)
+            return {
+                'detail': detail.result(),
+                'division_summary': division.result(),
+                'lead_summary': lead.result()
+            }
+    finally:
+        if own_session:
+            session.close()
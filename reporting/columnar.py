@@ -0,0 +1,133 @@
+"""Salidas columnares del detalle preparado y de los resúmenes (Parquet / Arrow IPC)
+
+Un directorio con detail, division_summary y lead_summary en cada formato:
+
+  - Parquet: columnas categóricas como diccionario y un row group (o más)
+    por Year, así un lector que filtra por año salta los demás.
+  - Arrow IPC (archivo .arrow, sin compresión): un record batch por Year;
+    se puede abrir con memory map sin copiar (pa.memory_map + ipc.open_file).
+  - CSV comprimido (.csv.gz) opcional, para herramientas sin Arrow.
+
+read_columnar devuelve el frame preparado y los resúmenes tal como se
+escribieron (categorías, int16/int8, fechas), listos para generar los
+workbooks sin volver a descargar, preparar ni agregar.
+"""
+import os
+
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv': '.csv.gz',
+}
+
+DEFAULT_FORMATS = ['parquet', 'arrow']
+
+# Resumen por dimensión -> nombre de la tabla
+SUMMARY_TABLES = {
+    'Division': 'division_summary',
+    'LeadType': 'lead_summary',
+}
+
+DETAIL_TABLE = 'detail'
+
+
+def table_path(directory, table, fmt):
+    return os.path.join(directory, table + FORMATS[fmt])
+
+
+def _year_slices(table):
+    """Cortes [inicio, fin) de una tabla ordenada por Year, uno por año"""
+    years = table.column('Year').to_numpy(zero_copy_only=False)
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(years) else np.array([], dtype=int)
+    stops = np.r_[starts[1:], len(years)]
+    return [table.slice(start, stop - start) for start, stop in zip(starts, stops)]
+
+
+def _write_table(table, path, fmt, by_year=False):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parts = _year_slices(table) if by_year and len(table) else [table]
+    if fmt == 'parquet':
+        # Cada write_table cierra sus row groups: ninguno mezcla años
+        with pq.ParquetWriter(path, table.schema) as writer:
+            for part in parts:
+                writer.write_table(part)
+    elif fmt == 'arrow':
+        with pa.ipc.new_file(path, table.schema) as writer:
+            for part in parts:
+                writer.write_table(part)
+    else:
+        table.to_pandas().to_csv(path, index=False)
+
+
+def write_columnar(df_prepared, directory, summaries, formats=None):
+    """Escribe el detalle preparado y `summaries` ({dim: resumen}) en `directory`
+
+    El detalle se ordena por Year (orden estable) antes de escribir. Devuelve
+    la lista de archivos escritos.
+    """
+    import pyarrow as pa
+
+    formats = list(DEFAULT_FORMATS if formats is None else formats)
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Formato no soportado: {', '.join(sorted(unknown))} (opciones: {', '.join(FORMATS)})")
+    os.makedirs(directory, exist_ok=True)
+
+    order = np.argsort(df_prepared['Year'].to_numpy(), kind='stable')
+    tables = {DETAIL_TABLE: pa.Table.from_pandas(df_prepared.iloc[order], preserve_index=False)}
+    for dim, summary in summaries.items():
+        tables[SUMMARY_TABLES[dim]] = pa.Table.from_pandas(summary.reset_index(drop=True), preserve_index=False)
+
+    written = []
+    for name, table in tables.items():
+        for fmt in formats:
+            path = table_path(directory, name, fmt)
+            _write_table(table, path, fmt, by_year=name == DETAIL_TABLE)
+            written.append(path)
+    return written
+
+
+def open_arrow(path):
+    """Tabla Arrow de un archivo .arrow abierto con memory map (sin copiar los buffers)"""
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def read_table(directory, table, fmt='arrow', years=None):
+    """DataFrame de una tabla escrita por write_columnar (`years` filtra por Year)"""
+    path = table_path(directory, table, fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        filters = [('Year', 'in', list(years))] if years else None
+        return pq.read_table(path, filters=filters).to_pandas()
+    if fmt == 'arrow':
+        df = open_arrow(path).to_pandas()
+    else:
+        df = pd.read_csv(path)
+    if years:
+        df = df[df['Year'].isin(years)].reset_index(drop=True)
+    return df
+
+
+def read_columnar(directory, fmt=None, years=None):
+    """(frame preparado, {dim: resumen}) desde `directory`
+
+    Sin `fmt` se usa Arrow si está, si no Parquet. Con `years` los
+    resúmenes también se filtran (sus filas TOTAL son por año).
+    """
+    if fmt is None:
+        fmt = next((f for f in ('arrow', 'parquet') if os.path.exists(table_path(directory, DETAIL_TABLE, f))),
+                   'parquet')
+    detail = read_table(directory, DETAIL_TABLE, fmt, years)
+    summaries = {dim: read_table(directory, name, fmt, years) for dim, name in SUMMARY_TABLES.items()
+                 if os.path.exists(table_path(directory, name, fmt))}
+    return detail, summaries
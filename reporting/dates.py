@@ -0,0 +1,113 @@
+"""Parseo rápido de las fechas del API (Created_Date, LastStageChangeDate)
+
+El API siempre envía 'YYYY-MM-DDTHH:MM:SS.000Z' (Date.toISOString).
+pd.to_datetime(..., utc=True) tiene que inferir el formato y con nulos o
+formatos mezclados termina parseando elemento por elemento (~1.3 s por
+millón de filas).
+
+Aquí el texto se convierte con el parser ISO-8601 de Arrow (un cast
+vectorizado, ~0.04 s por millón). Solo si alguna fila no es ISO-8601 con
+zona se usa pd.to_datetime, una vez por valor distinto (muchas
+oportunidades comparten el mismo LastStageChangeDate por actualizaciones
+masivas), con el mismo resultado que antes: datetime sin zona horaria en
+UTC y NaT para lo que no se puede parsear. Sin pyarrow se usa siempre
+pd.to_datetime.
+
+to_epoch devuelve directamente enteros (segundos o milisegundos desde
+1970) para los consumidores que no necesitan datetime (ej. SQLite).
+"""
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Mismo tipo que deja pd.to_datetime(..., utc=True).dt.tz_localize(None) en pandas 3
+RESULT_DTYPE = 'datetime64[us]'
+
+EPOCH_UNITS = {'s': 1000, 'ms': 1}
+
+# np.iinfo('int64').min: NaT al ver los enteros como datetime64
+_NAT = -2 ** 63
+
+
+def _legacy(values):
+    return pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+def _take(parsed, codes):
+    """Reparte las fechas parseadas de cada valor distinto según `codes` (-1 = NaT)"""
+    result = np.full(len(codes), np.datetime64('NaT'), dtype=RESULT_DTYPE)
+    valid = codes >= 0
+    result[valid] = parsed[codes[valid]]
+    return result
+
+
+def _cached_legacy(values):
+    """pd.to_datetime una sola vez por valor distinto"""
+    codes, uniques = pd.factorize(values)
+    return _take(_legacy(pd.Series(uniques, dtype=object)).to_numpy(dtype=RESULT_DTYPE), codes)
+
+
+def _parse_ms(values):
+    """Milisegundos UTC desde 1970 como array int64 de Arrow (nulos donde no hay fecha)
+
+    Devuelve None si el texto no se puede convertir con Arrow (o no hay pyarrow).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return None
+    try:
+        text = pa.array(values, type=pa.large_string(), from_pandas=True)
+        return pc.cast(text, pa.timestamp('ms', tz='UTC')).cast(pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def parse_api_dates(values):
+    """Convierte texto ISO-8601 del API a datetime64[us] sin zona (UTC), NaT si no es fecha
+
+    Equivale a pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None).
+    Acepta Series de texto (object o string), categóricas (se parsean solo
+    las categorías) o ya datetime.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        if getattr(values.dt, 'tz', None) is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        return values.astype(RESULT_DTYPE)
+    categorical = isinstance(values.dtype, pd.CategoricalDtype)
+    millis = _parse_ms(values.cat.categories if categorical else values)
+    if millis is None:
+        # pd.to_datetime infiere el formato del primer valor: se respeta el orden de aparición
+        result = _cached_legacy(values.astype(object) if categorical else values)
+    else:
+        # Los nulos pasan a NaT (el mínimo de int64) sin convertir a float
+        result = millis.fill_null(_NAT).to_numpy().view('datetime64[ms]').astype(RESULT_DTYPE)
+        if categorical:
+            result = _take(result, values.cat.codes.to_numpy())
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def to_epoch(values, unit='s'):
+    """Fechas del API (texto o datetime) como enteros desde 1970 en UTC (Int64, <NA> sin fecha)
+
+    `unit` es 's' o 'ms'; los segundos se truncan hacia abajo.
+    """
+    if unit not in EPOCH_UNITS:
+        raise ValueError(f"Unidad no soportada: {unit} (opciones: {', '.join(EPOCH_UNITS)})")
+    values = pd.Series(values)
+    millis = None
+    if not pd.api.types.is_datetime64_any_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+        # Sin pasar por datetime64: el cast de Arrow ya da milisegundos
+        millis = _parse_ms(values)
+    if millis is not None:
+        mask = millis.is_null().to_numpy(zero_copy_only=False)
+        ints = millis.fill_null(0).to_numpy()
+    else:
+        dates = parse_api_dates(values)
+        mask = dates.isna().to_numpy()
+        ints = dates.to_numpy().astype('datetime64[ms]').view('int64')
+    ints = ints // EPOCH_UNITS[unit]
+    return pd.Series(pd.arrays.IntegerArray(ints, mask), index=values.index, name=values.name)
@@ -0,0 +1,149 @@
+"""Índice invertido para drill-through desde las celdas de los resúmenes
+
+Para cada dimensión el detalle preparado se ordena una vez por
+(Year, dim, clase de stage); cada celda del resumen
+(Year, valor de dim, Approved/Lost/Open/Total) queda como un rango de esa
+permutación. Las posiciones se guardan como arrays int32 ordenados, así que
+buscar una celda cuesta O(resultado) y no O(todas las filas).
+
+Si la hoja de datos se escribe en ese mismo orden, cada celda apunta a un
+bloque contiguo de filas y se puede enlazar con un hipervínculo.
+"""
+from reporting.lazy import lazy_import
+from reporting.rollup import DEFAULT_DIMENSIONS, STAGE_CLASSES, stage_class
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+BUCKETS = STAGE_CLASSES + ['Total']
+
+# Columna del resumen -> bucket de drill-through
+METRIC_BUCKETS = {
+    'Total_Opp': 'Total',
+    'Approved': 'Approved',
+    'Lost': 'Lost',
+    'Open': 'Open',
+    'Approved_Revenue': 'Approved',
+    'Lost_Revenue': 'Lost',
+    'Open_Revenue': 'Open',
+    'Total_Amount': 'Total',
+}
+
+# Columnas de las hojas Drill_<dim> (dimensiones que no ordenan la hoja de datos)
+DRILL_COLUMNS = ['Id', 'Name', 'Year', 'Division', 'LeadType', 'StageName', 'Amount',
+                 'Created_Date', 'LastStageChangeDate']
+
+
+class DrillIndex:
+    """Posiciones del frame preparado por (dim, Year, valor, bucket)
+
+    `lookup` devuelve posiciones (int32, ordenadas) dentro de `df`;
+    `order(dim)` es la permutación para escribir la hoja de datos y
+    `sheet_block` el rango contiguo de esa permutación para una celda.
+    """
+
+    def __init__(self, df, dims=None, total_label='TOTAL'):
+        self.dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+        self.total_label = total_label
+        self.size = len(df)
+        self._orders = {}
+        self._blocks = {}
+        self._years = {}
+        self._groups = {}
+
+        year_codes, year_values = pd.factorize(df['Year'], sort=True)
+        year_values = [int(year) for year in year_values]
+        stages = np.asarray(stage_class(df['StageName']).codes, dtype=np.int64)
+
+        for dim in self.dims:
+            dim_codes, dim_values = pd.factorize(df[dim], sort=True)
+            dim_values = list(dim_values)
+            order = np.lexsort((stages, dim_codes, year_codes)).astype(np.int32)
+
+            # Clave compuesta ya ordenada: los cambios marcan los límites de cada grupo
+            key = ((year_codes.astype(np.int64) * (len(dim_values) + 1) + dim_codes + 1)
+                   * len(STAGE_CLASSES) + stages)[order]
+            starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+            stops = np.r_[starts[1:], len(key)]
+
+            blocks = {}
+            years = {}
+            groups = []
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                position = order[start]
+                year = year_values[year_codes[position]]
+                first, last = years.get(year, (start, stop))
+                years[year] = (min(first, start), max(last, stop))
+                groups.append((year, STAGE_CLASSES[stages[position]], start, stop))
+
+                if dim_codes[position] < 0:
+                    continue
+                value = dim_values[dim_codes[position]]
+                blocks[(year, value, STAGE_CLASSES[stages[position]])] = (start, stop)
+                first, last = blocks.get((year, value, 'Total'), (start, stop))
+                blocks[(year, value, 'Total')] = (min(first, start), max(last, stop))
+
+            self._orders[dim] = order
+            self._blocks[dim] = blocks
+            self._years[dim] = years
+            self._groups[dim] = groups
+
+    def order(self, dim):
+        """Permutación (int32) que ordena el frame por (Year, dim, clase de stage)"""
+        return self._orders[dim]
+
+    def keys(self, dim):
+        """Celdas (Year, valor, bucket) indexadas para `dim`, sin los totales por año"""
+        return list(self._blocks[dim])
+
+    def sheet_block(self, dim, year, value, bucket='Total'):
+        """Rango [inicio, fin) de order(dim) para la celda, o None si no es contiguo"""
+        if bucket not in BUCKETS:
+            raise ValueError(f"Bucket desconocido: {bucket} (opciones: {', '.join(BUCKETS)})")
+        if value == self.total_label:
+            return self._years[dim].get(year) if bucket == 'Total' else None
+        return self._blocks[dim].get((year, value, bucket))
+
+    def lookup(self, dim, year, value, bucket='Total'):
+        """Posiciones en el frame preparado (int32 ordenado) de la celda (Year, valor, bucket)"""
+        order = self._orders[dim]
+        block = self.sheet_block(dim, year, value, bucket)
+        if block is not None:
+            positions = order[block[0]:block[1]]
+            # Un solo grupo ya sale ordenado (lexsort es estable); Total une varios
+            return np.sort(positions) if bucket == 'Total' else positions
+        if value != self.total_label:
+            return np.empty(0, dtype=np.int32)
+
+        # Total del año para una clase de stage: une los grupos de todos los valores
+        # (incluye filas sin valor en la dimensión)
+        covered = [order[start:stop] for y, name, start, stop in self._groups[dim]
+                   if y == year and name == bucket]
+        return np.sort(np.concatenate(covered)) if covered else np.empty(0, dtype=np.int32)
+
+    def rows(self, df, dim, year, value, bucket='Total'):
+        """Filas de `df` (el frame indexado) para la celda"""
+        return df.iloc[self.lookup(dim, year, value, bucket)]
+
+
+def add_drill_links(sheet, summary, index, dim, data_sheet, data_columns):
+    """Enlaza cada métrica de `summary` (escrito desde A1) con su bloque en `data_sheet`
+
+    `data_sheet` debe estar escrita en index.order(dim) con encabezado en la
+    fila 1 y `data_columns` columnas.
+    """
+    from openpyxl.utils import get_column_letter
+    from openpyxl.worksheet.hyperlink import Hyperlink
+
+    last_column = get_column_letter(data_columns)
+    metric_columns = [(summary.columns.get_loc(col) + 1, bucket)
+                      for col, bucket in METRIC_BUCKETS.items() if col in summary.columns]
+    keys = zip(summary['Year'].tolist(), summary[dim].tolist())
+    for row_num, (year, value) in enumerate(keys, 2):
+        for col_num, bucket in metric_columns:
+            block = index.sheet_block(dim, int(year), value, bucket)
+            if block is None or block[0] == block[1]:
+                continue
+            cell = sheet.cell(row=row_num, column=col_num)
+            cell.hyperlink = Hyperlink(ref=cell.coordinate,
+                                       location=f"'{data_sheet}'!A{block[0] + 2}:{last_column}{block[1] + 1}")
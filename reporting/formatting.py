@@ -0,0 +1,85 @@
+"""Formato de las hojas de resumen (Division_Summary / Lead_Summary) con openpyxl
+
+Los estilos se registran una vez como NamedStyle y se asignan por columna,
+los anchos se calculan desde el DataFrame antes de escribir y las filas
+TOTAL se resaltan con formato condicional (una sola regla por hoja).
+"""
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+
+CURRENCY_COLUMNS = ['Approved_Revenue', 'Lost_Revenue', 'Open_Revenue', 'Total_Amount', 'Average_Ticket']
+PERCENT_COLUMNS = ['CloseRate_Std', 'CloseRate_NoLost']
+
+MAX_COLUMN_WIDTH = 30
+
+
+def _summary_styles():
+    header = NamedStyle(name='summary_header')
+    header.font = Font(bold=True, color="FFFFFF")
+    header.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header.alignment = Alignment(horizontal="center", vertical="center")
+
+    currency = NamedStyle(name='summary_currency', number_format='$#,##0')
+    percent = NamedStyle(name='summary_percent', number_format='0.00%')
+    return [header, currency, percent]
+
+
+def register_styles(workbook):
+    """Registra los estilos con nombre del resumen (una vez por workbook)"""
+    existing = set(workbook.named_styles)
+    for style in _summary_styles():
+        if style.name not in existing:
+            workbook.add_named_style(style)
+
+
+def prepare_summary_for_excel(pivot):
+    """Copia del resumen con los close rates como fracción (0.2536 -> 25.36%)"""
+    excel = pivot.copy()
+    for col in PERCENT_COLUMNS:
+        if col in excel.columns:
+            excel[col] = excel[col] / 100
+    return excel
+
+
+def column_widths(df, max_width=MAX_COLUMN_WIDTH):
+    """Ancho de cada columna según el texto más largo (encabezado incluido)"""
+    widths = {}
+    for idx, col in enumerate(df.columns, 1):
+        # Con pandas 3 astype(str) deja los NaN como faltantes: una columna vacía mide 0
+        lengths = df[col].astype(str).str.len()
+        longest = int(lengths.max()) if lengths.notna().any() else 0
+        widths[get_column_letter(idx)] = min(max(len(str(col)), longest) + 2, max_width)
+    return widths
+
+
+def format_summary_sheet(sheet, df):
+    """Aplica formato profesional a una hoja de summary escrita desde `df`"""
+    register_styles(sheet.parent)
+    last_row = len(df) + 1
+    last_col = get_column_letter(len(df.columns))
+
+    # Encabezados
+    for cell in sheet[1]:
+        cell.style = 'summary_header'
+
+    # Formatos numéricos solo en sus columnas
+    for names, style in ((CURRENCY_COLUMNS, 'summary_currency'), (PERCENT_COLUMNS, 'summary_percent')):
+        for name in names:
+            if name not in df.columns:
+                continue
+            col_idx = df.columns.get_loc(name) + 1
+            for (cell,) in sheet.iter_rows(min_row=2, max_row=last_row, min_col=col_idx, max_col=col_idx):
+                cell.style = style
+
+    # Resaltar filas de TOTAL (columna de dimensión B, o C si hay dos dimensiones)
+    if last_row > 1:
+        sheet.conditional_formatting.add(
+            f'A2:{last_col}{last_row}',
+            FormulaRule(formula=['OR($B2="TOTAL",$C2="TOTAL")'],
+                        fill=PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid"),
+                        font=Font(bold=True)))
+
+    # Ajustar ancho de columnas
+    for letter, width in column_widths(df).items():
+        sheet.column_dimensions[letter].width = width
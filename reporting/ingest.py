@@ -0,0 +1,222 @@
+"""Ingesta en streaming de /api/opportunity-detail hacia columnas tipadas
+
+La respuesta del API ({"success": ..., "count": ..., "data": [...]}) se
+parsea de forma incremental: los registros de "data" se decodifican uno a
+uno y se acumulan en páginas que se convierten a arrays por columna, así el
+pico de memoria es proporcional a una página y no al historial completo.
+"""
+import codecs
+import json
+from itertools import islice
+
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DETAIL_URL = 'http://localhost:3001/api/opportunity-detail'
+
+# Registros por página al convertir a columnas
+DEFAULT_PAGE_SIZE = 50_000
+
+# Tamaño de los bloques leídos del socket / archivo
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Columnas numéricas del detalle (el resto se guarda como texto)
+NUMERIC_COLUMNS = {
+    'Amount': 'float64',
+    'YearValue': 'int64',
+}
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+
+class _TextStream:
+    """Buffer de texto alimentado por bloques de bytes"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Lee un bloque más; devuelve False si ya no hay datos"""
+        if self.exhausted:
+            return False
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            # Descartar lo ya consumido para no retener todo el payload
+            self.buffer = self.buffer[self.pos:] + text
+            self.pos = 0
+            return True
+        self.buffer = self.buffer[self.pos:] + self._utf8.decode(b'', final=True)
+        self.pos = 0
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """Devuelve el siguiente carácter significativo (sin consumirlo)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError('Respuesta JSON incompleta')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON inesperado: se esperaba '{char}' en la posición {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica el siguiente valor JSON completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # Un número al final del buffer puede estar cortado: pedir más datos
+                if end < len(self.buffer) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+
+def iter_response_items(chunks, array_key='data', meta=None):
+    """Itera los elementos de `array_key` de una respuesta JSON leída por bloques
+
+    Los demás campos del objeto raíz (success, count, filters...) se copian
+    en `meta` si se pasa un dict.
+    """
+    stream = _TextStream(chunks)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == array_key and stream.peek() == '[':
+            stream.pos += 1
+            if stream.peek() == ']':
+                stream.pos += 1
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.peek() == ']':
+                        stream.pos += 1
+                        break
+                    stream.expect(',')
+        else:
+            value = stream.value()
+            if meta is not None:
+                meta[key] = value
+        if stream.peek() == '}':
+            return
+        stream.expect(',')
+
+
+def _page_to_columns(page, columns):
+    """Convierte una página de registros en arrays tipados por columna"""
+    arrays = {}
+    for col in columns:
+        values = [item.get(col) for item in page]
+        dtype = NUMERIC_COLUMNS.get(col)
+        if dtype is None:
+            arrays[col] = np.array(values, dtype=object)
+        elif dtype == 'int64' and None not in values:
+            arrays[col] = np.array(values, dtype='int64')
+        else:
+            arrays[col] = np.array(values, dtype='float64')
+    return arrays
+
+
+def items_to_frame(items, page_size=DEFAULT_PAGE_SIZE):
+    """Acumula registros por páginas en columnas y construye el DataFrame final"""
+    columns = []
+    chunks = {}
+    page = []
+    rows_done = 0
+
+    def flush():
+        nonlocal rows_done
+        for item in page:
+            for col in item:
+                if col not in chunks:
+                    # Columna nueva: rellenar las páginas anteriores con vacíos
+                    columns.append(col)
+                    chunks[col] = [_page_to_columns([{}] * rows_done, [col])[col]] if rows_done else []
+        for col, array in _page_to_columns(page, columns).items():
+            chunks[col].append(array)
+        rows_done += len(page)
+        page.clear()
+
+    for item in items:
+        page.append(item)
+        if len(page) >= page_size:
+            flush()
+    if page:
+        flush()
+
+    data = {col: np.concatenate(chunks.pop(col)) for col in columns}
+    return pd.DataFrame(data, columns=columns)
+
+
+def iter_item_pages(items, page_size=DEFAULT_PAGE_SIZE):
+    """Agrupa `items` en listas de hasta `page_size` registros (la última puede ser menor)"""
+    items = iter(items)
+    while page := list(islice(items, page_size)):
+        yield page
+
+
+def iter_file_items(path, meta=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Itera los registros de un JSON con el formato de /api/opportunity-detail leyéndolo por bloques"""
+    def chunks():
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    return
+                yield block
+
+    return iter_response_items(chunks(), meta=meta)
+
+
+def iter_url_items(url=DETAIL_URL, params=None, session=None, timeout=None, meta=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """Itera los registros de /api/opportunity-detail a medida que llegan
+
+    La conexión queda abierta mientras se consume el iterador.
+    """
+    import requests
+
+    http = session or requests
+    with http.get(url, params=params, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        yield from iter_response_items(response.iter_content(chunk_size), meta=meta)
+
+
+def read_detail_file(path, page_size=DEFAULT_PAGE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lee en streaming un JSON con el formato de /api/opportunity-detail (ej. test-response.json)"""
+    meta = {}
+    df = items_to_frame(iter_file_items(path, meta, chunk_size), page_size)
+    if meta.get('success') is False:
+        raise Exception(meta.get('error') or 'Error fetching data from API')
+    return df
+
+
+def fetch_detail_frame(url=DETAIL_URL, params=None, session=None, timeout=None,
+                       page_size=DEFAULT_PAGE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Descarga /api/opportunity-detail en streaming y lo devuelve como DataFrame"""
+    meta = {}
+    df = items_to_frame(iter_url_items(url, params, session, timeout, meta, chunk_size), page_size)
+    if meta.get('success') is False:
+        raise Exception(meta.get('error') or 'Error fetching data from API')
+    return df
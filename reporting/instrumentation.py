@@ -0,0 +1,153 @@
+"""Instrumentación opcional por etapa (tiempo, CPU, filas y pico de memoria)
+
+Las etapas del pipeline se marcan con `stage('nombre')`. Sin un registrador
+activo es un no-op; con `recording(StageRecorder())` cada etapa guarda:
+
+  - wall_s: tiempo de reloj (perf_counter)
+  - cpu_s: tiempo de CPU del proceso (process_time)
+  - rows: filas procesadas (se puede asignar dentro del bloque)
+  - peak_mb: pico de tracemalloc durante la etapa sobre lo asignado al
+    entrar (si trace_memory=True; tracemalloc hace más lento el código
+    Python y no ve la memoria de Arrow)
+
+Los registros se imprimen como tabla y se pueden agregar a un archivo JSON
+lines para el monitoreo.
+"""
+import json
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class _NullRecorder:
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        yield {'stage': name, 'rows': rows}
+
+
+class StageRecorder:
+    """Acumula un registro por etapa; las etapas pueden anidarse"""
+    enabled = True
+
+    def __init__(self, trace_memory=True, run_id=None):
+        self.trace_memory = trace_memory
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.records = []
+        self._stack = []
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': name, 'rows': rows}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        frame = {'start': 0, 'peak': 0}
+        if tracing:
+            # El pico del padre hasta aquí se conserva antes de reiniciarlo
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'start': current, 'peak': current}
+        self._stack.append(frame)
+        self.records.append(record)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            self._stack.pop()
+            record['peak_mb'] = None
+            if tracing:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = (peak - frame['start']) / 1024 / 1024
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+    def extend(self, records, prefix=''):
+        """Agrega registros de otro proceso (ej. workers del pool) con un prefijo"""
+        for record in records:
+            self.records.append(dict(record, stage=prefix + record['stage']))
+
+    def summary_table(self):
+        lines = [f"{'Etapa':<32}{'Wall (s)':>10}{'CPU (s)':>10}{'Filas':>12}{'Pico (MB)':>11}"]
+        for record in self.records:
+            rows = '-' if record['rows'] is None else f"{record['rows']:,}"
+            peak = '-' if record['peak_mb'] is None else f"{record['peak_mb']:.1f}"
+            lines.append(f"{record['stage']:<32}{record['wall_s']:>10.3f}{record['cpu_s']:>10.3f}"
+                         f"{rows:>12}{peak:>11}")
+        return '\n'.join(lines)
+
+    def write_jsonl(self, path, **fields):
+        """Agrega un JSON por etapa a `path` (con run_id, timestamp y `fields`)"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps({'run_id': self.run_id, 'timestamp': timestamp, **fields, **record}) + '\n')
+
+
+_current = _NullRecorder()
+
+
+def current():
+    return _current
+
+
+def stage(name, rows=None):
+    """Marca una etapa en el registrador activo (no-op si no hay ninguno)"""
+    return _current.stage(name, rows)
+
+
+@contextmanager
+def recording(recorder):
+    """Activa `recorder` mientras dura el bloque"""
+    global _current
+    previous, _current = _current, recorder
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        _current = previous
+
+
+def add_arguments(parser):
+    """Opciones de línea de comandos comunes a los scripts generate_*.py"""
+    group = parser.add_argument_group('instrumentación')
+    group.add_argument('--instrument', action='store_true',
+                       help='Mide cada etapa (wall, CPU, filas, pico de tracemalloc) e imprime un resumen')
+    group.add_argument('--instrument-json', metavar='FILE',
+                       help='Agrega los registros por etapa como JSON lines a FILE (implica --instrument)')
+    group.add_argument('--no-tracemalloc', action='store_true',
+                       help='No medir memoria (tracemalloc hace más lento el código Python)')
+
+
+def recorder_from_args(args):
+    """StageRecorder según las opciones de add_arguments, o None si no se pidió"""
+    if not (args.instrument or args.instrument_json):
+        return None
+    return StageRecorder(trace_memory=not args.no_tracemalloc)
+
+
+def report(recorder, args, script):
+    """Imprime la tabla y escribe el JSON lines si se pidió"""
+    print("\nINSTRUMENTACION (run " + recorder.run_id + ")")
+    print(recorder.summary_table())
+    if args.instrument_json:
+        recorder.write_jsonl(args.instrument_json, script=script)
+        print(f"[OK] Registros agregados a {args.instrument_json}")
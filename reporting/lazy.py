@@ -0,0 +1,41 @@
+"""Importación diferida de dependencias pesadas (pandas, numpy, requests)
+
+`pd = lazy_import('pandas')` deja en el módulo un objeto que importa
+pandas recién en el primer acceso a un atributo (pd.DataFrame, ...). Así
+importar reporting.* (y con eso `--help` o el armado de argumentos de los
+scripts) no carga pandas ni numpy; lo paga la primera etapa que los usa.
+
+La importación real es un `import` normal (__import__): toma el lock de
+importación, así que es segura entre threads, y aparece en
+`python -X importtime` (importlib.import_module no registra ahí el módulo
+de primer nivel). Después del primer acceso los atributos del módulo se
+copian al objeto y el acceso cuesta lo mismo que con el import normal.
+
+Los módulos que solo se usan al escribir Excel (reporting.formatting,
+reporting.pivot_cache, reporting.raw_export: openpyxl / xlsxwriter) no
+usan esto: los scripts los importan dentro de las funciones que escriben
+el workbook.
+"""
+import sys
+
+
+class LazyModule:
+    """Módulo `name` que se importa en el primer acceso a un atributo"""
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        # Solo se llama para atributos que todavía no están en el objeto
+        __import__(self.__name)
+        module = sys.modules[self.__name]
+        self.__dict__.update(vars(module))
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name!r}>'
+
+
+def lazy_import(name):
+    """El módulo si ya está importado; si no, un LazyModule que lo importa al usarlo"""
+    return sys.modules.get(name) or LazyModule(name)
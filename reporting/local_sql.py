@@ -0,0 +1,156 @@
+"""Resúmenes por división / lead type con SQL sobre una copia local del detalle
+
+Carga el detalle (test-response.json, snapshot Parquet o un DataFrame) en
+un motor embebido y ejecuta el equivalente de los queries de
+services/queries.js, sin depender del API. SQLite viene con Python;
+DuckDB se usa si está instalado (engine='duckdb').
+
+SQLite no tiene ROLLUP/GROUPING: el total por año se agrega con UNION ALL.
+El resultado tiene las mismas columnas y orden que reporting.rollup.rollup.
+"""
+import sqlite3
+
+from reporting.dates import parse_api_dates, to_epoch
+from reporting.lazy import lazy_import
+from reporting.rollup import DEFAULT_DIMENSIONS
+from reporting.years import DEFAULT_FALLBACK_YEAR
+
+pd = lazy_import('pandas')
+
+ENGINES = ['sqlite', 'duckdb']
+
+TABLE = 'Opportunity'
+
+DETAIL_COLUMNS = ['Id', 'StageName', 'Division', 'LeadType', 'Amount', 'Created_Date', 'LastStageChangeDate']
+
+# Año de una columna de fecha en cada motor (SQLite la guarda como epoch en segundos)
+_YEAR_OF = {
+    'sqlite': "CAST(strftime('%Y', {col}, 'unixepoch') AS INTEGER)",
+    'duckdb': 'YEAR({col})',
+}
+
+ROLLUP_QUERY = """
+WITH Base AS (
+    SELECT
+        Id,
+        StageName,
+        {dim} AS Dim,
+        COALESCE(Amount, 0) AS Amount,
+        COALESCE(
+            CASE
+                WHEN StageName IN ('Approved','Lost') AND LastStageChangeDate IS NOT NULL
+                    THEN {year_of_last_change}
+                ELSE {year_of_created}
+            END, {fallback}) AS Year
+    FROM {table}
+),
+Metrics AS (
+    SELECT Year, Dim, {metrics}
+    FROM Base
+    WHERE Dim IS NOT NULL
+    GROUP BY Year, Dim
+    UNION ALL
+    SELECT Year, '{total_label}' AS Dim, {metrics}
+    FROM Base
+    GROUP BY Year
+)
+SELECT
+    Year,
+    Dim AS {dim},
+    Total_Opp, Approved, Lost, Open,
+    Approved_Revenue, Lost_Revenue, Open_Revenue, Total_Amount,
+    ROUND(CAST(Approved AS DOUBLE) / NULLIF(Total_Opp, 0) * 100, 2) AS CloseRate_Std,
+    ROUND(CAST(Approved AS DOUBLE) / NULLIF(Total_Opp - Lost, 0) * 100, 2) AS CloseRate_NoLost,
+    COALESCE(ROUND(Approved_Revenue / NULLIF(Approved, 0), 2), 0) AS Average_Ticket
+FROM Metrics
+ORDER BY Year, Dim"""
+
+_METRICS = """COUNT(Id) AS Total_Opp,
+        SUM(CASE WHEN StageName = 'Approved' THEN 1 ELSE 0 END) AS Approved,
+        SUM(CASE WHEN StageName = 'Lost' THEN 1 ELSE 0 END) AS Lost,
+        SUM(CASE WHEN StageName IN ('Approved','Lost') THEN 0 ELSE 1 END) AS Open,
+        SUM(CASE WHEN StageName = 'Approved' THEN Amount ELSE 0 END) AS Approved_Revenue,
+        SUM(CASE WHEN StageName = 'Lost' THEN Amount ELSE 0 END) AS Lost_Revenue,
+        SUM(CASE WHEN StageName IN ('Approved','Lost') THEN 0 ELSE Amount END) AS Open_Revenue,
+        SUM(Amount) AS Total_Amount"""
+
+
+def read_detail_source(path):
+    """Lee el detalle desde un JSON con formato del API o un snapshot Parquet"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    from reporting.ingest import read_detail_file
+    return read_detail_file(path)
+
+
+def _detail_table(df, engine):
+    """Columnas del detalle que usan los queries, con fechas normalizadas a UTC sin zona"""
+    table = pd.DataFrame({col: df[col] for col in DETAIL_COLUMNS if col in df.columns})
+    for col in ('StageName', 'Division', 'LeadType', 'Id'):
+        if isinstance(table[col].dtype, pd.CategoricalDtype) or table[col].dtype != object:
+            table[col] = table[col].astype(object).where(table[col].notna(), None)
+    table['Amount'] = pd.to_numeric(table['Amount'], errors='coerce')
+    for col in ('Created_Date', 'LastStageChangeDate'):
+        table[col] = to_epoch(table[col], 's') if engine == 'sqlite' else parse_api_dates(table[col])
+    return table
+
+
+def connect(df, engine='sqlite'):
+    """Abre una base en memoria con el detalle cargado en la tabla Opportunity"""
+    if engine not in ENGINES:
+        raise ValueError(f"Motor SQL no soportado: {engine} (opciones: {', '.join(ENGINES)})")
+    table = _detail_table(df, engine)
+
+    if engine == 'duckdb':
+        import duckdb
+        con = duckdb.connect()
+        con.register('detail_frame', table)
+        con.execute(f'CREATE TABLE {TABLE} AS SELECT * FROM detail_frame')
+        con.unregister('detail_frame')
+        return con
+
+    con = sqlite3.connect(':memory:')
+    table.to_sql(TABLE, con, index=False)
+    return con
+
+
+def rollup_query(dim, engine='sqlite', fallback=DEFAULT_FALLBACK_YEAR, total_label='TOTAL'):
+    """Texto SQL de GROUP BY Year, ROLLUP(dim) para el motor indicado"""
+    year_of = _YEAR_OF[engine]
+    return ROLLUP_QUERY.format(
+        dim=dim, table=TABLE, metrics=_METRICS, total_label=total_label,
+        fallback='NULL' if fallback is None else int(fallback),
+        year_of_last_change=year_of.format(col='LastStageChangeDate'),
+        year_of_created=year_of.format(col='Created_Date'))
+
+
+def run_rollup(con, dim, engine='sqlite', **kwargs):
+    query = rollup_query(dim, engine, **kwargs)
+    if engine == 'duckdb':
+        return con.execute(query).df()
+    return pd.read_sql_query(query, con)
+
+
+def rollup_sql(df, dims=None, engine='sqlite'):
+    """Equivalente SQL de reporting.rollup.rollup_all: {dim: resumen con totales}"""
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    con = connect(df, engine)
+    try:
+        return {dim: run_rollup(con, dim, engine) for dim in dims}
+    finally:
+        con.close()
+
+
+def verify_against_pandas(df, dims=None, engine='sqlite'):
+    """Compara fila por fila los resúmenes SQL con los de pandas (AssertionError si difieren)
+
+    `df` debe venir preparado (prepare_data_for_pivot). Devuelve los resúmenes SQL.
+    """
+    from reporting.rollup import rollup_all
+
+    expected = rollup_all(df, dims)
+    result = rollup_sql(df, list(expected), engine)
+    for dim, frame in result.items():
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected[dim].reset_index(drop=True),
+                                      check_dtype=False, obj=f'{engine} rollup({dim})')
+    return result
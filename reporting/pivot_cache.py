@@ -0,0 +1,558 @@
+"""Pivot tables nativas de Excel: pivotCacheDefinition, pivotCacheRecords y pivotTable
+
+xlsxwriter no soporta pivot tables, así que el flujo es:
+
+1. build_pivot_cache(df, 'Data', axis_fields) describe el caché a partir del
+   detalle que se escribe en la hoja de datos.
+2. pivot_layout(...) arma la definición de cada pivot table y sus celdas ya
+   calculadas a partir del agregado (cubo de reporting.rollup).
+3. write_pivot_layout(worksheet, layout) escribe esas celdas con xlsxwriter.
+4. Tras workbook.close(), inject_pivot_parts(filename, cache, layouts) agrega
+   las partes XML al .xlsx.
+
+El caché se guarda completo (con registros) y las celdas de la pivot table
+ya calculadas. Mientras estas partes no se validen abriéndolas en Excel (o
+LibreOffice) el caché se marca refreshOnLoad (REFRESH_ON_LOAD): Excel lo
+reconstruye al abrir desde la hoja de datos, así una diferencia en el XML
+generado no termina en una "reparación" que borre las pivot tables.
+"""
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+import pandas as pd
+from xlsxwriter.utility import xl_cell_to_rowcol, xl_rowcol_to_cell
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+CONTENT_TYPES = {
+    'pivotCacheDefinition': 'application/vnd.openxmlformats-officedocument.spreadsheetml.pivotCacheDefinition+xml',
+    'pivotCacheRecords': 'application/vnd.openxmlformats-officedocument.spreadsheetml.pivotCacheRecords+xml',
+    'pivotTable': 'application/vnd.openxmlformats-officedocument.spreadsheetml.pivotTable+xml',
+}
+
+# Valores por defecto de las pivot tables del reporte
+DEFAULT_VALUES = [
+    ('Id', 'count', 'Count of Id', 'Count'),
+    ('Amount', 'sum', 'Sum of Amount', 'Amount'),
+]
+
+BLANK_LABEL = '(blank)'
+
+# Excel reconstruye el caché al abrir (ver docstring del módulo)
+REFRESH_ON_LOAD = True
+
+# Registros serializados a la vez al escribir pivotCacheRecords
+RECORD_BLOCK_ROWS = 100_000
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _attr(value):
+    return quoteattr(str(value))
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _field_kind(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'date'
+    if pd.api.types.is_bool_dtype(series):
+        return 'number'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'number'
+    return 'string'
+
+
+def _cache_field(name, series, shared):
+    """Describe un campo del caché (tipo, items compartidos y atributos)"""
+    kind = _field_kind(series)
+    if kind == 'number':
+        series = series.astype('float64')
+    has_blank = bool(series.isna().any())
+    present = series.dropna()
+
+    field = {'name': name, 'kind': kind, 'shared': shared, 'has_blank': has_blank, 'items': []}
+    attrs = []
+    if kind == 'number' and len(present):
+        integer = bool((present % 1 == 0).all())
+        if not has_blank:
+            attrs.append('containsSemiMixedTypes="0"')
+        attrs += ['containsString="0"', 'containsNumber="1"']
+        if integer:
+            attrs.append('containsInteger="1"')
+        attrs += [f'minValue={_attr(_number(present.min()))}', f'maxValue={_attr(_number(present.max()))}']
+    elif kind == 'date' and len(present):
+        if not has_blank:
+            attrs.append('containsSemiMixedTypes="0"')
+        attrs += ['containsNonDate="0"', 'containsDate="1"', 'containsString="0"',
+                  f'minDate="{present.min():%Y-%m-%dT%H:%M:%S}"',
+                  f'maxDate="{present.max():%Y-%m-%dT%H:%M:%S}"']
+    if has_blank:
+        attrs.append('containsBlank="1"')
+
+    if shared:
+        items = sorted(present.unique().tolist())
+        field['items'] = items + ([None] if has_blank else [])
+        attrs.append(f'count="{len(field["items"])}"')
+    field['attrs'] = attrs
+    return field
+
+
+def build_pivot_cache(df, sheet_name, axis_fields, cache_id=1, refresh_on_load=None):
+    """Describe el caché de pivot para `df` escrito en `sheet_name` desde A1
+
+    `axis_fields` son las columnas que se usan como filas/columnas de alguna
+    pivot table: sus valores se enumeran como items compartidos.
+    `refresh_on_load` (por defecto REFRESH_ON_LOAD) pide a Excel reconstruir
+    el caché al abrir.
+    """
+    if refresh_on_load is None:
+        refresh_on_load = REFRESH_ON_LOAD
+    fields = [_cache_field(str(col), df[col], col in axis_fields) for col in df.columns]
+    last_cell = xl_rowcol_to_cell(len(df), len(df.columns) - 1)
+    return {
+        'id': cache_id,
+        'df': df,
+        'sheet': sheet_name,
+        'ref': f'A1:{last_cell}',
+        'fields': fields,
+        'index': {field['name']: i for i, field in enumerate(fields)},
+        'refresh_on_load': refresh_on_load,
+    }
+
+
+def _item_index(field):
+    return {value: i for i, value in enumerate(field['items'])}
+
+
+def _label(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return BLANK_LABEL
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _key(value):
+    """Normaliza NaN a None para buscar en los items compartidos"""
+    return None if pd.isna(value) else value
+
+
+def pivot_layout(cache, agg, name, rows, column, values=None, location='A3', pivot_id=1):
+    """Calcula la definición XML y las celdas de una pivot table (layout compacto)
+
+    `agg` es el agregado con columnas rows + [column] + las columnas de
+    valores (ver DEFAULT_VALUES: Count y Amount del cubo de reporting.rollup).
+    """
+    values = values or DEFAULT_VALUES
+    n_values = len(values)
+    fields = cache['fields']
+    row_fields = [fields[cache['index'][r]] for r in rows]
+    col_field = fields[cache['index'][column]]
+    col_positions = _item_index(col_field)
+
+    agg = agg.copy()
+    for col in rows + [column]:
+        agg[col] = agg[col].astype(object).where(agg[col].notna(), None)
+    agg_columns = [agg_col for *_, agg_col in values]
+
+    # Items de columna presentes en los datos (en orden de items compartidos)
+    col_items = sorted({_key(v) for v in agg[column]}, key=lambda v: col_positions[v])
+
+    # Filas: recorrido en profundidad con subtotal arriba (layout compacto de Excel)
+    row_entries = []
+
+    def walk(frame, level, prefix):
+        positions = _item_index(row_fields[level])
+        keys = sorted({_key(v) for v in frame[rows[level]]}, key=lambda v: positions[v])
+        for key in keys:
+            sub = frame[frame[rows[level]].map(_key) == key] if key is not None else frame[frame[rows[level]].isna()]
+            row_entries.append((level, prefix + (positions[key],), key, sub))
+            if level + 1 < len(rows):
+                walk(sub, level + 1, prefix + (positions[key],))
+
+    walk(agg, 0, ())
+
+    def row_values(sub):
+        by_col = sub.groupby(sub[column].map(lambda v: col_positions[_key(v)]))[agg_columns].sum()
+        cells = []
+        for item in col_items:
+            pos = col_positions[item]
+            for agg_col in agg_columns:
+                cells.append(by_col.at[pos, agg_col] if pos in by_col.index else None)
+        cells += [sub[agg_col].sum() for agg_col in agg_columns]
+        return cells
+
+    header_rows = 3 if n_values > 1 else 2
+    n_cols = 1 + (len(col_items) + 1) * n_values
+    n_rows = header_rows + len(row_entries) + 1
+
+    # Celdas renderizadas (fila, columna relativas a location)
+    cells = []
+    if n_values > 1:
+        cells.append((0, 1, 'Column Labels', 'header'))
+        for ci, item in enumerate(col_items):
+            cells.append((1, 1 + ci * n_values, _label(item), 'header'))
+        for d, (_, _, value_name, _) in enumerate(values):
+            cells.append((1, 1 + len(col_items) * n_values + d, f'Total {value_name}', 'header'))
+        cells.append((2, 0, 'Row Labels', 'header'))
+        for ci in range(len(col_items)):
+            for d, (_, _, value_name, _) in enumerate(values):
+                cells.append((2, 1 + ci * n_values + d, value_name, 'header'))
+    else:
+        cells.append((0, 0, values[0][2], 'header'))
+        cells.append((0, 1, 'Column Labels', 'header'))
+        cells.append((1, 0, 'Row Labels', 'header'))
+        for ci, item in enumerate(col_items):
+            cells.append((1, 1 + ci, _label(item), 'header'))
+        cells.append((1, 1 + len(col_items), 'Grand Total', 'header'))
+
+    for r, (level, _, key, sub) in enumerate(row_entries, header_rows):
+        kind = 'subtotal' if level + 1 < len(rows) else 'item'
+        cells.append((r, 0, _label(key), kind + '_label'))
+        for c, value in enumerate(row_values(sub), 1):
+            if value is not None:
+                cells.append((r, c, value, f'{kind}_{agg_columns[(c - 1) % n_values]}'))
+    grand_row = header_rows + len(row_entries)
+    cells.append((grand_row, 0, 'Grand Total', 'grand_label'))
+    for c, value in enumerate(row_values(agg), 1):
+        if value is not None:
+            cells.append((grand_row, c, value, f'grand_{agg_columns[(c - 1) % n_values]}'))
+
+    # rowItems / colItems
+    row_items = []
+    previous = ()
+    for level, path, _, _ in row_entries:
+        repeated = 0
+        while repeated < len(previous) and repeated < len(path) - 1 and previous[repeated] == path[repeated]:
+            repeated += 1
+        xs = ''.join('<x/>' if p == 0 else f'<x v="{p}"/>' for p in path[repeated:])
+        row_items.append(f'<i r="{repeated}">{xs}</i>' if repeated else f'<i>{xs}</i>')
+        previous = path
+    row_items.append('<i t="grand"><x/></i>')
+
+    col_items_xml = []
+    for item in col_items:
+        pos = col_positions[item]
+        x = '<x/>' if pos == 0 else f'<x v="{pos}"/>'
+        if n_values > 1:
+            col_items_xml.append(f'<i>{x}<x/></i>')
+            for d in range(1, n_values):
+                col_items_xml.append(f'<i r="1" i="{d}"><x v="{d}"/></i>')
+        else:
+            col_items_xml.append(f'<i>{x}</i>')
+    for d in range(n_values):
+        col_items_xml.append(f'<i t="grand" i="{d}"><x/></i>' if d else '<i t="grand"><x/></i>')
+
+    # pivotFields: uno por campo del caché
+    data_fields = {cache['index'][field] for field, *_ in values}
+    axis = {cache['index'][r]: 'axisRow' for r in rows}
+    axis[cache['index'][column]] = 'axisCol'
+    pivot_fields = []
+    for i, field in enumerate(fields):
+        attrs = []
+        if i in axis:
+            attrs.append(f'axis="{axis[i]}"')
+        if i in data_fields:
+            attrs.append('dataField="1"')
+        attrs.append('showAll="0"')
+        if i in axis:
+            items = ''.join(f'<item x="{k}"/>' for k in range(len(field['items'])))
+            pivot_fields.append(f'<pivotField {" ".join(attrs)}><items count="{len(field["items"]) + 1}">'
+                                f'{items}<item t="default"/></items></pivotField>')
+        else:
+            pivot_fields.append(f'<pivotField {" ".join(attrs)}/>')
+
+    row_fields_xml = ''.join(f'<field x="{cache["index"][r]}"/>' for r in rows)
+    col_fields = [f'<field x="{cache["index"][column]}"/>'] + (['<field x="-2"/>'] if n_values > 1 else [])
+    data_fields_xml = ''.join(
+        f'<dataField name={_attr(value_name)} fld="{cache["index"][field]}"'
+        f'{"" if subtotal == "sum" else f" subtotal={_attr(subtotal)}"} baseField="0" baseItem="0"/>'
+        for field, subtotal, value_name, _ in values)
+
+    start_row, start_col = xl_cell_to_rowcol(location)
+    ref = (f'{xl_rowcol_to_cell(start_row, start_col)}:'
+           f'{xl_rowcol_to_cell(start_row + n_rows - 1, start_col + n_cols - 1)}')
+
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<pivotTableDefinition xmlns="{MAIN_NS}" name={_attr(name)} cacheId="{cache["id"]}" '
+        'applyNumberFormats="0" applyBorderFormats="0" applyFontFormats="0" applyPatternFormats="0" '
+        'applyAlignmentFormats="0" applyWidthHeightFormats="1" dataCaption="Values" updatedVersion="6" '
+        'minRefreshableVersion="3" useAutoFormatting="1" itemPrintTitles="1" createdVersion="6" indent="0" '
+        'outline="1" outlineData="1" multipleFieldFilters="0">'
+        f'<location ref="{ref}" firstHeaderRow="1" firstDataRow="{header_rows}" firstDataCol="1"/>'
+        f'<pivotFields count="{len(pivot_fields)}">{"".join(pivot_fields)}</pivotFields>'
+        f'<rowFields count="{len(rows)}">{row_fields_xml}</rowFields>'
+        f'<rowItems count="{len(row_items)}">{"".join(row_items)}</rowItems>'
+        f'<colFields count="{len(col_fields)}">{"".join(col_fields)}</colFields>'
+        f'<colItems count="{len(col_items_xml)}">{"".join(col_items_xml)}</colItems>'
+        f'<dataFields count="{n_values}">{data_fields_xml}</dataFields>'
+        '<pivotTableStyleInfo name="PivotStyleLight16" showRowHeaders="1" showColHeaders="1" '
+        'showRowStripes="0" showColStripes="0" showLastColumn="1"/>'
+        '</pivotTableDefinition>'
+    )
+    return {
+        'id': pivot_id,
+        'name': name,
+        'location': (start_row, start_col),
+        'cells': cells,
+        'xml': xml,
+        'size': (n_rows, n_cols),
+    }
+
+
+def write_pivot_layout(worksheet, layout, formats=None):
+    """Escribe con xlsxwriter las celdas ya calculadas de una pivot table
+
+    `formats` mapea el tipo de celda ('header', 'subtotal_label',
+    'grand_Amount', 'item_Count', ...) a un formato de xlsxwriter.
+    """
+    formats = formats or {}
+    start_row, start_col = layout['location']
+    for row, col, value, kind in sorted(layout['cells'], key=lambda cell: (cell[0], cell[1])):
+        fmt = formats.get(kind) or formats.get(kind.split('_', 1)[-1])
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            worksheet.write_number(start_row + row, start_col + col, float(value), fmt)
+        else:
+            worksheet.write_string(start_row + row, start_col + col, str(value), fmt)
+    worksheet.set_column(start_col, start_col, 24)
+    worksheet.set_column(start_col + 1, start_col + layout['size'][1] - 1, 14)
+
+
+def _definition_xml(cache, records_rid):
+    fields_xml = []
+    for field in cache['fields']:
+        if field['shared'] and field['items']:
+            items = []
+            for value in field['items']:
+                if value is None:
+                    items.append('<m/>')
+                elif field['kind'] == 'number':
+                    items.append(f'<n v="{_number(value)}"/>')
+                elif field['kind'] == 'date':
+                    items.append(f'<d v="{pd.Timestamp(value):%Y-%m-%dT%H:%M:%S}"/>')
+                else:
+                    items.append(f'<s v={_attr(value)}/>')
+            shared = f'<sharedItems {" ".join(field["attrs"])}>{"".join(items)}</sharedItems>'
+        elif field['attrs']:
+            shared = f'<sharedItems {" ".join(field["attrs"])}/>'
+        else:
+            shared = '<sharedItems/>'
+        fields_xml.append(f'<cacheField name={_attr(field["name"])} numFmtId="0">{shared}</cacheField>')
+
+    refreshed = (datetime.now() - _EXCEL_EPOCH).total_seconds() / 86400
+    refresh_attr = ' refreshOnLoad="1"' if cache['refresh_on_load'] else ''
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<pivotCacheDefinition xmlns="{MAIN_NS}" xmlns:r="{REL_NS}" r:id="{records_rid}" '
+        f'refreshedBy="generate_pivot" refreshedDate="{refreshed:.6f}" createdVersion="6" '
+        f'refreshedVersion="6" minRefreshableVersion="3" recordCount="{len(cache["df"])}"{refresh_attr}>'
+        f'<cacheSource type="worksheet"><worksheetSource ref="{cache["ref"]}" sheet={_attr(cache["sheet"])}/></cacheSource>'
+        f'<cacheFields count="{len(fields_xml)}">{"".join(fields_xml)}</cacheFields>'
+        '</pivotCacheDefinition>'
+    )
+
+
+def _encode_column(field, series):
+    """Serializa una columna completa a tokens XML de registro (vectorizado)"""
+    missing = series.isna()
+    if field['shared']:
+        codes = pd.Categorical(series, categories=[v for v in field['items'] if v is not None]).codes
+        codes = np.where(missing, len(field['items']) - 1, codes)
+        tokens = pd.Series('<x v="' + codes.astype(str).astype(object) + '"/>', index=series.index)
+        return tokens.where(codes != 0, '<x/>')
+    if field['kind'] == 'number':
+        tokens = '<n v="' + series.astype('float64').astype(str) + '"/>'
+    elif field['kind'] == 'date':
+        tokens = '<d v="' + series.dt.strftime('%Y-%m-%dT%H:%M:%S') + '"/>'
+    else:
+        text = series.astype(object).where(~missing, '').astype(str)
+        for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')):
+            text = text.str.replace(char, entity, regex=False)
+        tokens = '<s v="' + text + '"/>'
+    return tokens.astype(object).where(~missing, '<m/>')
+
+
+def _write_records(handle, cache):
+    df = cache['df']
+    handle.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  f'<pivotCacheRecords xmlns="{MAIN_NS}" xmlns:r="{REL_NS}" count="{len(df)}">').encode('utf-8'))
+    for start in range(0, len(df), RECORD_BLOCK_ROWS):
+        block = df.iloc[start:start + RECORD_BLOCK_ROWS]
+        rows = pd.Series('<r>', index=block.index, dtype=object)
+        for field, col in zip(cache['fields'], block.columns):
+            rows = rows + _encode_column(field, block[col])
+        handle.write(('</r>'.join(rows.tolist()) + '</r>').encode('utf-8'))
+    handle.write(b'</pivotCacheRecords>')
+
+
+def _rels_xml(relationships):
+    body = ''.join(f'<Relationship Id="{rid}" Type="{REL_NS}/{rtype}" Target="{target}"/>'
+                   for rid, rtype, target in relationships)
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PKG_REL_NS}">{body}</Relationships>')
+
+
+def _next_rid(rels_xml):
+    ids = [int(i) for i in re.findall(r'Id="rId(\d+)"', rels_xml)]
+    return f'rId{max(ids, default=0) + 1}'
+
+
+def _add_relationship(rels_xml, rid, rtype, target):
+    rel = f'<Relationship Id="{rid}" Type="{REL_NS}/{rtype}" Target="{target}"/>'
+    return rels_xml.replace('</Relationships>', rel + '</Relationships>')
+
+
+def _sheet_paths(archive):
+    """Mapea nombre de hoja -> ruta de su XML dentro del .xlsx"""
+    workbook = archive.read('xl/workbook.xml').decode('utf-8')
+    rels = archive.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    # El orden de los atributos depende de quién escribió el archivo (xlsxwriter, openpyxl, Excel)
+    targets = {}
+    for rel in re.finditer(r'<Relationship ([^>]*?)/?>', rels):
+        attrs = dict(re.findall(r'([\w:]+)="([^"]*)"', rel.group(1)))
+        targets[attrs['Id']] = attrs['Target']
+    paths = {}
+    for sheet in re.finditer(r'<sheet ([^>]*)/>', workbook):
+        attrs = dict(re.findall(r'([\w:]+)="([^"]*)"', sheet.group(1)))
+        name = attrs['name'].replace('&amp;', '&').replace('&apos;', "'").replace('&quot;', '"')
+        paths[name] = 'xl/' + targets[attrs['r:id']].lstrip('/').replace('xl/', '', 1)
+    return paths
+
+
+def inject_pivot_parts(filename, cache, layouts):
+    """Agrega el caché y las pivot tables a un .xlsx ya cerrado por xlsxwriter
+
+    `layouts` es una lista de (nombre de hoja, layout de pivot_layout).
+    """
+    # Solo se cargan en memoria las partes pequeñas que se modifican
+    with zipfile.ZipFile(filename) as source:
+        sheet_paths = _sheet_paths(source)
+        names = set(source.namelist())
+        parts = {name: source.read(name) for name in
+                 ('[Content_Types].xml', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels')}
+        for sheet_name, _ in layouts:
+            sheet_dir, sheet_file = os.path.split(sheet_paths[sheet_name])
+            rels_path = f'{sheet_dir}/_rels/{sheet_file}.rels'
+            if rels_path in names:
+                parts[rels_path] = source.read(rels_path)
+
+    cache_id = cache['id']
+    definition_path = f'xl/pivotCache/pivotCacheDefinition{cache_id}.xml'
+    records_path = f'xl/pivotCache/pivotCacheRecords{cache_id}.xml'
+
+    # Content types
+    content_types = parts['[Content_Types].xml'].decode('utf-8')
+    overrides = [(definition_path, 'pivotCacheDefinition'), (records_path, 'pivotCacheRecords')]
+    overrides += [(f'xl/pivotTables/pivotTable{layout["id"]}.xml', 'pivotTable') for _, layout in layouts]
+    content_types = content_types.replace('</Types>', ''.join(
+        f'<Override PartName="/{path}" ContentType="{CONTENT_TYPES[kind]}"/>' for path, kind in overrides
+    ) + '</Types>')
+    parts['[Content_Types].xml'] = content_types.encode('utf-8')
+
+    # workbook.xml -> pivotCaches
+    workbook_rels = parts['xl/_rels/workbook.xml.rels'].decode('utf-8')
+    cache_rid = _next_rid(workbook_rels)
+    workbook_rels = _add_relationship(workbook_rels, cache_rid, 'pivotCacheDefinition',
+                                      f'pivotCache/pivotCacheDefinition{cache_id}.xml')
+    parts['xl/_rels/workbook.xml.rels'] = workbook_rels.encode('utf-8')
+    workbook = parts['xl/workbook.xml'].decode('utf-8')
+    workbook = workbook.replace('</workbook>', f'<pivotCaches><pivotCache cacheId="{cache_id}" '
+                                               f'r:id="{cache_rid}"/></pivotCaches></workbook>')
+    parts['xl/workbook.xml'] = workbook.encode('utf-8')
+
+    # Definición del caché (+ relación con sus registros)
+    parts[definition_path] = _definition_xml(cache, 'rId1').encode('utf-8')
+    parts[f'xl/pivotCache/_rels/pivotCacheDefinition{cache_id}.xml.rels'] = _rels_xml(
+        [('rId1', 'pivotCacheRecords', f'pivotCacheRecords{cache_id}.xml')]).encode('utf-8')
+
+    # Pivot tables (+ relación hoja -> pivot table -> caché)
+    for sheet_name, layout in layouts:
+        table_path = f'xl/pivotTables/pivotTable{layout["id"]}.xml'
+        parts[table_path] = layout['xml'].encode('utf-8')
+        parts[f'xl/pivotTables/_rels/pivotTable{layout["id"]}.xml.rels'] = _rels_xml(
+            [('rId1', 'pivotCacheDefinition', f'../pivotCache/pivotCacheDefinition{cache_id}.xml')]).encode('utf-8')
+
+        sheet_path = sheet_paths[sheet_name]
+        sheet_dir, sheet_file = os.path.split(sheet_path)
+        sheet_rels_path = f'{sheet_dir}/_rels/{sheet_file}.rels'
+        sheet_rels = parts[sheet_rels_path].decode('utf-8') if sheet_rels_path in parts else _rels_xml([])
+        sheet_rels = _add_relationship(sheet_rels, _next_rid(sheet_rels), 'pivotTable',
+                                       f'../pivotTables/pivotTable{layout["id"]}.xml')
+        parts[sheet_rels_path] = sheet_rels.encode('utf-8')
+
+    # Reescribir el zip (los registros se generan directamente dentro del archivo)
+    fd, tmp_path = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(filename)))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(filename) as source, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as target:
+            for info in source.infolist():
+                if info.filename in parts:
+                    continue
+                with source.open(info) as src, target.open(info.filename, 'w', force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            for name, data in parts.items():
+                target.writestr(name, data)
+            with target.open(records_path, 'w', force_zip64=True) as handle:
+                _write_records(handle, cache)
+        shutil.move(tmp_path, filename)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return filename
+
+
+def write_report_pivots(workbook, df, sheets, data_sheet='Data', cube=None, location='A3'):
+    """Agrega las pivot tables del reporte (Year x dimensión, StageName en columnas)
+
+    `sheets` mapea dimensión -> nombre de hoja, ej. {'Division': 'Division Pivot'}.
+    Debe llamarse antes de workbook.close(); luego inject_pivot_parts(filename,
+    *resultado) agrega las partes XML. Devuelve (cache, layouts) o None si el
+    detalle no cabe en una sola hoja (el caché necesita un único rango origen).
+    """
+    from reporting.raw_export import EXCEL_MAX_ROWS
+    from reporting.rollup import build_base_cube
+
+    if len(df) > EXCEL_MAX_ROWS - 1:
+        print(f"[INFO] {len(df)} registros no caben en una hoja: se omiten las pivot tables nativas")
+        return None
+
+    dims = list(sheets)
+    if cube is None or 'StageName' not in cube.columns or not set(dims) <= set(cube.columns):
+        cube = build_base_cube(df, dims + ['StageName'])
+    cache = build_pivot_cache(df, data_sheet, ['Year', 'StageName'] + dims)
+
+    formats = {
+        'header': workbook.add_format({'bold': True}),
+        'subtotal_label': workbook.add_format({'bold': True}),
+        'grand_label': workbook.add_format({'bold': True, 'top': 1}),
+        'Amount': workbook.add_format({'num_format': '$#,##0'}),
+        'subtotal_Amount': workbook.add_format({'num_format': '$#,##0', 'bold': True}),
+        'subtotal_Count': workbook.add_format({'bold': True}),
+        'grand_Amount': workbook.add_format({'num_format': '$#,##0', 'bold': True, 'top': 1}),
+        'grand_Count': workbook.add_format({'bold': True, 'top': 1}),
+    }
+
+    layouts = []
+    for pivot_id, (dim, sheet_name) in enumerate(sheets.items(), 1):
+        agg = (cube.groupby(['Year', dim, 'StageName'], dropna=False, observed=True)[['Count', 'Amount']]
+               .sum().reset_index())
+        layout = pivot_layout(cache, agg, f'{dim}Pivot', ['Year', dim], 'StageName',
+                              location=location, pivot_id=pivot_id)
+        worksheet = workbook.get_worksheet_by_name(sheet_name) or workbook.add_worksheet(sheet_name)
+        write_pivot_layout(worksheet, layout, formats)
+        layouts.append((sheet_name, layout))
+    return cache, layouts
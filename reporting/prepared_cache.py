@@ -0,0 +1,96 @@
+"""Caché del frame preparado en Arrow IPC con memory map, por hash del origen
+
+El frame preparado (tipos del esquema, Year, banderas por stage y montos
+por stage de with_stage_buckets) se guarda sin compresión en
+`{clave}.arrow`. La clave es el sha256 del archivo de origen más los
+filtros y PREPARE_VERSION: el mismo contenido da la misma clave aunque el
+archivo se mueva o se vuelva a descargar, y cualquier cambio la invalida.
+Contra el API no hay archivo que hashear: la clave sale de la versión del
+snapshot local (snapshot_key: marca de agua, filas, última descarga
+completa y filtros), que cambia con cada delta que trae cambios.
+
+Al leer, el archivo se abre con pa.memory_map y se convierte sin copiar
+(split_blocks): una segunda corrida no parsea ni prepara, y varios procesos
+que generan reportes del mismo origen comparten las páginas del page cache
+en lugar de tener cada uno su copia del frame.
+"""
+import hashlib
+import json
+import os
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'prepared')
+
+# Subir cuando cambie prepare_data_for_pivot o el esquema: invalida lo guardado
+PREPARE_VERSION = 1
+
+# Entradas que se conservan al guardar una nueva (las más recientes)
+DEFAULT_KEEP = 4
+
+_CHUNK_SIZE = 1 << 20
+
+
+def source_key(path, **filters):
+    """Clave del frame preparado de `path` con `filters` (sha256 del contenido)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    params = {name: sorted(values) for name, values in filters.items() if values}
+    digest.update(json.dumps({'version': PREPARE_VERSION, 'filters': params}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def snapshot_key(meta):
+    """Clave del frame preparado del snapshot del API con metadatos `meta` (reporting.snapshot)"""
+    stamp = {key: meta.get(key) for key in ('watermark', 'rows', 'full_refresh_at', 'partitions')}
+    return hashlib.sha256(json.dumps({'version': PREPARE_VERSION, 'snapshot': stamp},
+                                     sort_keys=True).encode()).hexdigest()
+
+
+def cache_path(key, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, key + '.arrow')
+
+
+def load_prepared(key, cache_dir=DEFAULT_CACHE_DIR):
+    """Frame preparado de `key` con memory map (sin copiar) o None si no está"""
+    import pyarrow as pa
+
+    path = cache_path(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        # Archivo truncado o de otra versión de Arrow: se vuelve a preparar
+        return None
+    os.utime(path)
+    return table.to_pandas(split_blocks=True)
+
+
+def save_prepared(df_prepared, key, cache_dir=DEFAULT_CACHE_DIR, keep=DEFAULT_KEEP):
+    """Guarda el frame (con los montos por stage) de forma atómica y poda las entradas viejas"""
+    import pyarrow as pa
+
+    from reporting.schema import with_stage_buckets
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(key, cache_dir)
+    table = pa.Table.from_pandas(with_stage_buckets(df_prepared), preserve_index=False)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    prune(cache_dir, keep)
+    return path
+
+
+def prune(cache_dir=DEFAULT_CACHE_DIR, keep=DEFAULT_KEEP):
+    """Borra las entradas menos usadas y deja las `keep` más recientes"""
+    entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.arrow')]
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,142 @@
+"""Exportación de la hoja de datos crudos (drill-through) con memoria constante
+
+Usa xlsxwriter en modo `constant_memory`: cada fila se vuelca a disco al
+pasar a la siguiente, así que la memoria no crece con el número de filas.
+El tipo de cada columna (fecha / número / texto) se resuelve una sola vez
+y luego se escriben filas completas sin comprobaciones por celda.
+
+Por lo mismo, ancho y formato de las columnas se pasan a write_raw_data:
+un set_column posterior no alcanza a las filas ya volcadas.
+"""
+import math
+
+import pandas as pd
+from xlsxwriter.utility import xl_col_to_name
+
+# Filas por hoja en Excel (incluye el encabezado)
+EXCEL_MAX_ROWS = 1_048_576
+
+DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Filas convertidas a objetos Python a la vez
+BLOCK_ROWS = 10_000
+
+
+def _column_writer(worksheet, series, date_format, cell_format=None):
+    """Devuelve (conversión a lista, función de escritura) para una columna, decidido una vez"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        date_format = cell_format or date_format
+        write_datetime = worksheet.write_datetime
+
+        def convert(block):
+            if block.dt.tz is not None:
+                block = block.dt.tz_localize(None)
+            return [None if pd.isna(v) else v for v in block.dt.to_pydatetime()]
+
+        def write(row, col, value):
+            if value is not None:
+                write_datetime(row, col, value, date_format)
+        return convert, write
+
+    if pd.api.types.is_bool_dtype(series):
+        write_boolean = worksheet.write_boolean
+
+        def convert(block):
+            return block.astype(object).where(block.notna(), None).tolist()
+
+        def write(row, col, value):
+            if value is not None:
+                write_boolean(row, col, value, cell_format)
+        return convert, write
+
+    if pd.api.types.is_numeric_dtype(series):
+        write_number = worksheet.write_number
+
+        def convert(block):
+            return block.astype('float64').tolist()
+
+        def write(row, col, value):
+            # NaN no es igual a sí mismo: celda vacía
+            if value == value and not math.isinf(value):
+                write_number(row, col, value, cell_format)
+        return convert, write
+
+    write_string = worksheet.write_string
+
+    def convert(block):
+        return block.astype(object).where(block.notna(), None).tolist()
+
+    def write(row, col, value):
+        if value is not None:
+            write_string(row, col, str(value), cell_format)
+    return convert, write
+
+
+def write_raw_data(workbook, df, sheet_name='Data', max_rows_per_sheet=EXCEL_MAX_ROWS - 1,
+                   defined_name=None, date_format=DATE_FORMAT, column_width=None, column_formats=None):
+    """Escribe `df` en una o varias hojas (Data, Data_2, ...) y devuelve las hojas creadas
+
+    Si el detalle supera el máximo de filas de Excel se reparte
+    automáticamente. Cada hoja lleva autofiltro y, con `defined_name`, un
+    nombre definido sobre su rango (OpportunityData, OpportunityData_2, ...)
+    que puede usarse como origen de pivot tables.
+
+    `column_width` fija el ancho de todas las columnas y `column_formats`
+    ({columna: num_format}, p. ej. {'Amount': '$#,##0'}) el formato de cada
+    celda de esas columnas; ambos se aplican antes de escribir las filas.
+    """
+    headers = [str(col) for col in df.columns]
+    n_rows = len(df)
+    n_sheets = max(1, math.ceil(n_rows / max_rows_per_sheet))
+    date_fmt = workbook.add_format({'num_format': date_format})
+    header_fmt = workbook.add_format({'bold': True})
+    cell_formats = {col: workbook.add_format({'num_format': num_format})
+                    for col, num_format in (column_formats or {}).items()}
+
+    sheets = []
+    for part in range(n_sheets):
+        suffix = '' if part == 0 else f'_{part + 1}'
+        worksheet = workbook.add_worksheet(f'{sheet_name}{suffix}')
+        start = part * max_rows_per_sheet
+        chunk = df.iloc[start:start + max_rows_per_sheet]
+
+        if column_width is not None:
+            worksheet.set_column(0, len(headers) - 1, column_width)
+        for col, cell_format in cell_formats.items():
+            col_num = df.columns.get_loc(col)
+            worksheet.set_column(col_num, col_num, column_width, cell_format)
+
+        worksheet.write_row(0, 0, headers, header_fmt)
+        columns = [_column_writer(worksheet, chunk[col], date_fmt, cell_formats.get(col)) for col in chunk.columns]
+        writers = [write for _, write in columns]
+
+        # Convertir por bloques para que las listas intermedias no crezcan con el detalle
+        row_num = 1
+        for block_start in range(0, len(chunk), BLOCK_ROWS):
+            block = chunk.iloc[block_start:block_start + BLOCK_ROWS]
+            rows = zip(*(convert(block[col]) for (convert, _), col in zip(columns, block.columns)))
+            for row in rows:
+                for col_num, (write, value) in enumerate(zip(writers, row)):
+                    write(row_num, col_num, value)
+                row_num += 1
+
+        last_row = len(chunk)
+        last_col = len(headers) - 1
+        worksheet.autofilter(0, 0, last_row, last_col)
+        worksheet.freeze_panes(1, 0)
+        if defined_name:
+            worksheet_ref = worksheet.name.replace("'", "''")
+            workbook.define_name(f'{defined_name}{suffix}',
+                                 f"='{worksheet_ref}'!$A$1:${xl_col_to_name(last_col)}${last_row + 1}")
+        sheets.append(worksheet)
+    return sheets
+
+
+def create_raw_workbook(filename, df, sheet_name='Data', **kwargs):
+    """Crea un .xlsx solo con los datos crudos usando constant_memory"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    sheets = write_raw_data(workbook, df, sheet_name=sheet_name, **kwargs)
+    workbook.close()
+    return sheets
@@ -0,0 +1,114 @@
+"""Caché LRU en disco de artefactos generados, con límite de tamaño y single-flight
+
+Cada artefacto se guarda como `{clave}{sufijo}` en el directorio de la
+caché. La clave sale de los filtros normalizados y de la versión de los
+datos de origen (report_key): el mismo pedido sobre los mismos datos
+reutiliza el archivo y un cambio de datos genera claves nuevas (las viejas
+salen por LRU).
+
+Pensada para un solo event loop de asyncio: si llegan varios pedidos
+iguales mientras el artefacto se construye, todos esperan la misma
+construcción (single-flight) en lugar de lanzar una cada uno.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'reports')
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def report_key(filters, version):
+    """Clave estable de (filtros, versión de datos); el orden de los valores no importa"""
+    params = {name: sorted(values) for name, values in filters.items() if values}
+    payload = json.dumps({'filters': params, 'version': version}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ReportCache:
+    """Artefactos por clave con desalojo LRU al superar `max_bytes`
+
+    Al crearse adopta los archivos que ya estén en `directory` (de una
+    ejecución anterior), del más viejo al más reciente.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, suffix='.xlsx'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.stats = {'hits': 0, 'misses': 0, 'joined': 0, 'evicted': 0}
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+        os.makedirs(directory, exist_ok=True)
+        existing = [entry for entry in os.scandir(directory) if entry.name.endswith(suffix)
+                    and '.tmp' not in entry.name]
+        for entry in sorted(existing, key=lambda entry: entry.stat().st_mtime_ns):
+            self._entries[entry.name[:-len(suffix)]] = entry.stat().st_size
+        self._evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    @property
+    def size(self):
+        return sum(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    async def get(self, key, build):
+        """(ruta, estado) del artefacto de `key`; estado es 'HIT', 'MISS' o 'JOINED'
+
+        `build(path)` es una corrutina que escribe el artefacto en `path`
+        (un archivo temporal que luego se renombra). Si falla, el error llega
+        a todos los pedidos que esperaban esa clave y no queda nada en caché.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.path(key), 'HIT'
+        if key in self._inflight:
+            self.stats['joined'] += 1
+            # shield: si un pedido se cancela, la construcción sigue para los demás
+            return await asyncio.shield(self._inflight[key]), 'JOINED'
+
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        tmp_path = os.path.join(self.directory, f'{key}.tmp{self.suffix}')
+        try:
+            await build(tmp_path)
+            os.replace(tmp_path, self.path(key))
+            self._entries[key] = os.path.getsize(self.path(key))
+            self._evict(keep=key)
+        except BaseException as exc:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            future.set_exception(exc)
+            # Marcar la excepción como leída aunque nadie más esté esperando
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(self.path(key))
+        return self.path(key), 'MISS'
+
+    def _evict(self, keep=None):
+        """Borra los menos usados hasta quedar bajo `max_bytes` (nunca `keep`)"""
+        while self._entries and self.size > self.max_bytes:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            del self._entries[key]
+            self.stats['evicted'] += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,103 @@
+"""Motor de agregación tipo GROUP BY Year, ROLLUP(dim) sobre un cubo base compartido
+
+El detalle se recorre una sola vez para construir un cubo pequeño
+(Year x dimensiones x clase de stage); los resúmenes por dimensión y los
+totales por año se obtienen volviendo a sumar ese cubo.
+"""
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Dimensiones que se incluyen en el cubo por defecto
+DEFAULT_DIMENSIONS = ['Division', 'LeadType']
+
+# Clases de stage usadas en los cálculos (todo lo que no es Approved/Lost es Open)
+STAGE_CLASSES = ['Approved', 'Lost', 'Open']
+
+COUNT_COLUMNS = ['Total_Opp', 'Approved', 'Lost', 'Open']
+AMOUNT_COLUMNS = ['Approved_Revenue', 'Lost_Revenue', 'Open_Revenue', 'Total_Amount']
+METRIC_COLUMNS = COUNT_COLUMNS + AMOUNT_COLUMNS
+DERIVED_COLUMNS = ['CloseRate_Std', 'CloseRate_NoLost', 'Average_Ticket']
+
+
+def stage_class(stage_name):
+    """Clasifica StageName en Approved / Lost / Open"""
+    if isinstance(stage_name.dtype, pd.CategoricalDtype):
+        # Se clasifican solo las categorías y se reparten por código
+        classes = stage_class(pd.Series(stage_name.cat.categories))
+        codes = stage_name.cat.codes.to_numpy()
+        return pd.Categorical.from_codes(
+            np.where(codes >= 0, np.asarray(classes.codes)[codes], 2), categories=STAGE_CLASSES)
+    stage_name = stage_name.to_numpy()
+    return pd.Categorical.from_codes(
+        np.select([stage_name == 'Approved', stage_name == 'Lost'], [0, 1], 2),
+        categories=STAGE_CLASSES)
+
+
+def build_base_cube(df, dims=None):
+    """Agrega el detalle una sola vez por (Year, *dims, StageClass)
+
+    Devuelve un DataFrame con las columnas Year, dims, StageClass,
+    Count y Amount. Los valores nulos de las dimensiones se conservan para
+    que los totales por año incluyan todas las oportunidades.
+    """
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    keys = df[['Year'] + dims].copy()
+    keys['StageClass'] = stage_class(df['StageName'])
+
+    cube = (pd.DataFrame({'Count': df['Id'].notna().astype('int64'), 'Amount': df['Amount']})
+            .groupby([keys[col] for col in keys.columns], dropna=False, observed=True, sort=False)
+            .sum()
+            .reset_index())
+
+    # Las dimensiones categóricas vuelven a valores simples: el cubo es pequeño
+    # y los resúmenes se concatenan con la etiqueta TOTAL
+    for col in dims:
+        if isinstance(cube[col].dtype, pd.CategoricalDtype):
+            cube[col] = cube[col].astype(cube[col].cat.categories.dtype)
+    return cube
+
+
+def _metrics_by(cube, keys):
+    """Vuelve a sumar el cubo por `keys` y abre las clases de stage en columnas"""
+    grouped = cube.groupby(keys + ['StageClass'], observed=True)[['Count', 'Amount']].sum()
+    wide = grouped.unstack('StageClass', fill_value=0)
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([['Count', 'Amount'], STAGE_CLASSES]),
+                        fill_value=0)
+
+    metrics = pd.DataFrame(index=wide.index)
+    metrics['Total_Opp'] = wide['Count'].sum(axis=1).astype('int64')
+    for name in STAGE_CLASSES:
+        metrics[name] = wide[('Count', name)].astype('int64')
+    for name in STAGE_CLASSES:
+        metrics[f'{name}_Revenue'] = wide[('Amount', name)].astype('float64')
+    metrics['Total_Amount'] = wide['Amount'].sum(axis=1).astype('float64')
+    return metrics.reset_index()
+
+
+def add_derived_metrics(pivot):
+    """Calcula CloseRate_Std, CloseRate_NoLost y Average_Ticket"""
+    pivot['CloseRate_Std'] = (pivot['Approved'] / pivot['Total_Opp'] * 100).round(2)
+    pivot['CloseRate_NoLost'] = (pivot['Approved'] / (pivot['Total_Opp'] - pivot['Lost']) * 100).round(2)
+    pivot['Average_Ticket'] = (pivot['Approved_Revenue'] / pivot['Approved']).fillna(0).round(2)
+    return pivot
+
+
+def rollup(cube, dim, total_label='TOTAL'):
+    """Equivalente a GROUP BY Year, ROLLUP(dim) calculado desde el cubo base"""
+    pivot = add_derived_metrics(_metrics_by(cube.dropna(subset=[dim]), ['Year', dim]))
+
+    # Totales por año (incluye filas sin valor en la dimensión)
+    year_totals = add_derived_metrics(_metrics_by(cube, ['Year']))
+    year_totals[dim] = total_label
+    year_totals = year_totals[pivot.columns]
+
+    return pd.concat([pivot, year_totals], ignore_index=True).sort_values(['Year', dim])
+
+
+def rollup_all(df, dims=None):
+    """Construye el cubo una vez y devuelve {dim: resumen con totales} para cada dimensión"""
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    cube = build_base_cube(df, dims)
+    return {dim: rollup(cube, dim) for dim in dims}
@@ -0,0 +1,107 @@
+"""Esquema tipado y compacto para el detalle de oportunidades
+
+El detalle llega como lista de dicts JSON: textos repetidos, Amount con
+nulos mezclados y columnas auxiliares int64/float64. Aquí se fijan tipos
+compactos (categorías, banderas int8, año int16) y los montos por stage
+se calculan solo cuando se necesitan (exportación a Excel).
+"""
+
+from reporting.dates import parse_api_dates
+from reporting.lazy import lazy_import
+from reporting.years import CLOSED_STAGES
+
+pd = lazy_import('pandas')
+
+# Textos casi únicos por fila: string respaldado por Arrow si está disponible
+TEXT_COLUMNS = ['Id', 'Name']
+
+# Pocos valores distintos repetidos en millones de filas
+CATEGORY_COLUMNS = ['StageName', 'Division', 'LeadType', 'RecordTypeId']
+
+DATE_COLUMNS = ['Created_Date', 'LastStageChangeDate']
+
+# float32 no conserva los centavos por encima de ~131,072 (24 bits de mantisa),
+# así que los montos se quedan en float64: pesan 8 bytes/fila frente a los
+# ~100 de los textos y los totales de revenue deben cuadrar con SQL
+AMOUNT_DTYPE = 'float64'
+
+YEAR_DTYPE = 'int16'
+FLAG_DTYPE = 'int8'
+
+# Bandera -> monto por stage calculado bajo demanda (with_stage_buckets)
+STAGE_BUCKETS = {
+    'IsApproved': 'ApprovedAmount',
+    'IsLost': 'LostAmount',
+    'IsOpen': 'OpenAmount',
+}
+
+
+def _text_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return pd.StringDtype('pyarrow')
+
+
+def compact_year(year):
+    """Year como int16 cuando no quedan vacíos (si no, se deja como viene)"""
+    if pd.api.types.is_integer_dtype(year):
+        return year.astype(YEAR_DTYPE)
+    return year
+
+
+def apply_detail_schema(df):
+    """Convierte en sitio las columnas del detalle a sus tipos compactos
+
+    Amount queda numérico con NaN (cada script decide si rellena con 0) y
+    las fechas como datetime sin zona horaria, igual que antes.
+    """
+    text_dtype = _text_dtype()
+    for col in TEXT_COLUMNS:
+        if col in df and text_dtype is not None and df[col].dtype == object:
+            df[col] = df[col].astype(text_dtype)
+    for col in CATEGORY_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    if 'Amount' in df:
+        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').astype(AMOUNT_DTYPE)
+    for col in DATE_COLUMNS:
+        if col in df:
+            df[col] = parse_api_dates(df[col])
+    if 'YearValue' in df:
+        year_value = pd.to_numeric(df['YearValue'], errors='coerce')
+        df['YearValue'] = compact_year(year_value)
+    return df
+
+
+def add_stage_flags(df):
+    """Agrega IsApproved / IsLost / IsOpen como int8 (en sitio)"""
+    stage = df['StageName']
+    df['IsApproved'] = (stage == 'Approved').to_numpy().astype(FLAG_DTYPE)
+    df['IsLost'] = (stage == 'Lost').to_numpy().astype(FLAG_DTYPE)
+    df['IsOpen'] = (~stage.isin(CLOSED_STAGES)).to_numpy().astype(FLAG_DTYPE)
+    return df
+
+
+def with_stage_buckets(df):
+    """Copia superficial de `df` con ApprovedAmount / LostAmount / OpenAmount
+
+    Los montos por stage no se guardan en el frame preparado: se derivan
+    de Amount y las banderas justo antes de escribir la hoja de datos. Si
+    ya los tiene (frame leído de reporting.prepared_cache) se devuelve tal cual.
+    """
+    if set(STAGE_BUCKETS.values()) <= set(df.columns):
+        return df
+    amount = df['Amount'].to_numpy()
+    return df.assign(**{bucket: amount * df[flag].to_numpy()
+                        for flag, bucket in STAGE_BUCKETS.items()})
+
+
+def memory_report(frames):
+    """Memoria profunda por columna (MB) de cada frame en `frames` ({etiqueta: df})"""
+    report = pd.DataFrame({label: df.memory_usage(deep=True, index=False) / 1024 / 1024
+                           for label, df in frames.items()})
+    report.loc['TOTAL'] = report.sum()
+    return report.round(2)
@@ -0,0 +1,179 @@
+"""Snapshot local del detalle de oportunidades con refresco incremental
+
+El detalle se guarda en Parquet (una fila por Id) junto a un archivo JSON
+con la marca de agua: la fecha máxima de LastStageChangeDate/Created_Date.
+En las siguientes ejecuciones solo se piden al API las oportunidades
+creadas o con cambio de stage desde esa fecha y se hace upsert por Id.
+
+Los cambios de Amount sin cambio de stage y los borrados no actualizan esas
+fechas, por eso cada `ttl_hours` se fuerza una descarga completa.
+
+El delta se pide sin los filtros (year/division/leadType): una oportunidad
+puede salir de ellos (ej. creada en 2024 y aprobada en 2025 pasa a
+YearValue 2025) y con el filtro no llegaría nunca. Los filtros se aplican
+después sobre el delta (in_partitions) y las filas que salieron de ellos se
+quitan del snapshot.
+
+Los metadatos guardan también la versión (snapshot_version) sobre la que se
+aplicó el último delta ('base'): quien mantiene datos derivados del snapshot
+(ej. reporting.aggregate_state) solo puede aplicar ese delta si estaba al
+día con esa versión.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from reporting.client import API_BASE_URL, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT, fetch_detail
+from reporting.dates import parse_api_dates
+from reporting.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+DEFAULT_SNAPSHOT_PATH = os.path.join('.cache', 'opportunity_snapshot.parquet')
+
+# Horas entre descargas completas (None = nunca forzar)
+DEFAULT_TTL_HOURS = 24
+
+DATE_COLUMNS = ['LastStageChangeDate', 'Created_Date']
+
+# Filtro de client.detail_partitions -> columna del detalle (como services/queries.js)
+PARTITION_COLUMNS = {'year': 'YearValue', 'division': 'Division', 'leadType': 'LeadType'}
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """Devuelve (detalle, metadatos) del snapshot o (None, None) si no existe"""
+    if not os.path.exists(path) or not os.path.exists(_meta_path(path)):
+        return None, None
+    with open(_meta_path(path), encoding='utf-8') as f:
+        meta = json.load(f)
+    return pd.read_parquet(path), meta
+
+
+def load_snapshot_meta(path=DEFAULT_SNAPSHOT_PATH):
+    """Metadatos del snapshot (sin leer el detalle) o None si no existe"""
+    if not os.path.exists(_meta_path(path)):
+        return None
+    with open(_meta_path(path), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def snapshot_version(meta):
+    """Identifica una versión del snapshot: marca de agua, fecha de actualización y filas"""
+    if not meta:
+        return None
+    return {key: meta.get(key) for key in ('watermark', 'updated_at', 'rows')}
+
+
+def save_snapshot(df, meta, path=DEFAULT_SNAPSHOT_PATH):
+    """Guarda el snapshot de forma atómica (archivo temporal + rename)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    tmp_meta = _meta_path(path) + '.tmp'
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, _meta_path(path))
+
+
+def compute_watermark(df):
+    """Fecha máxima de cambio/creación en el detalle (ISO-8601 UTC) o None"""
+    latest = None
+    for col in DATE_COLUMNS:
+        if col in df.columns and len(df):
+            value = parse_api_dates(df[col]).max()
+            if pd.notna(value) and (latest is None or value > latest):
+                latest = value
+    if pd.isna(latest):
+        return None
+    return latest.strftime('%Y-%m-%dT%H:%M:%S.') + f"{latest.microsecond // 1000:03d}Z"
+
+
+def upsert(snapshot, delta):
+    """Inserta o reemplaza por Id las filas de `delta` en el snapshot"""
+    if delta is None or delta.empty:
+        return snapshot
+    merged = pd.concat([snapshot, delta], ignore_index=True)
+    return merged.drop_duplicates(subset='Id', keep='last').reset_index(drop=True)
+
+
+def in_partitions(df, partitions):
+    """Máscara de las filas que el API devolvería con alguno de los filtros de `partitions`"""
+    mask = pd.Series(False, index=df.index)
+    for partition in partitions or [{}]:
+        match = pd.Series(True, index=df.index)
+        for key, value in partition.items():
+            column = df[PARTITION_COLUMNS[key]]
+            if key == 'year':
+                column = pd.to_numeric(column, errors='coerce')
+            match &= column == value
+        mask |= match
+    return mask
+
+
+def fetch_detail_cached(session, base_url=API_BASE_URL, partitions=None, timeout=DEFAULT_TIMEOUT,
+                        max_workers=DEFAULT_MAX_WORKERS, path=DEFAULT_SNAPSHOT_PATH,
+                        ttl_hours=DEFAULT_TTL_HOURS, force_refresh=False, on_change=None):
+    """Obtiene el detalle desde el snapshot local pidiendo al API solo los cambios
+
+    Misma firma que client.fetch_detail, por lo que puede usarse como
+    `detail_fetcher` de client.fetch_all.
+    `on_change(previous, delta)` recibe las versiones anteriores de las filas
+    que llegaron en el delta y el delta mismo; tras una descarga completa se
+    llama con previous=None y el detalle completo.
+    """
+    snapshot, meta = load_snapshot(path)
+    now = datetime.now(timezone.utc)
+
+    reason = None
+    if force_refresh:
+        reason = 'refresco forzado'
+    elif snapshot is None:
+        reason = 'sin snapshot'
+    elif meta.get('partitions') != partitions:
+        reason = 'filtros distintos'
+    elif not meta.get('watermark'):
+        reason = 'snapshot sin marca de agua'
+    elif ttl_hours is not None and now - datetime.fromisoformat(meta['full_refresh_at']) > timedelta(hours=ttl_hours):
+        reason = f'TTL de {ttl_hours}h vencido'
+
+    if reason:
+        detail = fetch_detail(session, base_url, partitions, timeout, max_workers)
+        meta = {
+            'full_refresh_at': now.isoformat(),
+            'partitions': partitions,
+            'base': None,
+        }
+        print(f"[CACHE] MISS ({reason}): {len(detail)} registros descargados completos")
+        if on_change is not None:
+            on_change(None, detail)
+    else:
+        since = meta['watermark']
+        changed = fetch_detail(session, base_url, [{'changedSince': since}], timeout, max_workers)
+        if len(changed):
+            changed = changed.drop_duplicates(subset='Id', keep='last')
+            matches = in_partitions(changed, partitions)
+            delta, left = changed[matches], changed.loc[~matches, 'Id']
+        else:
+            delta, left = changed, []
+        new_ids = (~delta['Id'].isin(snapshot['Id'])).sum() if len(delta) else 0
+        if on_change is not None:
+            # Las filas que salieron de los filtros tienen versión anterior y no nueva
+            previous = snapshot[snapshot['Id'].isin(changed['Id'])] if len(changed) else snapshot.iloc[:0]
+            on_change(previous, delta)
+        removed = snapshot['Id'].isin(left)
+        detail = upsert(snapshot[~removed].reset_index(drop=True), delta)
+        meta['base'] = snapshot_version(meta)
+        print(f"[CACHE] HIT: {len(snapshot)} registros en snapshot, {len(changed)} cambios desde {since} "
+              f"({new_ids} nuevos, {len(delta) - new_ids} actualizados, {removed.sum()} fuera de los filtros)")
+
+    meta['watermark'] = compute_watermark(detail) or meta.get('watermark')
+    meta['updated_at'] = now.isoformat()
+    meta['rows'] = len(detail)
+    save_snapshot(detail, meta, path)
+    return detail
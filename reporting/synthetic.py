@@ -0,0 +1,118 @@
+"""Generador de detalle de oportunidades sintético para benchmarks
+
+Reproduce las distribuciones de un JSON de ejemplo (test-response.json):
+frecuencias de StageName, Division, LeadType, RecordTypeId y estado en
+Name, proporción de Amount nulo / cero, montos no nulos (remuestreados con
+ruido) y demora entre Created_Date y LastStageChangeDate. Las fechas de
+creación se reparten de forma uniforme entre `start` y `end` para cubrir
+varios años. Todo es vectorizado (sin bucles por fila).
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from reporting.years import CLOSED_STAGES
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test-response.json')
+
+DEFAULT_START = '2021-01-01'
+DEFAULT_END = '2025-12-31'
+
+COLUMNS = ['Id', 'Name', 'StageName', 'Division', 'LeadType', 'Amount', 'Created_Date',
+           'LastStageChangeDate', 'RecordTypeId', 'YearValue']
+
+
+def _frequencies(series):
+    counts = series.value_counts(normalize=True, dropna=False)
+    return np.array(counts.index.tolist(), dtype=object), counts.to_numpy()
+
+
+def load_profile(source=DEFAULT_SOURCE):
+    """Distribuciones empíricas del detalle en `source` (formato /api/opportunity-detail)"""
+    with open(source, encoding='utf-8') as f:
+        df = pd.DataFrame(json.load(f)['data'])
+
+    amount = pd.to_numeric(df['Amount'], errors='coerce')
+    created = pd.to_datetime(df['Created_Date'], errors='coerce', utc=True)
+    last_change = pd.to_datetime(df['LastStageChangeDate'], errors='coerce', utc=True)
+    lag = (last_change - created).dt.total_seconds().dropna()
+    states = df['Name'].str.split(' - ').str[1]
+
+    return {
+        'StageName': _frequencies(df['StageName']),
+        'Division': _frequencies(df['Division']),
+        'LeadType': _frequencies(df['LeadType']),
+        'RecordTypeId': _frequencies(df['RecordTypeId']),
+        'State': _frequencies(states[states.str.fullmatch('[A-Z]{2}', na=False)]),
+        'amount_null': float(amount.isna().mean()),
+        'amount_zero': float((amount == 0).mean()),
+        'amounts': amount[amount > 0].to_numpy(),
+        'last_change_null': float(last_change.isna().mean()),
+        'lag_seconds': lag[lag >= 0].to_numpy(),
+    }
+
+
+def _sample(rng, frequencies, rows):
+    values, probs = frequencies
+    return values[rng.choice(len(values), size=rows, p=probs)]
+
+
+def _iso(timestamps):
+    """datetime64 -> texto ISO-8601 como el que devuelve el API (…000Z)"""
+    text = pd.Series(np.datetime_as_string(timestamps.astype('datetime64[ms]'), unit='ms')) + 'Z'
+    return text.where(~np.isnat(timestamps), None)
+
+
+def generate_detail(rows, seed=0, profile=None, start=DEFAULT_START, end=DEFAULT_END, divisions=None):
+    """DataFrame con `rows` oportunidades sintéticas, con las columnas y formatos del API
+
+    `divisions` ({nombre: peso}) reemplaza la distribución de Division del
+    ejemplo (que solo tiene una), útil para medir con más cardinalidad.
+    """
+    profile = profile or load_profile()
+    rng = np.random.default_rng(seed)
+
+    stage = _sample(rng, profile['StageName'], rows)
+    if divisions:
+        weights = np.array(list(divisions.values()), dtype='float64')
+        division = _sample(rng, (np.array(list(divisions), dtype=object), weights / weights.sum()), rows)
+    else:
+        division = _sample(rng, profile['Division'], rows)
+
+    # Amount: nulos, ceros y montos remuestreados con ±10% de ruido
+    draw = rng.random(rows)
+    amounts = profile['amounts'][rng.integers(0, len(profile['amounts']), rows)]
+    amounts = np.round(amounts * rng.uniform(0.9, 1.1, rows), 2)
+    amounts[draw < profile['amount_null'] + profile['amount_zero']] = 0
+    amounts[draw < profile['amount_null']] = np.nan
+
+    start, end = np.datetime64(start, 's'), np.datetime64(end, 's')
+    created = start + (rng.random(rows) * (end - start).astype('int64')).astype('timedelta64[s]')
+    lag = profile['lag_seconds'][rng.integers(0, len(profile['lag_seconds']), rows)]
+    last_change = np.minimum(created + lag.astype('int64').astype('timedelta64[s]'), end)
+    last_change[rng.random(rows) < profile['last_change_null']] = np.datetime64('NaT')
+
+    # YearValue con la misma regla que el query del API
+    use_last_change = np.isin(stage, CLOSED_STAGES) & ~np.isnat(last_change)
+    year_value = np.where(use_last_change, last_change, created).astype('datetime64[Y]').astype('int64') + 1970
+
+    # Números con ceros a la izquierda sin formatear fila por fila (10**k + n, sin el primer dígito)
+    sequence = np.arange(1, rows + 1, dtype='int64')
+    number = pd.Series(sequence).astype(str)
+    padded_id = pd.Series(sequence + 10 ** 15).astype(str).str[1:]
+    padded_name = pd.Series(sequence % 10 ** 6 + 10 ** 6).astype(str).str[1:]
+    state = pd.Series(_sample(rng, profile['State'], rows))
+    return pd.DataFrame({
+        'Id': '006' + padded_id,
+        'Name': 'OPP - ' + state + ' - Customer ' + number + ' - ' + padded_name,
+        'StageName': stage,
+        'Division': division,
+        'LeadType': _sample(rng, profile['LeadType'], rows),
+        'Amount': amounts,
+        'Created_Date': _iso(created),
+        'LastStageChangeDate': _iso(last_change),
+        'RecordTypeId': _sample(rng, profile['RecordTypeId'], rows),
+        'YearValue': year_value,
+    }, columns=COLUMNS)
@@ -0,0 +1,441 @@
+"""Workbooks generados desde una plantilla .xlsx reescribiendo solo las hojas de datos
+
+La plantilla trae todo lo que no depende de los datos: estilos, formatos,
+anchos, paneles fijos, formato condicional, nombres definidos, gráficos y
+hojas con fórmulas (ej. Key_Metrics). Cada hoja de datos de la plantilla
+tiene:
+
+  - fila 1: encabezados (se copia tal cual; define el orden de columnas)
+  - fila 2: fila modelo; de cada celda se toma solo su estilo (atributo s)
+
+write_from_template copia las demás partes del zip tal cual y escribe el
+XML de cada hoja de datos directamente dentro del zip, por bloques de
+filas y vectorizado por columna. Los rangos que terminaban en la
+fila modelo (autofiltro, formato condicional, nombres definidos) se
+extienden hasta la última fila y el workbook se marca para recalcular al
+abrir. Las celdas de texto van como inlineStr: sharedStrings no se toca.
+
+Con jobs > 1 las filas se serializan en procesos (tareas de PART_ROWS
+filas; Raw_Data se reparte en varias) a partes XML temporales y el
+proceso principal solo las concatena dentro del zip. El nivel de deflate
+es configurable; 0 guarda las partes sin comprimir (STORED).
+
+build_template crea la plantilla por defecto (con openpyxl) y guarda a su
+lado (.json) TEMPLATE_VERSION y las columnas de cada hoja; ensure_template
+la reconstruye si cambió alguna de las dos. Una plantilla propia (sin ese
+.json) no se toca: si el frame trae columnas que la plantilla no tiene,
+write_from_template falla en lugar de descartarlas.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from reporting.instrumentation import stage
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DATA_SHEETS = ['Raw_Data', 'Division_Summary', 'Lead_Summary']
+
+DEFAULT_TEMPLATE_PATH = os.path.join('.cache', 'report_template.xlsx')
+
+# Subir al cambiar el formato de build_template (estilos, Key_Metrics, nombres)
+TEMPLATE_VERSION = 1
+
+DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Filas serializadas a la vez
+BLOCK_ROWS = 50_000
+
+# Filas por tarea al serializar en paralelo (una hoja grande se reparte en varias)
+PART_ROWS = 200_000
+
+_COPY_CHUNK = 1024 * 1024
+
+# Día 0 de las fechas seriales de Excel
+_EXCEL_EPOCH = '1899-12-30'
+
+_ROW_RE = re.compile(r'<row [^>]*>.*?</row>|<row [^>]*/>', re.S)
+# Caracteres de control que XML 1.0 no admite
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Hojas de write_from_template en los procesos del pool (ver _init_worker)
+_worker_sheets = None
+
+
+def _column_letter(idx):
+    """Letra de columna de Excel para el índice 0-based `idx`"""
+    letters = ''
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _column_index(letters):
+    idx = 0
+    for char in letters:
+        idx = idx * 26 + ord(char) - 64
+    return idx - 1
+
+
+def _escape(text):
+    text = text.str.replace('&', '&amp;', regex=False)
+    text = text.str.replace('<', '&lt;', regex=False).str.replace('>', '&gt;', regex=False)
+    return text.str.replace(_INVALID_XML, '', regex=True)
+
+
+def _cell_tokens(series, letter, style, rows):
+    """XML de las celdas de una columna para las filas `rows` (vacío donde no hay valor)"""
+    prefix = '<c r="' + letter + rows + (f'" s="{style}"' if style else '"')
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        serial = (values.to_numpy().astype('datetime64[us]') - np.datetime64(_EXCEL_EPOCH, 'us'))
+        serial = serial / np.timedelta64(1, 'D')
+        tokens = prefix + '><v>' + pd.Series(serial, index=series.index).astype(str) + '</v></c>'
+    elif pd.api.types.is_bool_dtype(series):
+        flags = series.fillna(False).astype(bool).astype('int8').astype(str)
+        tokens = prefix + ' t="b"><v>' + flags + '</v></c>'
+    elif pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        missing = ~np.isfinite(values)
+        text = series.astype(str) if pd.api.types.is_integer_dtype(series) else pd.Series(
+            values, index=series.index).astype(str)
+        tokens = prefix + '><v>' + text + '</v></c>'
+    else:
+        text = _escape(series.astype(object).where(~missing, '').astype(str))
+        tokens = prefix + ' t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>'
+    return tokens.astype(object).where(~missing, '')
+
+
+def _sheet_rows(df, styles, start_row=2):
+    """Bloques de XML <row> de `df` (la fila `start_row` es la primera de datos)"""
+    letters = [_column_letter(i) for i in range(len(df.columns))]
+    for start in range(0, len(df), BLOCK_ROWS):
+        block = df.iloc[start:start + BLOCK_ROWS]
+        numbers = np.arange(start + start_row, start + start_row + len(block)).astype(str)
+        rows = pd.Series(numbers, index=block.index, dtype=object)
+        xml = '<row r="' + rows + '">'
+        for i, col in enumerate(block.columns):
+            xml = xml + _cell_tokens(block[col], letters[i], styles.get(i), rows)
+        yield ''.join((xml + '</row>').tolist())
+
+
+def _template_sheet(xml):
+    """(antes de las filas de datos, XML de la fila 1, estilos por columna, después de sheetData)"""
+    match = re.search(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', xml, re.S)
+    if match is None:
+        raise ValueError('Hoja de plantilla sin sheetData')
+    rows = _ROW_RE.findall(match.group(1) or '')
+    header = rows[0] if rows else ''
+    styles = {}
+    if len(rows) > 1:
+        for cell in re.finditer(r'<c ([^>]*?)/?>', rows[1]):
+            attrs = dict(re.findall(r'([\w:]+)="([^"]*)"', cell.group(1)))
+            if 'r' in attrs and attrs.get('s', '0') != '0':
+                styles[_column_index(re.match(r'[A-Z]+', attrs['r']).group())] = attrs['s']
+    return xml[:match.start()] + '<sheetData>', header, styles, '</sheetData>' + xml[match.end():]
+
+
+def _header_names(header_xml, shared_strings):
+    """Textos de los encabezados de la fila 1 (inlineStr, str o sharedStrings)"""
+    names = []
+    for cell in re.finditer(r'<c ([^>]*?)(?:/>|>(.*?)</c>)', header_xml, re.S):
+        attrs = dict(re.findall(r'([\w:]+)="([^"]*)"', cell.group(1)))
+        body = cell.group(2) or ''
+        if attrs.get('t') == 's':
+            text = shared_strings[int(re.search(r'<v>(\d+)</v>', body).group(1))]
+        else:
+            text = ''.join(re.findall(r'<t[^>]*>(.*?)</t>', body, re.S))
+            if not text:
+                text = next(iter(re.findall(r'<v>(.*?)</v>', body)), '')
+        names.append(_unescape(text))
+    return names
+
+
+def _unescape(text):
+    return text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&apos;', "'") \
+        .replace('&amp;', '&')
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    xml = archive.read('xl/sharedStrings.xml').decode('utf-8')
+    return [''.join(re.findall(r'<t[^>]*>(.*?)</t>', item, re.S))
+            for item in re.findall(r'<si>(.*?)</si>', xml, re.S)]
+
+
+def _extend_ranges(xml, last_template_row, last_row):
+    """Extiende hasta `last_row` los rangos A1:X{fila modelo} (ref, sqref, nombres definidos)"""
+    return re.sub(r'(:\$?[A-Z]+\$?)' + str(last_template_row) + r'(?![0-9])',
+                  lambda match: match.group(1) + str(last_row), xml)
+
+
+def _init_worker(sheets):
+    global _worker_sheets
+    _worker_sheets = sheets
+
+
+def _render_part(path, start, stop, filename):
+    """Escribe en `filename` el XML de las filas [start, stop) de la hoja `path`; (bytes, segundos)"""
+    begin = time.perf_counter()
+    _, _, _, styles, _, df = _worker_sheets[path]
+    written = 0
+    with open(filename, 'wb') as f:
+        for block in _sheet_rows(df.iloc[start:stop], styles, start_row=start + 2):
+            written += f.write(block.encode('utf-8'))
+    return written, time.perf_counter() - begin
+
+
+def _render_parts(sheets, directory, jobs, mp_context=None):
+    """Serializa las filas de todas las hojas en un pool; {ruta de la hoja: [(archivo, bytes, segundos)]}
+
+    Cada hoja se reparte en tareas de PART_ROWS filas (la más grande primero);
+    las partes se escriben como XML en `directory` para unirlas en orden.
+    """
+    tasks = [(path, start, min(start + PART_ROWS, len(sheet[-1])),
+              os.path.join(directory, f'part{i}_{start}.xml'))
+             for i, (path, sheet) in enumerate(sheets.items()) for start in range(0, len(sheet[-1]), PART_ROWS)]
+    tasks.sort(key=lambda task: task[2] - task[1], reverse=True)
+    # Con fork los workers heredan los frames sin serializarlos
+    with ProcessPoolExecutor(max_workers=min(jobs, max(len(tasks), 1)), mp_context=mp_context,
+                             initializer=_init_worker, initargs=(sheets,)) as pool:
+        futures = [(task, pool.submit(_render_part, *task)) for task in tasks]
+        parts = {path: [] for path in sheets}
+        for (path, start, _, filename), future in sorted(futures, key=lambda item: item[0][1]):
+            parts[path].append((filename, *future.result()))
+    return parts
+
+
+def write_from_template(template, filename, frames, compresslevel=None, jobs=None, mp_context=None):
+    """Escribe `filename` desde `template` reemplazando las filas de datos de cada hoja de `frames`
+
+    `frames` es {nombre de hoja: DataFrame}; las columnas se toman en el
+    orden de los encabezados de la plantilla (ValueError si falta alguna o
+    si el frame trae columnas que la plantilla no tiene).
+    `compresslevel` es el nivel de deflate de todo el zip (0 = sin comprimir:
+    más grande pero más rápido de escribir y abrir; None = el de zipfile).
+    Con `jobs` > 1 las filas se serializan en un pool de procesos (contexto
+    `mp_context`) a partes XML temporales que luego se unen en el zip.
+    Imprime por hoja filas, bytes del XML y del zip y tiempos; con un
+    registrador activo cada hoja queda como etapa 'sheet.<hoja>'.
+    """
+    from reporting.pivot_cache import _sheet_paths
+
+    with zipfile.ZipFile(template) as source:
+        sheet_paths = _sheet_paths(source)
+        missing = [name for name in frames if name not in sheet_paths]
+        if missing:
+            raise ValueError(f"La plantilla no tiene las hojas: {', '.join(missing)}")
+        shared_strings = _shared_strings(source)
+        sheets = {}
+        for name, df in frames.items():
+            head, header, styles, tail = _template_sheet(source.read(sheet_paths[name]).decode('utf-8'))
+            columns = _header_names(header, shared_strings)
+            absent = [col for col in columns if col not in df.columns]
+            if absent:
+                raise ValueError(f"{name}: columnas de la plantilla sin datos: {', '.join(absent)}")
+            extra = [str(col) for col in df.columns if col not in columns]
+            if extra:
+                raise ValueError(f"{name}: columnas que la plantilla no tiene: {', '.join(extra)} "
+                                 f"(actualizar o borrar {template})")
+            sheets[sheet_paths[name]] = (name, head, header, styles, tail, df[columns])
+        workbook_xml = source.read('xl/workbook.xml').decode('utf-8')
+
+    # Nombres definidos sobre las hojas de datos: hasta la última fila de cada una
+    def extend_name(match):
+        body = match.group(2)
+        for name, _, _, _, _, df in sheets.values():
+            if f"{name}'!" in body or f'{name}!' in body:
+                body = _extend_ranges(body, 2, len(df) + 1)
+        return match.group(1) + body + match.group(3)
+    workbook_xml = re.sub(r'(<definedName [^>]*>)(.*?)(</definedName>)', extend_name, workbook_xml, flags=re.S)
+    # Las fórmulas de la plantilla (ej. Key_Metrics) se recalculan al abrir
+    if '<calcPr' in workbook_xml:
+        workbook_xml = re.sub(r'<calcPr([^>]*?)/>', lambda m: '<calcPr' + re.sub(
+            r'\sfullCalcOnLoad="[^"]*"', '', m.group(1)) + ' fullCalcOnLoad="1"/>', workbook_xml)
+    else:
+        workbook_xml = workbook_xml.replace('</workbook>', '<calcPr fullCalcOnLoad="1"/></workbook>')
+
+    compression = zipfile.ZIP_STORED if compresslevel == 0 else zipfile.ZIP_DEFLATED
+    copied = {path: name for name, path in sheet_paths.items() if path not in sheets}
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+    os.close(fd)
+    part_dir = tempfile.mkdtemp(dir=directory) if jobs and jobs > 1 else None
+    try:
+        parts = None
+        if part_dir:
+            with stage('sheet.render', rows=sum(len(sheet[-1]) for sheet in sheets.values())):
+                parts = _render_parts(sheets, part_dir, jobs, mp_context)
+
+        with zipfile.ZipFile(template) as source, \
+                zipfile.ZipFile(tmp_path, 'w', compression, allowZip64=True, compresslevel=compresslevel) as target:
+            for info in source.infolist():
+                if info.filename in sheets or info.filename == 'xl/workbook.xml':
+                    continue
+                # Partes sin cambios (estilos, gráficos, otras hojas): se copian tal cual
+                # salvo que se pida otro nivel de compresión
+                if compresslevel is None:
+                    target.writestr(info, source.read(info), compress_type=info.compress_type)
+                else:
+                    target.writestr(info, source.read(info), compress_type=compression, compresslevel=compresslevel)
+                if info.filename in copied:
+                    print(f"[SHEET] {copied[info.filename]}: copiada de la plantilla "
+                          f"({_size(target.getinfo(info.filename).compress_size)} en el zip)")
+            target.writestr('xl/workbook.xml', workbook_xml)
+
+            for path, (name, head, header, styles, tail, df) in sheets.items():
+                last_row = len(df) + 1
+                last_col = _column_letter(max(len(df.columns), 1) - 1)
+                head = re.sub(r'<dimension ref="[^"]*"/>', f'<dimension ref="A1:{last_col}{last_row}"/>', head)
+                with stage(f'sheet.{name}', rows=len(df)) as record:
+                    start = time.perf_counter()
+                    # Con el nombre (no un ZipInfo) la parte usa el método y nivel del ZipFile
+                    with target.open(path, 'w', force_zip64=True) as handle:
+                        handle.write((head + header).encode('utf-8'))
+                        if parts is None:
+                            for block in _sheet_rows(df, styles):
+                                handle.write(block.encode('utf-8'))
+                        else:
+                            for part, _, _ in parts[path]:
+                                with open(part, 'rb') as f:
+                                    shutil.copyfileobj(f, handle, _COPY_CHUNK)
+                        handle.write(_extend_ranges(tail, 2, last_row).encode('utf-8'))
+                    info = target.getinfo(path)
+                    record.update(xml_bytes=info.file_size, zip_bytes=info.compress_size,
+                                  write_s=time.perf_counter() - start)
+                    if parts is not None:
+                        record['render_s'] = sum(seconds for _, _, seconds in parts[path])
+                timing = f"{record['write_s']:.2f} s"
+                if parts is not None:
+                    split = f" en {len(parts[path])} partes" if len(parts[path]) > 1 else ''
+                    timing = f"render {record['render_s']:.2f} s{split}, zip {timing}"
+                print(f"[SHEET] {name}: {len(df)} filas, XML {_size(info.file_size)} -> "
+                      f"{_size(info.compress_size)} en el zip ({timing})")
+        shutil.move(tmp_path, filename)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if part_dir:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    return filename
+
+
+def _size(size):
+    if size < 1024 * 1024:
+        return f'{size / 1024:.1f} KB'
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def template_signature(frames):
+    """Versión de build_template y columnas de cada hoja de `frames`"""
+    return {'version': TEMPLATE_VERSION,
+            'columns': {name: [str(col) for col in df.columns] for name, df in frames.items()}}
+
+
+def ensure_template(path, frames):
+    """Crea la plantilla por defecto si no existe o si quedó de otra versión o con otras columnas
+
+    Devuelve 'created', 'rebuilt' o None si se usa la existente. Una plantilla
+    sin metadatos (propia) se usa tal cual.
+    """
+    if os.path.exists(path):
+        if not os.path.exists(_meta_path(path)):
+            return None
+        with open(_meta_path(path), encoding='utf-8') as f:
+            if json.load(f) == template_signature(frames):
+                return None
+        status = 'rebuilt'
+    else:
+        status = 'created'
+    build_template(path, frames)
+    return status
+
+
+def build_template(path, frames):
+    """Crea la plantilla por defecto con el formato del reporte
+
+    `frames` es {hoja: DataFrame} con las columnas de cada hoja de datos; su
+    primera fila se escribe como fila modelo (formatos) y los anchos salen
+    de todo el frame. Agrega Key_Metrics con fórmulas sobre Division_Summary
+    y nombres definidos sobre los resúmenes.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+    from openpyxl.workbook.defined_name import DefinedName
+    from openpyxl.utils import get_column_letter, quote_sheetname
+
+    from reporting.formatting import column_widths, format_summary_sheet
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for name, df in frames.items():
+        sheet = workbook.create_sheet(name)
+        sample = df.head(1)
+        sheet.append([str(col) for col in df.columns])
+        for row in sample.astype(object).where(sample.notna(), None).itertuples(index=False):
+            sheet.append(list(row))
+        last_col = get_column_letter(len(df.columns))
+        if name in ('Division_Summary', 'Lead_Summary'):
+            format_summary_sheet(sheet, sample)
+            workbook.defined_names[name.replace('_', '')] = DefinedName(
+                name.replace('_', ''), attr_text=f'{quote_sheetname(name)}!$A$1:${last_col}$2')
+        else:
+            for cell in sheet[1]:
+                cell.font = Font(bold=True)
+            for idx, col in enumerate(df.columns, 1):
+                if pd.api.types.is_datetime64_any_dtype(df[col]):
+                    sheet.cell(row=2, column=idx).number_format = DATE_FORMAT
+            sheet.auto_filter.ref = f'A1:{last_col}2'
+        for letter, width in column_widths(df.head(BLOCK_ROWS)).items():
+            sheet.column_dimensions[letter].width = width
+        sheet.freeze_panes = 'A2'
+
+    if 'Division_Summary' in frames:
+        _key_metrics_sheet(workbook.create_sheet('Key_Metrics'), frames['Division_Summary'].columns)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    workbook.save(path)
+    with open(_meta_path(path), 'w', encoding='utf-8') as f:
+        json.dump(template_signature(frames), f, indent=2)
+    return path
+
+
+def _key_metrics_sheet(sheet, columns):
+    """KPIs del último año como fórmulas sobre las filas TOTAL de Division_Summary"""
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    def column(name):
+        letter = get_column_letter(list(columns).index(name) + 1)
+        return f'Division_Summary!${letter}:${letter}'
+
+    total = f'{column("Division")},"TOTAL",{column("Year")},$B$3'
+    sheet['A1'] = 'MÉTRICAS CLAVE'
+    sheet['A1'].font = Font(bold=True, size=14)
+    rows = [
+        ('Año', f'=MAX({column("Year")})', '0'),
+        ('Total Oportunidades', f'=SUMIFS({column("Total_Opp")},{total})', '#,##0'),
+        ('Aprobadas', f'=SUMIFS({column("Approved")},{total})', '#,##0'),
+        ('Revenue Aprobado', f'=SUMIFS({column("Approved_Revenue")},{total})', '$#,##0'),
+        ('Close Rate', '=IF(B4=0,0,B5/B4)', '0.00%'),
+    ]
+    for row, (label, formula, number_format) in enumerate(rows, 3):
+        sheet.cell(row=row, column=1, value=label)
+        cell = sheet.cell(row=row, column=2, value=formula)
+        cell.number_format = number_format
+    sheet.column_dimensions['A'].width = 24
+    sheet.column_dimensions['B'].width = 18
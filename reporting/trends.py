@@ -0,0 +1,211 @@
+"""Series de tendencia mensuales / trimestrales / anuales con YoY y deltas
+
+Cada oportunidad cae en el periodo de su fecha de año (la misma regla que
+Year: LastStageChangeDate para Approved/Lost, si no Created_Date). Los
+periodos se codifican como enteros (año * periodos por año + índice), así
+se reutiliza el cubo base y rollup() de reporting.rollup con el periodo en
+lugar del año: una pasada sobre el detalle por frecuencia, y las series por
+división, lead type y total salen de sumar ese cubo.
+
+La serie anual usa la columna Year (incluye el año por defecto de las
+filas sin fecha) y cuadra con los resúmenes; las mensuales y trimestrales
+dejan fuera las filas sin fecha.
+
+Sobre la grilla completa de periodos (los huecos cuentan como cero) se
+calculan YoY (mismo periodo del año anterior), delta contra el periodo
+anterior y media móvil.
+"""
+from reporting.lazy import lazy_import
+from reporting.rollup import (AMOUNT_COLUMNS, COUNT_COLUMNS, DEFAULT_DIMENSIONS, DERIVED_COLUMNS,
+                              add_derived_metrics, build_base_cube, rollup)
+from reporting.years import CLOSED_STAGES
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Frecuencia -> (etiqueta, periodos por año)
+FREQUENCIES = {
+    'M': ('Monthly', 12),
+    'Q': ('Quarterly', 4),
+    'Y': ('Yearly', 1),
+}
+
+# Métricas con YoY / delta; las tasas se comparan en puntos porcentuales
+TREND_METRICS = ['Total_Opp', 'Approved', 'Approved_Revenue', 'CloseRate_Std']
+RATE_METRICS = ['CloseRate_Std']
+
+# Periodos de la media móvil por frecuencia
+ROLLING_WINDOWS = {'M': 3, 'Q': 4, 'Y': 3}
+
+TOTAL_LABEL = 'TOTAL'
+
+TREND_COLUMNS = (['Period', 'Year', 'Dimension', 'Value'] + COUNT_COLUMNS + AMOUNT_COLUMNS + DERIVED_COLUMNS
+                 + [f'{metric}_YoY' for metric in TREND_METRICS]
+                 + [f'{metric}_Delta' for metric in TREND_METRICS]
+                 + ['Total_Opp_Rolling', 'Approved_Revenue_Rolling'])
+
+# Columnas en % (el valor se guarda x100 como CloseRate_Std), en puntos y en moneda para Excel
+PERCENT_TREND_COLUMNS = ['CloseRate_Std', 'CloseRate_NoLost'] + [
+    f'{metric}_YoY' for metric in TREND_METRICS if metric not in RATE_METRICS]
+POINT_TREND_COLUMNS = [f'{metric}_{kind}' for metric in RATE_METRICS for kind in ('YoY', 'Delta')]
+CURRENCY_TREND_COLUMNS = AMOUNT_COLUMNS + ['Average_Ticket', 'Approved_Revenue_Delta', 'Approved_Revenue_Rolling']
+
+PERIOD_FORMATS = {'M': 'yyyy-mm', 'Q': 'yyyy-mm', 'Y': 'yyyy'}
+
+
+def bucket_dates(df):
+    """Fecha que define el año de cada fila (NaT si no tiene)"""
+    last_change = df['LastStageChangeDate'].to_numpy()
+    use_last_change = df['StageName'].isin(CLOSED_STAGES).to_numpy() & ~np.isnat(last_change)
+    return pd.Series(np.where(use_last_change, last_change, df['Created_Date'].to_numpy()), index=df.index)
+
+
+def period_ordinals(df, freq):
+    """Periodo de cada fila como entero año * periodos + índice (float con NaN si no tiene fecha)"""
+    per_year = FREQUENCIES[freq][1]
+    if per_year == 1:
+        return df['Year'].astype('float64')
+    dates = bucket_dates(df).dt
+    return dates.year * per_year + (dates.month - 1) // (12 // per_year)
+
+
+def _period_start(ordinals, per_year):
+    years, index = np.divmod(ordinals, per_year)
+    months = index * (12 // per_year) + 1
+    return pd.to_datetime(pd.DataFrame({'year': years, 'month': months, 'day': 1}))
+
+
+def _complete_grid(series, per_year):
+    """Agrega los periodos sin oportunidades (en cero) entre el primero y el último"""
+    ordinals = np.arange(series['Period'].min(), series['Period'].max() + 1)
+    if per_year == 1:
+        ordinals = ordinals[ordinals > 0]
+    keys = series[['Dimension', 'Value']].drop_duplicates()
+    grid = keys.merge(pd.DataFrame({'Period': ordinals}), how='cross')
+    values = COUNT_COLUMNS + AMOUNT_COLUMNS
+    full = grid.merge(series[['Dimension', 'Value', 'Period'] + values], how='left',
+                      on=['Dimension', 'Value', 'Period'])
+    full[values] = full[values].fillna(0)
+    full[COUNT_COLUMNS] = full[COUNT_COLUMNS].astype('int64')
+    return add_derived_metrics(full)
+
+
+def trend_series(df, freq='M', dims=None, total_label=TOTAL_LABEL):
+    """Serie larga (Period, Year, Dimension, Value, métricas, YoY, deltas) para `freq`
+
+    `df` es el frame preparado. Dimension es el nombre de la dimensión
+    ('Division', 'LeadType') o TOTAL; Value su valor.
+    """
+    per_year = FREQUENCIES[freq][1]
+    dims = list(DEFAULT_DIMENSIONS if dims is None else dims)
+    ordinals = period_ordinals(df, freq)
+    valid = ordinals.notna().to_numpy()
+    if not valid.any():
+        return pd.DataFrame(columns=TREND_COLUMNS)
+
+    # Cubo base con el periodo en la columna Year: rollup() da cada dimensión y el total
+    cube = build_base_cube(df[valid].assign(Year=ordinals[valid].astype('int64')), dims)
+    parts = []
+    for dim in dims:
+        summary = rollup(cube, dim, total_label).rename(columns={'Year': 'Period', dim: 'Value'})
+        is_total = (summary['Value'] == total_label).to_numpy()
+        if not parts:
+            parts.append(summary[is_total].assign(Dimension=total_label))
+        parts.append(summary[~is_total].assign(Dimension=dim))
+    series = _complete_grid(pd.concat(parts, ignore_index=True), per_year)
+
+    # YoY, delta y media móvil dentro de cada (Dimension, Value) sobre la grilla completa
+    series = series.sort_values(['Dimension', 'Value', 'Period'], kind='stable').reset_index(drop=True)
+    groups = series.groupby(['Dimension', 'Value'], sort=False)
+    for metric in TREND_METRICS:
+        previous_year = groups[metric].shift(per_year)
+        if metric in RATE_METRICS:
+            series[f'{metric}_YoY'] = (series[metric] - previous_year).round(2)
+        else:
+            change = (series[metric] - previous_year) / previous_year.where(previous_year != 0) * 100
+            series[f'{metric}_YoY'] = change.round(2)
+        series[f'{metric}_Delta'] = series[metric] - groups[metric].shift(1)
+    window = ROLLING_WINDOWS[freq]
+    for metric in ('Total_Opp', 'Approved_Revenue'):
+        series[f'{metric}_Rolling'] = (groups[metric].rolling(window, min_periods=1).mean()
+                                       .reset_index(level=[0, 1], drop=True).round(2))
+
+    series['Year'] = (series['Period'] // per_year).astype('int64')
+    series['Period'] = _period_start(series['Period'].to_numpy(), per_year)
+
+    # TOTAL primero (filas contiguas para los gráficos), luego cada dimensión
+    order = {name: i for i, name in enumerate([total_label] + dims)}
+    series = series.sort_values(['Dimension', 'Value', 'Period'], key=lambda col: col.map(order)
+                                if col.name == 'Dimension' else col, kind='stable')
+    return series[TREND_COLUMNS].reset_index(drop=True)
+
+
+def trend_tables(df, freqs=None, dims=None):
+    """{frecuencia: serie} para cada frecuencia de `freqs` (por defecto M, Q e Y)"""
+    return {freq: trend_series(df, freq, dims) for freq in (freqs or list(FREQUENCIES))}
+
+
+def write_trend_sheet(workbook, series, freq, sheet_name=None):
+    """Escribe la serie como celdas numéricas con formato y agrega gráficos del TOTAL
+
+    Line chart de oportunidades / aprobadas y bar chart de revenue aprobado
+    por periodo (las filas TOTAL van primero y son contiguas).
+    """
+    from openpyxl.chart import BarChart, LineChart, Reference
+    from openpyxl.utils import get_column_letter
+
+    from reporting.formatting import column_widths, register_styles
+
+    sheet = workbook.create_sheet(sheet_name or f'Trend_{FREQUENCIES[freq][0]}')
+    register_styles(workbook)
+    excel = series.copy()
+    for col in PERCENT_TREND_COLUMNS:
+        excel[col] = excel[col] / 100
+
+    sheet.append(list(excel.columns))
+    for cell in sheet[1]:
+        cell.style = 'summary_header'
+    # NaN (sin año anterior, división por cero) queda como celda vacía
+    for row in excel.astype(object).where(excel.notna(), None).itertuples(index=False):
+        sheet.append(list(row))
+
+    last_row = len(excel) + 1
+    formats = {'Period': PERIOD_FORMATS[freq]}
+    formats.update(dict.fromkeys(CURRENCY_TREND_COLUMNS, '$#,##0'))
+    formats.update(dict.fromkeys(PERCENT_TREND_COLUMNS, '0.00%'))
+    formats.update(dict.fromkeys(POINT_TREND_COLUMNS, '+0.00;-0.00;0.00'))
+    for name, number_format in formats.items():
+        col_idx = excel.columns.get_loc(name) + 1
+        for (cell,) in sheet.iter_rows(min_row=2, max_row=last_row, min_col=col_idx, max_col=col_idx):
+            cell.number_format = number_format
+    for letter, width in column_widths(excel).items():
+        sheet.column_dimensions[letter].width = width
+    sheet.column_dimensions['A'].width = 12
+    sheet.freeze_panes = 'E2'
+
+    total_rows = int((series['Dimension'] == TOTAL_LABEL).sum())
+    if not total_rows:
+        return sheet
+    anchor = get_column_letter(len(excel.columns) + 2)
+    categories = Reference(sheet, min_col=1, min_row=2, max_row=total_rows + 1)
+
+    line = LineChart()
+    line.title = f'Oportunidades ({FREQUENCIES[freq][0]})'
+    line.y_axis.title = 'Oportunidades'
+    for name in ('Total_Opp', 'Approved'):
+        col_idx = excel.columns.get_loc(name) + 1
+        line.add_data(Reference(sheet, min_col=col_idx, min_row=1, max_row=total_rows + 1), titles_from_data=True)
+    line.set_categories(categories)
+    line.x_axis.number_format = PERIOD_FORMATS[freq]
+    line.width, line.height = 24, 8
+    sheet.add_chart(line, f'{anchor}2')
+
+    bar = BarChart()
+    bar.title = f'Revenue aprobado ({FREQUENCIES[freq][0]})'
+    col_idx = excel.columns.get_loc('Approved_Revenue') + 1
+    bar.add_data(Reference(sheet, min_col=col_idx, min_row=1, max_row=total_rows + 1), titles_from_data=True)
+    bar.set_categories(categories)
+    bar.x_axis.number_format = PERIOD_FORMATS[freq]
+    bar.width, bar.height = 24, 8
+    sheet.add_chart(bar, f'{anchor}20')
+    return sheet
@@ -0,0 +1,40 @@
+"""Asignación vectorizada del año fiscal (YearValue) para el detalle de oportunidades"""
+from reporting.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Stages cerrados: su año se toma de LastStageChangeDate
+CLOSED_STAGES = ['Approved', 'Lost']
+
+# Año usado por generate_real_pivot cuando no hay ninguna fecha válida
+DEFAULT_FALLBACK_YEAR = 2024
+
+
+def resolve_year(df, fallback=DEFAULT_FALLBACK_YEAR):
+    """Calcula Year según las reglas de negocio sin recorrer fila por fila
+
+    Equivale al CASE del query SQL:
+      - Approved / Lost con LastStageChangeDate -> año de LastStageChangeDate
+      - resto -> año de Created_Date
+      - sin fechas válidas -> `fallback` (2024 en generate_real_pivot,
+        None en generate_pivot_excel, que deja el año vacío)
+
+    Las columnas de fecha ya deben venir convertidas a datetime.
+    Devuelve int64 si no quedan vacíos, float64 con NaN en caso contrario
+    (mismo resultado que el antiguo df.apply).
+    """
+    closed = df['StageName'].isin(CLOSED_STAGES).to_numpy()
+    last_change = df['LastStageChangeDate']
+    use_last_change = closed & last_change.notna().to_numpy()
+
+    years = np.where(use_last_change,
+                     last_change.dt.year.to_numpy(dtype='float64', na_value=np.nan),
+                     df['Created_Date'].dt.year.to_numpy(dtype='float64', na_value=np.nan))
+    year = pd.Series(years, index=df.index, name='Year')
+
+    if fallback is not None:
+        year = year.fillna(fallback)
+    if not year.isna().any():
+        year = year.astype('int64')
+    return year
@@ -144,6 +144,14 @@ async function getLeadSummary() {
 }
 
 async function getOpportunityDetail(filters = {}) {
+    // Validate before connecting: a bad date is a client error (400), not a query failure
+    const changedSince = filters.changedSince ? new Date(filters.changedSince) : null;
+    if (changedSince && Number.isNaN(changedSince.getTime())) {
+        const error = new Error(`Invalid changedSince date: ${filters.changedSince}`);
+        error.statusCode = 400;
+        throw error;
+    }
+
     try {
         const pool = await getConnection();
         let query = opportunityDetailQuery;
@@ -186,6 +194,12 @@ async function getOpportunityDetail(filters = {}) {
             });
         }
 
+        // Incremental filter: only rows created or moved to another stage since the given date
+        if (filters.changedSince) {
+            conditions.push('(LastStageChangeDate >= @changedSince OR Created_Date >= @changedSince)');
+            request.input('changedSince', sql.DateTime2, changedSince);
+        }
+
         if (conditions.length > 0) {
             query += ' AND ' + conditions.join(' AND ');
         }
@@ -0,0 +1,147 @@
+"""Pruebas del estado de agregación incremental"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot
+from reporting.aggregate_state import apply_delta, load_state, refresh_state, save_state, summaries
+from reporting.client import create_session, detail_partitions
+from reporting.rollup import build_base_cube, rollup_all
+from reporting.snapshot import fetch_detail_cached, upsert
+
+
+def load_rows():
+    return json.loads(RESPONSE_FILE.read_bytes())['data']
+
+
+def make_delta(rows, seed=0):
+    """Cambios de stage, monto y año sobre filas existentes, más oportunidades nuevas"""
+    rng = np.random.default_rng(seed)
+    changed = [dict(rows[i]) for i in rng.choice(len(rows), 400, replace=False)]
+    for i, row in enumerate(changed):
+        kind = i % 4
+        if kind == 0:
+            row['StageName'] = 'Approved'
+        elif kind == 1:
+            row['StageName'] = 'Estimate'
+        elif kind == 2:
+            row['Amount'] = round(float(rng.uniform(0, 50_000)), 2)
+        else:
+            row['StageName'] = 'Lost'
+            row['LastStageChangeDate'] = '2026-02-01T00:00:00.000Z'
+    new = [dict(rows[i], Id=f'NEW{i:013d}', Division=None if i % 5 == 0 else rows[i]['Division'])
+           for i in range(60)]
+    return changed + new
+
+
+def assert_same_summaries(state, df_prepared):
+    expected = rollup_all(df_prepared)
+    for dim, frame in summaries(state).items():
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected[dim].reset_index(drop=True),
+                                      check_dtype=False)
+
+
+def test_delta_updates_match_full_recomputation(tmp_path):
+    snapshot = pd.DataFrame(load_rows())
+    state = build_base_cube(prepare_data_for_pivot(snapshot.copy()))
+
+    # El estado sobrevive a la persistencia y sigue siendo sumable
+    path = str(tmp_path / 'state.parquet')
+    save_state(state, {'dims': ['Division', 'LeadType']}, path)
+    state, _ = load_state(path)
+
+    for seed in (0, 1):
+        delta = pd.DataFrame(make_delta(load_rows(), seed))
+        previous = snapshot[snapshot['Id'].isin(delta['Id'])]
+        state = apply_delta(state, prepare_data_for_pivot(previous.copy()), prepare_data_for_pivot(delta.copy()))
+        snapshot = upsert(snapshot, delta)
+
+        assert_same_summaries(state, prepare_data_for_pivot(snapshot.copy()))
+
+
+def test_refresh_state_follows_snapshot_deltas(stub_api, tmp_path):
+    rows = load_rows()
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    state_path = str(tmp_path / 'state.parquet')
+    stub_api.detail = rows
+
+    with create_session() as session:
+        for detail_rows in (rows, make_delta(rows)):
+            changes = {}
+            if detail_rows is not rows:
+                # El API devuelve todo; el stub filtra por changedSince
+                for row in detail_rows:
+                    row['Created_Date'] = '2099-01-01T00:00:00.000Z'
+                stub_api.detail = rows + detail_rows
+            detail = fetch_detail_cached(session, stub_api.base_url, path=snapshot_path,
+                                         on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                          delta=delta))
+            df_prepared = prepare_data_for_pivot(detail.copy())
+            state = refresh_state(df_prepared, prepare_data_for_pivot, path=state_path,
+                                  snapshot_path=snapshot_path, **changes)
+            assert_same_summaries(state, df_prepared)
+
+    _, meta = load_state(state_path)
+    assert meta['mode'] == 'delta'
+
+
+def test_state_is_rebuilt_when_snapshot_advanced_without_it(stub_api, tmp_path):
+    rows = load_rows()
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    state_path = str(tmp_path / 'state.parquet')
+    stub_api.detail = rows
+
+    def run(session):
+        changes = {}
+        detail = fetch_detail_cached(session, stub_api.base_url, path=snapshot_path,
+                                     on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                      delta=delta))
+        df_prepared = prepare_data_for_pivot(detail.copy())
+        state = refresh_state(df_prepared, prepare_data_for_pivot, path=state_path,
+                              snapshot_path=snapshot_path, **changes)
+        assert_same_summaries(state, df_prepared)
+        return load_state(state_path)[1]['mode']
+
+    with create_session() as session:
+        assert run(session) == 'full'
+        # Otra corrida (ej. --fetch-only o el servicio) avanza el snapshot sin tocar el estado:
+        # solo cambios de stage, el total de oportunidades no cambia
+        moved = [dict(row, StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')
+                 for row in rows[:30] if row['StageName'] != 'Approved']
+        stub_api.detail = rows + moved
+        fetch_detail_cached(session, stub_api.base_url, path=snapshot_path)
+        # El delta siguiente parte de la versión nueva: el estado quedó atrás
+        stub_api.detail = rows + moved + [dict(rows[40], StageName='Lost',
+                                               LastStageChangeDate='2099-01-02T00:00:00.000Z')]
+        assert run(session) == 'full'
+        # Ya al día: el próximo delta sí se aplica
+        assert run(session) == 'delta'
+
+
+def test_filtered_state_drops_opportunities_that_leave_the_filter(stub_api, tmp_path):
+    rows = load_rows()
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    state_path = str(tmp_path / 'state.parquet')
+    partitions = detail_partitions(years=[2023])
+    stub_api.detail = rows
+
+    with create_session() as session:
+        for step in range(2):
+            if step:
+                # Aprobadas en otro año salen del filtro; el resto cambia de stage dentro de él
+                stamp = {'StageName': 'Approved', 'LastStageChangeDate': '2099-01-01T00:00:00.000Z'}
+                stub_api.detail = ([dict(row, YearValue=2099, **stamp) for row in rows[:20]]
+                                   + [dict(row, **stamp) for row in rows[20:30]] + rows[30:])
+            changes = {}
+            detail = fetch_detail_cached(session, stub_api.base_url, partitions, path=snapshot_path,
+                                         on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                          delta=delta))
+            df_prepared = prepare_data_for_pivot(detail.copy())
+            state = refresh_state(df_prepared, prepare_data_for_pivot, path=state_path,
+                                  snapshot_path=snapshot_path, **changes)
+            assert_same_summaries(state, df_prepared)
+
+    assert len(detail) == len(rows) - 20
+    assert load_state(state_path)[1]['mode'] == 'delta'
@@ -0,0 +1,45 @@
+"""Pruebas del modo lote (un workbook por partición) de generate_real_pivot"""
+import glob
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import main, prepare_data_for_pivot
+from reporting.batch import partition_cube, partition_positions, partition_values, shared_cube
+from reporting.local_sql import read_detail_source
+from reporting.rollup import build_base_cube, rollup
+
+
+def test_partition_cubes_match_cubes_built_from_each_partition():
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE)))
+    partitions = partition_positions(partition_values(df, 'State'))
+
+    assert set(partitions) == {'TX', 'LA', 'CO', None}
+    assert sum(len(positions) for positions in partitions.values()) == len(df)
+
+    cube = shared_cube(df, 'State')
+    for value, positions in partitions.items():
+        for dim in ('Division', 'LeadType'):
+            expected = rollup(build_base_cube(df.iloc[positions]), dim).reset_index(drop=True)
+            result = rollup(partition_cube(cube, 'State', value), dim).reset_index(drop=True)
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_cli_batch_writes_one_workbook_per_partition_and_manifest(tmp_path):
+    results = main(['--batch', 'lead-type', '--jobs', '2', '--source', str(RESPONSE_FILE),
+                    '--output-dir', str(tmp_path)])
+
+    assert sorted(value for value, _, _, _ in results) == ['CompanyLead', 'SelfGenerated']
+    (manifest_path,) = glob.glob(os.path.join(tmp_path, 'Opportunity_Batch_LeadType_*.json'))
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['key'] == 'LeadType' and manifest['rows'] == 3695
+    assert [entry['rows'] for entry in manifest['partitions']] == [1973, 1722]
+
+    summary = pd.read_excel(tmp_path / manifest['partitions'][0]['file'], sheet_name='Lead_Summary')
+    assert set(summary['LeadType']) == {'CompanyLead', 'TOTAL'}
+    assert summary.loc[summary['LeadType'] == 'TOTAL', 'Total_Opp'].sum() == 1973
@@ -0,0 +1,68 @@
+"""Pruebas de la línea de comandos de generate_real_pivot"""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import main, prepare_data_for_pivot
+from reporting.aggregate_state import load_state, summaries
+from reporting.rollup import rollup_all
+from reporting.snapshot import load_snapshot, snapshot_version
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_cli_fetches_once_and_builds_selected_artifacts(stub_api, tmp_path):
+    results = main(['--native', '--csv', '--parquet', '--no-cache', '--year', '2023',
+                    '--base-url', stub_api.base_url, '--output-dir', str(tmp_path)])
+
+    detail_requests = [query for path, query in stub_api.requests if path == '/api/opportunity-detail']
+    assert detail_requests == [{'year': ['2023']}]
+
+    assert [name for name, _, _ in results] == ['native', 'csv', 'parquet']
+    assert all(os.path.exists(filename) for _, filename, _ in results)
+
+    detail = pd.read_parquet(results[2][1])
+    assert len(detail) == 3695
+    assert detail['ApprovedAmount'].sum() == detail.loc[detail['StageName'] == 'Approved', 'Amount'].sum()
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_fetch_only_keeps_aggregate_state_in_step_with_snapshot(stub_api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = json.loads(RESPONSE_FILE.read_bytes())['data']
+    stub_api.detail = rows
+    main(['--fetch-only', '--base-url', stub_api.base_url])
+
+    moved = [dict(row, StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')
+             for row in rows[:30] if row['StageName'] != 'Approved']
+    stub_api.detail = rows + moved
+    main(['--fetch-only', '--base-url', stub_api.base_url])
+
+    state, meta = load_state()
+    snapshot, snapshot_meta = load_snapshot()
+    assert meta['mode'] == 'delta' and meta['snapshot'] == snapshot_version(snapshot_meta)
+    expected = rollup_all(prepare_data_for_pivot(snapshot))['Division']
+    pd.testing.assert_frame_equal(summaries(state)['Division'].reset_index(drop=True),
+                                  expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_api_runs_reuse_the_prepared_frame_of_the_same_snapshot_version(stub_api, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    rows = json.loads(RESPONSE_FILE.read_bytes())['data']
+    stub_api.detail = rows
+    args = ['--csv', '--base-url', stub_api.base_url, '--output-dir', str(tmp_path / 'out')]
+
+    main(args)
+    assert 'frame preparado' not in capsys.readouterr().out
+    main(args)
+    assert '[CACHE] HIT: frame preparado (3695 registros)' in capsys.readouterr().out
+
+    # Un delta con cambios es otra versión del snapshot: se vuelve a preparar
+    stub_api.detail = rows + [dict(rows[0], StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')]
+    (_, filename, _), = main(args)
+    assert 'frame preparado' not in capsys.readouterr().out
+    detail = pd.read_csv(filename)
+    assert detail.loc[detail['Id'] == rows[0]['Id'], 'StageName'].tolist() == ['Approved']
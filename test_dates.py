@@ -0,0 +1,34 @@
+"""Pruebas del parseo rápido de fechas del API contra pd.to_datetime"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import RESPONSE_FILE
+from reporting.dates import parse_api_dates, to_epoch
+
+
+def legacy(values):
+    return pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+@pytest.mark.parametrize('kind', ['str', 'object', 'category'])
+@pytest.mark.parametrize('col', ['Created_Date', 'LastStageChangeDate'])
+def test_parse_matches_to_datetime_on_api_detail(col, kind):
+    values = pd.DataFrame(json.loads(RESPONSE_FILE.read_bytes())['data'])[col]
+    values = values if kind == 'str' else values.astype(kind)
+
+    pd.testing.assert_series_equal(parse_api_dates(values), legacy(values))
+
+    epoch, expected = to_epoch(values, 'ms'), legacy(values)
+    assert epoch.isna().equals(expected.isna())
+    assert (epoch.dropna().to_numpy() == expected.dropna().to_numpy().astype('datetime64[ms]').view('int64')).all()
+
+
+def test_values_outside_api_format_fall_back_to_to_datetime():
+    values = pd.Series(['2023-04-24T15:50:25.123Z', None, '2023-13-01T00:00:00.000Z', 'sin fecha', '', np.nan],
+                       dtype=object)
+
+    pd.testing.assert_series_equal(parse_api_dates(values), legacy(values))
+    assert to_epoch(values, 's').tolist() == [1682351425] + [pd.NA] * 5
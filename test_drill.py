@@ -0,0 +1,60 @@
+"""Pruebas del índice de drill-through"""
+import numpy as np
+import openpyxl
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot, write_real_pivots_workbook
+from reporting.drill import BUCKETS, DrillIndex
+from reporting.ingest import read_detail_file
+from reporting.rollup import stage_class
+
+
+def prepared_detail():
+    raw = read_detail_file(str(RESPONSE_FILE))
+    rng = np.random.default_rng(1)
+    raw.loc[rng.random(len(raw)) < 0.3, 'LastStageChangeDate'] = '2025-03-01T00:00:00.000Z'
+    raw.loc[rng.random(len(raw)) < 0.05, 'LeadType'] = None
+    return prepare_data_for_pivot(raw)
+
+
+def test_lookup_matches_full_scan():
+    df = prepared_detail()
+    index = DrillIndex(df)
+    classes = np.asarray(stage_class(df['StageName']))
+
+    for dim in index.dims:
+        for year in df['Year'].unique().tolist():
+            for value in df[dim].dropna().unique().tolist() + ['TOTAL']:
+                for bucket in BUCKETS:
+                    mask = (df['Year'] == year).to_numpy().copy()
+                    if value != 'TOTAL':
+                        mask &= (df[dim] == value).to_numpy()
+                    if bucket != 'Total':
+                        mask &= classes == bucket
+
+                    positions = index.lookup(dim, year, value, bucket)
+                    assert positions.dtype == np.int32
+                    assert np.array_equal(positions, np.flatnonzero(mask))
+
+                    block = index.sheet_block(dim, year, value, bucket)
+                    if block is not None:
+                        assert np.array_equal(np.sort(index.order(dim)[block[0]:block[1]]), positions)
+
+
+def test_summary_cells_link_to_contiguous_blocks(tmp_path):
+    df = prepared_detail()
+    filename = write_real_pivots_workbook(df, str(tmp_path / 'report.xlsx'))
+    workbook = openpyxl.load_workbook(filename)
+
+    sheet = workbook['Lead_Summary']
+    header = [cell.value for cell in sheet[1]]
+    row = next(r for r in sheet.iter_rows(min_row=2) if r[1].value != 'TOTAL')
+    link = row[header.index('Lost')].hyperlink.location
+    sheet_name, cells = link.split('!')
+    first, last = (int(ref.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')) for ref in cells.split(':'))
+
+    assert sheet_name == "'Drill_LeadType'"
+    assert last - first + 1 == row[header.index('Lost')].value
+    drill = workbook['Drill_LeadType']
+    stage_col = [cell.value for cell in drill[1]].index('StageName')
+    assert {drill.cell(row=r, column=stage_col + 1).value for r in range(first, last + 1)} == {'Lost'}
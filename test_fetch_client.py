@@ -0,0 +1,31 @@
+"""Pruebas del cliente HTTP contra un servidor local que sirve test-response.json"""
+from reporting.client import create_session, detail_partitions, fetch_all
+
+
+def test_fetch_all_returns_detail_and_summaries(stub_api):
+    data = fetch_all(stub_api.base_url, timeout=5)
+
+    assert len(data['detail']) == 3695
+    assert list(data['division_summary'].columns) == ['Year', 'TotalOpp']
+    assert len(data['lead_summary']) == 1
+
+
+def test_fetch_all_fans_out_detail_partitions(stub_api):
+    partitions = detail_partitions(years=[2023, 2024], divisions=['Residential Reroof'])
+    data = fetch_all(stub_api.base_url, partitions=partitions, timeout=5)
+
+    # Todo test-response.json es de 2023
+    assert len(data['detail']) == 3695
+    seen = sorted(query['year'][0] for path, query in stub_api.requests
+                  if path == '/api/opportunity-detail')
+    assert seen == ['2023', '2024']
+
+
+def test_fetch_all_retries_transient_errors(stub_api):
+    stub_api.failures['/api/division-summary'] = 2
+    with create_session(retries=3, backoff=0) as session:
+        data = fetch_all(stub_api.base_url, session=session, timeout=5)
+
+    assert len(data['division_summary']) == 1
+    hits = [path for path, _ in stub_api.requests if path == '/api/division-summary']
+    assert len(hits) == 3
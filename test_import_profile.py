@@ -0,0 +1,60 @@
+"""Perfil de importación (`python -X importtime`) de los scripts: --help y --fetch-only sin las librerías pesadas"""
+import subprocess
+import sys
+from pathlib import Path
+
+from conftest import RESPONSE_FILE
+
+ROOT = Path(__file__).parent
+
+EXCEL = {'openpyxl', 'xlsxwriter'}
+HEAVY = EXCEL | {'pandas', 'numpy', 'pyarrow', 'requests'}
+
+
+def import_profile(*args, cwd=None):
+    """(stdout, {módulo: (nivel, microsegundos acumulados)}) de correr el script con -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=cwd, capture_output=True,
+                            text=True, check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                # Dos espacios de sangría por nivel de anidamiento
+                profile[name.strip()] = ((len(name) - len(name.lstrip()) - 1) // 2, int(cumulative))
+    return result.stdout, profile
+
+
+def packages(profile):
+    return {name.split('.')[0] for name in profile}
+
+
+def summary(label, profile, top=5):
+    # Solo los imports de primer nivel: su tiempo acumulado incluye el de lo que importan
+    roots = {name: us for name, (level, us) in profile.items() if level == 0}
+    slowest = sorted(roots.items(), key=lambda item: item[1], reverse=True)[:top]
+    return (f"[IMPORTTIME] {label}: {sum(roots.values()) / 1000:.0f} ms; "
+            + ', '.join(f'{name} {us / 1000:.0f} ms' for name, us in slowest))
+
+
+def test_help_does_not_import_heavy_dependencies():
+    for script in ('generate_real_pivot.py', 'generate_pivot_excel.py', 'report_service.py'):
+        out, profile = import_profile(str(ROOT / script), '--help')
+        print(summary(f'{script} --help', profile))
+        assert 'usage:' in out
+        assert not packages(profile) & HEAVY, script
+
+
+def test_fetch_only_fills_prepared_cache_without_excel_stack(tmp_path):
+    args = [str(ROOT / 'generate_real_pivot.py'), '--fetch-only', '--source', str(RESPONSE_FILE),
+            '--prepared-cache', str(tmp_path / 'prepared')]
+    out, profile = import_profile(*args, cwd=tmp_path)
+    print(summary('generate_real_pivot.py --fetch-only', profile))
+    assert '3695 registros' in out and len(list((tmp_path / 'prepared').glob('*.arrow'))) == 1
+    assert {'pandas', 'pyarrow'} <= packages(profile)
+    assert not packages(profile) & EXCEL
+
+    out, profile = import_profile(*args, cwd=tmp_path)
+    assert '[CACHE] HIT' in out and 'pandas' not in packages(profile)
+    # Nada de lo escrito por --fetch-only queda fuera de la caché indicada
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['prepared']
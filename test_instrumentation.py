@@ -0,0 +1,37 @@
+"""Pruebas de la instrumentación por etapa de generate_real_pivot"""
+import json
+
+import pytest
+
+from generate_real_pivot import main
+from reporting.instrumentation import StageRecorder, recording, stage
+
+
+def test_nested_stages_record_time_rows_and_peak():
+    with recording(StageRecorder()) as recorder:
+        with stage('outer', rows=10):
+            with stage('inner') as record:
+                block = bytearray(4 * 1024 * 1024)
+                record['rows'] = len(block)
+            del block
+
+    outer, inner = recorder.records
+    assert (outer['stage'], outer['rows'], inner['rows']) == ('outer', 10, 4 * 1024 * 1024)
+    assert inner['peak_mb'] >= 4 and outer['peak_mb'] >= inner['peak_mb']
+    assert outer['wall_s'] >= inner['wall_s'] >= 0
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_cli_writes_stage_records_as_json_lines(stub_api, tmp_path):
+    log = tmp_path / 'stages.jsonl'
+    main(['--csv', '--parquet', '--jobs', '2', '--no-cache', '--base-url', stub_api.base_url,
+          '--output-dir', str(tmp_path), '--instrument-json', str(log)])
+
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    stages = [record['stage'] for record in records]
+    for name in ('fetch', 'prepare', 'prepare.schema', 'csv/write', 'parquet/write'):
+        assert name in stages
+    assert len({record['run_id'] for record in records}) == 1
+    assert all(record['script'] == 'generate_real_pivot' for record in records)
+    fetch = records[stages.index('fetch')]
+    assert fetch['rows'] == 3695 and fetch['wall_s'] > 0 and fetch['peak_mb'] is not None
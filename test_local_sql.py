@@ -0,0 +1,32 @@
+"""Pruebas del backend SQL local contra el motor de resúmenes en pandas"""
+import numpy as np
+import pytest
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import main, prepare_data_for_pivot
+from reporting.local_sql import read_detail_source, rollup_sql, verify_against_pandas
+
+
+def test_sqlite_rollups_match_pandas_row_for_row():
+    raw = read_detail_source(str(RESPONSE_FILE))
+    # Varios años, nulos en fechas / división / monto para cubrir el fallback y los totales
+    rng = np.random.default_rng(0)
+    raw.loc[rng.random(len(raw)) < 0.3, 'LastStageChangeDate'] = '2025-03-01T00:00:00.000Z'
+    raw.loc[rng.random(len(raw)) < 0.05, 'Created_Date'] = None
+    raw.loc[rng.random(len(raw)) < 0.05, 'Division'] = None
+    raw.loc[rng.random(len(raw)) < 0.05, 'Amount'] = None
+
+    from_raw = rollup_sql(raw)
+    from_prepared = verify_against_pandas(prepare_data_for_pivot(raw.copy()))
+
+    assert sorted(from_prepared['Division']['Year'].unique()) == [2023, 2024, 2025]
+    for dim, frame in from_raw.items():
+        assert frame.equals(from_prepared[dim])
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_cli_builds_offline_from_local_detail(tmp_path):
+    results = main(['--real-pivots', '--source', str(RESPONSE_FILE), '--summary-engine', 'sqlite',
+                    '--output-dir', str(tmp_path)])
+
+    assert [name for name, _, _ in results] == ['real_pivots']
@@ -0,0 +1,56 @@
+"""Pruebas de las pivot tables nativas (caché + registros + definición)"""
+import json
+
+import openpyxl
+import pandas as pd
+import xlsxwriter
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot
+from reporting.pivot_cache import inject_pivot_parts, write_report_pivots
+from reporting.raw_export import write_raw_data
+
+
+def test_workbook_contains_readable_pivot_tables(tmp_path):
+    df = pd.DataFrame(json.loads(RESPONSE_FILE.read_bytes())['data'][:600])
+    df.loc[df.index[:5], 'Division'] = None
+    df = prepare_data_for_pivot(df)
+    filename = str(tmp_path / 'pivots.xlsx')
+
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    write_raw_data(workbook, df, sheet_name='Data')
+    pivots = write_report_pivots(workbook, df, {'Division': 'Division Pivot', 'LeadType': 'Lead Pivot'})
+    workbook.close()
+    inject_pivot_parts(filename, *pivots)
+
+    book = openpyxl.load_workbook(filename)
+    division = book['Division Pivot']._pivots[0]
+    assert division.cache.recordCount == len(df)
+    # Sin validar en Excel el caché se reconstruye al abrir
+    assert division.cache.refreshOnLoad
+    assert len(division.cache.records.r) == len(df)
+    assert [f.name for f in division.cache.cacheFields] == list(df.columns)
+
+    # Year 2023 + 'Residential Reroof' + (blank) + Grand Total
+    assert len(division.rowItems) == 4
+    cells = pd.read_excel(filename, sheet_name='Division Pivot', header=None)
+    grand_total = cells[cells[0] == 'Grand Total'].iloc[0]
+    n_stages = df['StageName'].nunique()
+    assert grand_total[1 + n_stages * 2] == len(df)
+    assert abs(grand_total[2 + n_stages * 2] - df['Amount'].sum()) < 0.01
+
+
+def test_raw_data_column_formats_reach_every_row(tmp_path):
+    df = prepare_data_for_pivot(pd.DataFrame(json.loads(RESPONSE_FILE.read_bytes())['data'][:50]))
+    filename = str(tmp_path / 'raw.xlsx')
+
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    write_raw_data(workbook, df, sheet_name='Data', column_width=15, column_formats={'Amount': '$#,##0'})
+    workbook.close()
+
+    sheet = openpyxl.load_workbook(filename)['Data']
+    amount = df.columns.get_loc('Amount') + 1
+    formats = {sheet.cell(row, amount).number_format for row in range(2, len(df) + 2)
+               if sheet.cell(row, amount).value is not None}
+    assert formats == {'$#,##0'}
+    assert int(sheet.column_dimensions['A'].width) == 15
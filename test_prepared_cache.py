@@ -0,0 +1,53 @@
+"""Pruebas de la caché del frame preparado (Arrow IPC con memory map, por hash del origen)"""
+import shutil
+
+import pandas as pd
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import main, prepare_data_for_pivot
+from reporting.local_sql import read_detail_source
+from reporting.prepared_cache import load_prepared, save_prepared, source_key
+from reporting.schema import with_stage_buckets
+
+
+def test_round_trip_keeps_prepared_frame_and_key_follows_content(tmp_path):
+    source = tmp_path / 'detail.json'
+    shutil.copy(RESPONSE_FILE, source)
+    key = source_key(str(source))
+    assert load_prepared(key, str(tmp_path / 'cache')) is None
+
+    df = prepare_data_for_pivot(read_detail_source(str(source)))
+    save_prepared(df, key, str(tmp_path / 'cache'))
+    loaded = load_prepared(key, str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(loaded, with_stage_buckets(df))
+    assert with_stage_buckets(loaded) is loaded
+
+    # Mismo contenido en otra ruta: misma clave; filtros o contenido distintos: otra
+    assert source_key(str(RESPONSE_FILE)) == key
+    assert source_key(str(source), years=[2023]) != key
+    source.write_bytes(source.read_bytes().replace(b'"Approved"', b'"Lost"', 1))
+    assert source_key(str(source)) != key
+
+
+def test_second_run_reads_cached_frame_and_writes_same_workbook(tmp_path, monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr('generate_real_pivot.read_detail_source',
+                        lambda path: calls.append(path) or read_detail_source(path))
+    args = ['--real-pivots', '--jobs', '1', '--source', str(RESPONSE_FILE),
+            '--prepared-cache', str(tmp_path / 'cache')]
+
+    ((_, first, _),) = main(args + ['--output-dir', str(tmp_path / 'first')])
+    ((_, second, _),) = main(args + ['--output-dir', str(tmp_path / 'second')])
+
+    assert len(calls) == 1
+    assert '[CACHE] HIT' in capsys.readouterr().out
+    for sheet in ('Division_Summary', 'Lead_Summary', 'Raw_Data'):
+        pd.testing.assert_frame_equal(pd.read_excel(second, sheet_name=sheet), pd.read_excel(first, sheet_name=sheet))
+
+
+def test_prune_keeps_most_recent_entries(tmp_path):
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE))).head(10)
+    for i in range(3):
+        save_prepared(df, f'key{i}', str(tmp_path), keep=2)
+    assert not (tmp_path / 'key0.arrow').exists()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['key1.arrow', 'key2.arrow']
@@ -0,0 +1,100 @@
+"""Pruebas del servicio de reportes bajo demanda y de su caché LRU con single-flight"""
+import asyncio
+import io
+import json
+
+import pandas as pd
+
+from conftest import RESPONSE_FILE
+from report_service import ReportService, refresh_api, serve
+from reporting.aggregate_state import load_state
+from reporting.report_cache import ReportCache, report_key
+from reporting.snapshot import load_snapshot, snapshot_version
+
+
+def test_cache_single_flight_lru_eviction_and_failures(tmp_path):
+    builds = []
+
+    async def build(path, size=100):
+        builds.append(path)
+        await asyncio.sleep(0.05)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    async def scenario():
+        cache = ReportCache(str(tmp_path), max_bytes=250)
+        first = await asyncio.gather(*(cache.get('a', build) for _ in range(5)))
+        assert len(builds) == 1 and sorted(status for _, status in first) == ['JOINED'] * 4 + ['MISS']
+
+        await cache.get('b', build)
+        assert await cache.get('a', build) == (cache.path('a'), 'HIT')
+        # 'b' es el menos usado: sale al agregar 'c'
+        await cache.get('c', build)
+        assert 'a' in cache and 'b' not in cache and cache.size == 200
+
+        async def broken(path):
+            await asyncio.sleep(0.01)
+            raise RuntimeError('falla')
+        results = await asyncio.gather(cache.get('d', broken), cache.get('d', broken), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results) and 'd' not in cache
+        return cache.stats
+
+    stats = asyncio.run(scenario())
+    assert stats == {'hits': 1, 'misses': 4, 'joined': 5, 'evicted': 1}
+    # Un proceso nuevo adopta los archivos que quedaron
+    assert len(ReportCache(str(tmp_path))) == 2
+    assert report_key({'years': [2024, 2023]}, 'v1') == report_key({'years': [2023, 2024], 'divisions': []}, 'v1')
+
+
+async def _get(port, target):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    head, _, body = (await reader.read()).partition(b'\r\n\r\n')
+    writer.close()
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def test_service_builds_identical_concurrent_requests_once(tmp_path):
+    async def scenario():
+        service = ReportService(str(RESPONSE_FILE), cache=ReportCache(str(tmp_path / 'reports')),
+                                prepared_dir=str(tmp_path / 'prepared'))
+        server = await serve(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            target = '/report.xlsx?leadType=CompanyLead'
+            concurrent = await asyncio.gather(*(_get(port, target) for _ in range(3)))
+            again = await _get(port, target)
+            other = await _get(port, '/report.xlsx?leadType=CompanyLead&year=1999')
+            invalid = await _get(port, '/report.xlsx?year=abc')
+            return concurrent, again, other, invalid, service.health()
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    concurrent, again, other, invalid, health = asyncio.run(scenario())
+    assert [status for status, _, _ in concurrent] == [200] * 3
+    assert sorted(headers['X-Cache'] for _, headers, _ in concurrent) == ['JOINED', 'JOINED', 'MISS']
+    assert again[0] == 200 and again[1]['X-Cache'] == 'HIT' and again[2] == concurrent[0][2]
+    assert (other[0], invalid[0]) == (404, 400)
+    assert health['builds'] == 2 and health['rows'] == 3695 and health['cache']['entries'] == 1
+
+    summary = pd.read_excel(io.BytesIO(again[2]), sheet_name='Lead_Summary')
+    assert set(summary['LeadType']) == {'CompanyLead', 'TOTAL'}
+
+
+def test_refresh_api_keeps_aggregate_state_in_step_with_snapshot(stub_api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = json.loads(RESPONSE_FILE.read_bytes())['data']
+    stub_api.detail = rows
+    first, _ = refresh_api(stub_api.base_url, str(tmp_path / 'prepared'))
+    assert load_state()[1]['mode'] == 'full'
+
+    stub_api.detail = rows + [dict(rows[0], StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')]
+    second, count = refresh_api(stub_api.base_url, str(tmp_path / 'prepared'))
+    _, meta = load_state()
+    assert second != first and count == len(rows)
+    assert meta['mode'] == 'delta' and meta['snapshot'] == snapshot_version(load_snapshot()[1])
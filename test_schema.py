@@ -0,0 +1,41 @@
+"""Pruebas del esquema compacto del detalle"""
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot
+from reporting.rollup import build_base_cube, rollup
+from reporting.schema import with_stage_buckets
+from reporting.years import resolve_year
+
+
+def load_detail():
+    return pd.DataFrame(json.loads(RESPONSE_FILE.read_bytes())['data'])
+
+
+def test_compact_frame_matches_legacy_summaries():
+    legacy = load_detail()
+    legacy['Amount'] = pd.to_numeric(legacy['Amount'], errors='coerce').fillna(0)
+    for col in ('Created_Date', 'LastStageChangeDate'):
+        legacy[col] = pd.to_datetime(legacy[col], errors='coerce', utc=True).dt.tz_localize(None)
+    legacy['Year'] = resolve_year(legacy)
+
+    compact = prepare_data_for_pivot(load_detail())
+
+    assert isinstance(compact['Division'].dtype, pd.CategoricalDtype)
+    assert compact['Year'].dtype == 'int16'
+    assert compact['IsOpen'].dtype == 'int8'
+
+    legacy_cube, compact_cube = build_base_cube(legacy), build_base_cube(compact)
+    for dim in ('Division', 'LeadType'):
+        expected = rollup(legacy_cube, dim).reset_index(drop=True)
+        result = rollup(compact_cube, dim).reset_index(drop=True)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    buckets = with_stage_buckets(compact)
+    approved = legacy['Amount'].where(legacy['StageName'] == 'Approved', 0)
+    assert buckets['ApprovedAmount'].sum() == approved.sum()
+    total = buckets[['ApprovedAmount', 'LostAmount', 'OpenAmount']].sum().sum()
+    assert total == pytest.approx(legacy['Amount'].sum())
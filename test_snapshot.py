@@ -0,0 +1,73 @@
+"""Pruebas del snapshot local con refresco incremental"""
+import json
+
+from conftest import RESPONSE_FILE
+from reporting.client import create_session, detail_partitions
+from reporting.snapshot import fetch_detail_cached, load_snapshot
+
+
+def detail_requests(server):
+    return [query for path, query in server.requests if path == '/api/opportunity-detail']
+
+
+def test_second_run_only_requests_changes(stub_api, tmp_path):
+    path = str(tmp_path / 'snapshot.parquet')
+    rows = json.loads(RESPONSE_FILE.read_bytes())['data']
+    stub_api.detail = rows
+
+    with create_session() as session:
+        first = fetch_detail_cached(session, stub_api.base_url, path=path)
+
+        # Una oportunidad cambia de stage y aparece una nueva
+        changed = dict(rows[0], StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')
+        new = dict(rows[1], Id='NEW0000000000001', Created_Date='2099-01-02T00:00:00.000Z')
+        stub_api.detail = [changed] + rows[1:] + [new]
+        second = fetch_detail_cached(session, stub_api.base_url, path=path)
+
+    assert len(first) == 3695
+    assert len(second) == 3696
+    assert second.set_index('Id').loc[rows[0]['Id'], 'StageName'] == 'Approved'
+
+    queries = detail_requests(stub_api)
+    assert 'changedSince' not in queries[0]
+    assert queries[1]['changedSince'] == [max(r['LastStageChangeDate'] or '' for r in rows)]
+
+    _, meta = load_snapshot(path)
+    assert meta['watermark'] == '2099-01-02T00:00:00.000Z'
+    assert meta['rows'] == 3696
+
+
+def test_force_refresh_downloads_everything(stub_api, tmp_path):
+    path = str(tmp_path / 'snapshot.parquet')
+    with create_session() as session:
+        fetch_detail_cached(session, stub_api.base_url, path=path)
+        detail = fetch_detail_cached(session, stub_api.base_url, path=path, force_refresh=True)
+
+    assert len(detail) == 3695
+    assert all('changedSince' not in query for query in detail_requests(stub_api))
+
+
+def test_filtered_snapshot_drops_rows_that_leave_the_filter(stub_api, tmp_path):
+    path = str(tmp_path / 'snapshot.parquet')
+    rows = [dict(row, YearValue=2024) for row in json.loads(RESPONSE_FILE.read_bytes())['data'][:100]]
+    stub_api.detail = rows
+    partitions = detail_partitions(years=[2024])
+    changes = {}
+
+    with create_session() as session:
+        fetch_detail_cached(session, stub_api.base_url, partitions, path=path)
+        # Creada en 2024 y aprobada en 2025: el API la pasa a YearValue 2025
+        approved = dict(rows[0], StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z',
+                        YearValue=2025)
+        updated = dict(rows[1], StageName='Approved', LastStageChangeDate='2099-01-01T00:00:00.000Z')
+        stub_api.detail = [approved, updated] + rows[2:]
+        incremental = fetch_detail_cached(session, stub_api.base_url, partitions, path=path,
+                                          on_change=lambda previous, delta: changes.update(previous=previous,
+                                                                                           delta=delta))
+        full = fetch_detail_cached(session, stub_api.base_url, partitions, path=str(tmp_path / 'full.parquet'))
+
+    assert detail_requests(stub_api)[1] == {'changedSince': [max(r['LastStageChangeDate'] or '' for r in rows)]}
+    assert sorted(incremental['Id']) == sorted(full['Id']) and rows[0]['Id'] not in set(incremental['Id'])
+    assert incremental.set_index('Id').loc[rows[1]['Id'], 'StageName'] == 'Approved'
+    assert sorted(changes['previous']['Id']) == sorted([rows[0]['Id'], rows[1]['Id']])
+    assert list(changes['delta']['Id']) == [rows[1]['Id']]
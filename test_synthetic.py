@@ -0,0 +1,27 @@
+"""Pruebas del generador de detalle sintético"""
+import json
+
+import pandas as pd
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot
+from reporting.synthetic import generate_detail, load_profile
+from reporting.years import resolve_year
+
+
+def test_synthetic_detail_mirrors_sample_distributions():
+    sample = pd.DataFrame(json.loads(RESPONSE_FILE.read_bytes())['data'])
+    df = generate_detail(50_000, seed=3, profile=load_profile(str(RESPONSE_FILE)))
+
+    assert list(df.columns) == list(sample.columns)
+    assert df['Id'].is_unique
+    for col in ('StageName', 'LeadType', 'RecordTypeId'):
+        expected = sample[col].value_counts(normalize=True)
+        observed = df[col].value_counts(normalize=True).reindex(expected.index, fill_value=0)
+        assert (observed - expected).abs().max() < 0.02
+    assert abs(df['Amount'].isna().mean() - sample['Amount'].isna().mean()) < 0.02
+
+    # YearValue sigue la misma regla que el API y que resolve_year
+    prepared = prepare_data_for_pivot(df.copy())
+    assert (resolve_year(prepared, fallback=None) == df['YearValue']).all()
+    assert sorted(df['YearValue'].unique()) == [2021, 2022, 2023, 2024, 2025]
@@ -0,0 +1,100 @@
+"""Pruebas de los workbooks generados desde plantilla (solo se reescriben las hojas de datos)"""
+import os
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import main, prepare_data_for_pivot, write_real_pivots_workbook
+from reporting.local_sql import read_detail_source
+from reporting.template import write_from_template
+
+
+def test_template_workbook_matches_regular_build_and_keeps_template_formatting(tmp_path):
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE)))
+    template = tmp_path / 'template.xlsx'
+    regular = write_real_pivots_workbook(df, str(tmp_path / 'regular.xlsx'))
+    first = write_real_pivots_workbook(df, str(tmp_path / 'first.xlsx'), template=str(template))
+    built_at = os.path.getmtime(template)
+    second = write_real_pivots_workbook(df.iloc[:100], str(tmp_path / 'second.xlsx'), template=str(template))
+    assert os.path.getmtime(template) == built_at
+
+    for sheet in ('Raw_Data', 'Division_Summary', 'Lead_Summary'):
+        pd.testing.assert_frame_equal(pd.read_excel(first, sheet_name=sheet), pd.read_excel(regular, sheet_name=sheet))
+
+    workbook = openpyxl.load_workbook(first)
+    summary = workbook['Division_Summary']
+    last_row = summary.max_row
+    assert summary.cell(row=last_row, column=7).number_format == '$#,##0'
+    assert summary.cell(row=last_row, column=11).number_format == '0.00%'
+    assert [str(rule.sqref) for rule in summary.conditional_formatting] == [f'A2:M{last_row}']
+    assert workbook.defined_names['DivisionSummary'].attr_text == f"'Division_Summary'!$A$1:$M${last_row}"
+    raw = workbook['Raw_Data']
+    assert raw.auto_filter.ref == f'A1:Q{len(df) + 1}' and raw['G2'].number_format == 'yyyy-mm-dd hh:mm:ss'
+    assert workbook['Key_Metrics']['B4'].value.startswith('=SUMIFS(Division_Summary!')
+    assert openpyxl.load_workbook(second)['Raw_Data'].max_row == 101
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_template_requires_its_sheets_and_columns(tmp_path):
+    ((_, filename, _),) = main(['--real-pivots', '--template', str(tmp_path / 'template.xlsx'), '--jobs', '1',
+                                '--source', str(RESPONSE_FILE), '--output-dir', str(tmp_path)])
+    assert pd.read_excel(filename, sheet_name='Lead_Summary')['LeadType'].tolist()[-1] == 'TOTAL'
+
+    frame = pd.DataFrame({'Year': [2024]})
+    with pytest.raises(ValueError, match='Total_Opp'):
+        write_from_template(str(tmp_path / 'template.xlsx'), str(tmp_path / 'out.xlsx'), {'Lead_Summary': frame})
+    with pytest.raises(ValueError, match='Trend_Monthly'):
+        write_from_template(str(tmp_path / 'template.xlsx'), str(tmp_path / 'out.xlsx'), {'Trend_Monthly': frame})
+
+
+@pytest.mark.usefixtures('prepared_cache_dir')
+def test_parallel_parts_and_store_only_write_the_same_sheets(tmp_path, monkeypatch, capsys):
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE)))
+    template = str(tmp_path / 'template.xlsx')
+    regular = write_real_pivots_workbook(df, str(tmp_path / 'regular.xlsx'), template=template)
+    # Raw_Data (3695 filas) se reparte en 4 partes
+    monkeypatch.setattr('reporting.template.PART_ROWS', 1000)
+    stored = write_real_pivots_workbook(df, str(tmp_path / 'stored.xlsx'), template=template, sheet_jobs=2,
+                                        compresslevel=0)
+
+    with zipfile.ZipFile(regular) as first, zipfile.ZipFile(stored) as second:
+        assert first.namelist() == second.namelist()
+        assert all(first.read(name) == second.read(name) for name in first.namelist())
+        assert {info.compress_type for info in second.infolist()} == {zipfile.ZIP_STORED}
+        assert zipfile.ZIP_DEFLATED in {info.compress_type for info in first.infolist()}
+    out = capsys.readouterr().out
+    assert '[SHEET] Raw_Data: 3695 filas' in out and 'en 4 partes' in out
+    assert '[SHEET] Key_Metrics: copiada de la plantilla' in out
+
+    with pytest.raises(SystemExit):
+        main(['--real-pivots', '--compress-level', '0', '--source', str(RESPONSE_FILE)])
+    for mode in (['--batch', 'division'], ['--chunked'], ['--fetch-only']):
+        with pytest.raises(SystemExit):
+            main([*mode, '--template', '--sheet-jobs', '2', '--source', str(RESPONSE_FILE)])
+
+
+def test_default_template_is_rebuilt_when_columns_or_version_change(tmp_path, monkeypatch, capsys):
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE))).iloc[:200]
+    template = str(tmp_path / 'template.xlsx')
+    write_real_pivots_workbook(df, str(tmp_path / 'first.xlsx'), template=template)
+    assert 'Plantilla creada' in capsys.readouterr().out
+
+    # Una columna nueva del detalle llega a Raw_Data en lugar de descartarse
+    extended = df.assign(Region='South')
+    added = write_real_pivots_workbook(extended, str(tmp_path / 'added.xlsx'), template=template)
+    assert 'Plantilla reconstruida' in capsys.readouterr().out
+    assert pd.read_excel(added, sheet_name='Raw_Data')['Region'].eq('South').all()
+
+    monkeypatch.setattr('reporting.template.TEMPLATE_VERSION', 2)
+    write_real_pivots_workbook(extended, str(tmp_path / 'version.xlsx'), template=template)
+    assert 'Plantilla reconstruida' in capsys.readouterr().out
+    write_real_pivots_workbook(extended, str(tmp_path / 'same.xlsx'), template=template)
+    assert 'Plantilla' not in capsys.readouterr().out
+
+    # Una plantilla propia (sin metadatos) no se reemplaza: falla en lugar de perder la columna
+    os.remove(str(tmp_path / 'template.json'))
+    with pytest.raises(ValueError, match='Extra'):
+        write_real_pivots_workbook(extended.assign(Extra=1), str(tmp_path / 'custom.xlsx'), template=template)
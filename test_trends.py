@@ -0,0 +1,63 @@
+"""Pruebas del motor de tendencias (mensual / trimestral / anual con YoY)"""
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from conftest import RESPONSE_FILE
+from generate_real_pivot import prepare_data_for_pivot, write_real_pivots_workbook
+from reporting.local_sql import read_detail_source
+from reporting.rollup import rollup_all
+from reporting.synthetic import generate_detail
+from reporting.trends import bucket_dates, trend_tables
+
+
+def test_trend_series_match_summaries_and_manual_yoy():
+    df = prepare_data_for_pivot(generate_detail(20_000, seed=5, divisions={'North': 3, 'South': 1}))
+    trends = trend_tables(df)
+
+    yearly = trends['Y']
+    summary = rollup_all(df)['Division'].reset_index(drop=True)
+    for dimension, label in (('TOTAL', 'TOTAL'), ('Division', 'North')):
+        rows = yearly[yearly['Value'] == label].reset_index(drop=True)
+        expected = summary[summary['Division'] == label].reset_index(drop=True)
+        assert rows['Dimension'].eq(dimension).all()
+        pd.testing.assert_series_equal(rows['Total_Opp'], expected['Total_Opp'])
+        pd.testing.assert_series_equal(rows['Approved_Revenue'], expected['Approved_Revenue'])
+
+    # Todas las filas sintéticas tienen fecha: cada frecuencia reparte el mismo total
+    for freq in ('M', 'Q'):
+        totals = trends[freq][trends[freq]['Dimension'] == 'TOTAL']
+        assert totals['Total_Opp'].sum() == len(df)
+        assert np.isclose(totals['Approved_Revenue'].sum(), df['Amount'][df['IsApproved'] == 1].sum())
+
+    months = bucket_dates(df).dt.to_period('M')
+    counts = months[(df['Division'] == 'South').to_numpy()].value_counts()
+    monthly = trends['M'].set_index(['Value', 'Period'])
+    march = monthly.loc[('South', pd.Timestamp('2024-03-01'))]
+    previous = counts[pd.Period('2023-03', 'M')]
+    assert march['Total_Opp'] == counts[pd.Period('2024-03', 'M')]
+    assert march['Total_Opp_YoY'] == round((march['Total_Opp'] - previous) / previous * 100, 2)
+
+
+def test_periods_without_opportunities_are_zero_filled():
+    df = prepare_data_for_pivot(generate_detail(2000, seed=1, divisions={'North': 1, 'South': 1}))
+    dates = bucket_dates(df)
+    df = df[~((df['Division'] == 'South') & (dates.dt.year == 2023)).to_numpy()].reset_index(drop=True)
+
+    quarterly = trend_tables(df, ['Q'])['Q']
+    south = quarterly[quarterly['Value'] == 'South'].set_index('Period')
+    assert len(south) == len(quarterly[quarterly['Dimension'] == 'TOTAL'])
+    assert (south.loc['2023-01-01':'2023-10-01', 'Total_Opp'] == 0).all()
+    # Sin base el año anterior el YoY queda vacío en lugar de infinito
+    assert pd.isna(south.loc['2024-01-01', 'Total_Opp_YoY'])
+
+
+def test_workbook_has_trend_sheets_with_numeric_kpis_and_charts(tmp_path):
+    df = prepare_data_for_pivot(read_detail_source(str(RESPONSE_FILE)))
+    workbook = openpyxl.load_workbook(write_real_pivots_workbook(df, str(tmp_path / 'report.xlsx')))
+
+    assert {'Trend_Monthly', 'Trend_Quarterly', 'Trend_Yearly', 'Key_Metrics'} <= set(workbook.sheetnames)
+    metrics = workbook['Key_Metrics']
+    assert metrics['B5'].value == len(df)
+    assert metrics['B7'].number_format == '0.00%' and 0 < metrics['B7'].value < 1
+    assert len(metrics._charts) == 2 and len(workbook['Trend_Monthly']._charts) == 2